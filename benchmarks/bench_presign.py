@@ -0,0 +1,50 @@
+"""Presign benchmark.
+
+Compares presigning the get_object urls of many keys one by one, with the boto3 client and with the router, against
+the router's bulk generate_presigned_urls, for SigV4 (s3v4) and SigV2 (s3) clients.
+
+    python benchmarks/bench_presign.py
+
+The benchmark imports the boto_s3_router of the checkout it's in, so it runs without installing the package.
+"""
+import os
+import sys
+import timeit
+
+import boto3
+from botocore.config import Config
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import boto_s3_router  # noqa: E402
+
+KEYS = 10000
+PROFILES = {"minio": {"source_bucket_pattern": "bucket-a", "mapped_bucket_name": "minio-bucket"}}
+
+
+def create_s3_client(signature_version, **kwargs):
+    return boto3.client("s3", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test",
+                        config=Config(signature_version=signature_version), **kwargs)
+
+
+def measure(func):
+    """Return the mean duration, in µs, of presigning a key."""
+    return timeit.timeit(func, number=1) / KEYS * 1e6
+
+
+def main():
+    params = [{"Bucket": "bucket-a" if i % 2 else "bucket-b", "Key": "dataset/part-%06d.parquet" % i}
+              for i in range(KEYS)]
+    print("%-12s %16s %16s %16s" % ("", "boto3 (µs/key)", "router (µs/key)", "bulk (µs/key)"))
+    for signature_version in ("s3v4", "s3"):
+        s3 = create_s3_client(signature_version)
+        minio = create_s3_client(signature_version, endpoint_url="http://localhost:9000")
+        router = boto_s3_router.client({"minio": minio, "default": s3}, PROFILES)
+
+        boto3_time = measure(lambda: [s3.generate_presigned_url("get_object", Params=p) for p in params])
+        router_time = measure(lambda: [router.generate_presigned_url("get_object", Params=p) for p in params])
+        bulk_time = measure(lambda: router.generate_presigned_urls("get_object", params))
+        print("%-12s %16.1f %16.1f %16.1f" % (signature_version, boto3_time, router_time, bulk_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""Router overhead benchmark.
+
+Measures what routing a call costs, against calling the client directly with the mapped arguments the router sends.
+Both call an in-process fake S3 endpoint (a before-send handler returning canned responses), so requests are still
+serialized, signed and parsed by botocore, but no network is involved.
+
+Each scenario runs an operation through a path of the router (head_object through the generated api method,
+list_objects_v2, copy_object, delete_objects of 100 keys, and a list_objects_v2 paginator), for a growing number of
+profiles and key lengths. The profiles match wildcard bucket patterns, and the routers are built without a route
+cache, so every call is routed and the cost of routing grows with the profiles like it does for a workload whose
+decisions the cache doesn't hold. It records the throughput, p50 and p99 latencies, and the peak memory allocated per
+call, of both the router and the client.
+
+The overhead of the router, the p50 of the router latency minus the client latency of the same iteration, in µs, is
+compared with the stored baselines, as are the router allocations. A ratio of the latencies would hide a regression
+of the routing behind the cost of serializing, signing and parsing the request, so the overhead is absolute: scenarios
+whose overhead grew by more than --tolerance plus --slack µs, or whose allocations grew by more than --tolerance, are
+flagged, and make the benchmark exit with status 1.
+
+The benchmark imports the boto_s3_router of the checkout it's in, so it runs without installing the package.
+
+    python benchmarks/bench_router.py                    # compare with benchmarks/baselines/bench_router.json
+    python benchmarks/bench_router.py --save-baseline    # store the results as the new baselines
+    python benchmarks/bench_router.py --quick            # fewer calls and scenarios
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import boto3
+from botocore.awsrequest import AWSResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import boto_s3_router  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "bench_router.json")
+PROFILE_COUNTS = (1, 100, 1000)
+KEY_LENGTHS = (16, 256, 1024)
+KEY_POOL = 1024
+DELETE_OBJECTS_KEYS = 100
+NUMBER = 2000
+WARMUP = 200
+ALLOCATION_SAMPLES = 100
+DEFAULT_TOLERANCE = 0.25
+# the overhead, in µs, a scenario may gain on top of the tolerance, as the overhead is the difference of two noisy
+# latencies of about a millisecond
+DEFAULT_SLACK = 15.0
+# the index of the next key, shared by all the calls so they keep cycling through the key pool
+_next_key = itertools.count()
+
+_LIST_BODY = (b'<?xml version="1.0" encoding="UTF-8"?>'
+              b'<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/"><Name>b</Name><KeyCount>1</KeyCount>'
+              b'<MaxKeys>1000</MaxKeys><IsTruncated>false</IsTruncated>'
+              b'<Contents><Key>k</Key><Size>1</Size></Contents></ListBucketResult>')
+_COPY_BODY = (b'<?xml version="1.0" encoding="UTF-8"?><CopyObjectResult><ETag>"e"</ETag>'
+              b'<LastModified>2024-01-01T00:00:00.000Z</LastModified></CopyObjectResult>')
+_DELETE_BODY = b'<?xml version="1.0" encoding="UTF-8"?><DeleteResult></DeleteResult>'
+RESPONSES = {
+    "HeadObject": ({"Content-Length": "1", "ETag": '"e"'}, b""),
+    "ListObjectsV2": ({}, _LIST_BODY),
+    "CopyObject": ({}, _COPY_BODY),
+    "DeleteObjects": ({}, _DELETE_BODY),
+}
+
+
+class _RawResponse(object):
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+def create_fake_s3_client():
+    """Return an s3 client whose requests are answered in-process with RESPONSES."""
+    client = boto3.client("s3", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test")
+
+    def _responder(headers, body):
+        headers = dict({"Content-Length": str(len(body))}, **headers)
+        return lambda request, **kwargs: AWSResponse(request.url, 200, headers, _RawResponse(body))
+
+    for operation_name, (headers, body) in RESPONSES.items():
+        client.meta.events.register("before-send.s3." + operation_name, _responder(headers, body))
+    return client
+
+
+def make_profiles(count):
+    """Profiles with a wildcard bucket and key pattern each; the benchmark routes to the last one."""
+    return {"profile%d" % i: {"source_bucket_pattern": "bucket-%d-*" % i, "source_key_pattern": "data/*",
+                              "mapped_bucket_name": "mapped-%d" % i, "mapped_prefix": "main/"}
+            for i in range(count)}
+
+
+def make_scenarios(router, client, bucket, mapped_bucket, keys):
+    """Return the (name, router call, client call) of each operation, given the index of the key to use."""
+    def delete(i):
+        return {"Objects": [{"Key": keys[(i + j) % len(keys)]} for j in range(DELETE_OBJECTS_KEYS)]}
+
+    def mapped_delete(i):
+        return {"Objects": [{"Key": "main/" + keys[(i + j) % len(keys)]} for j in range(DELETE_OBJECTS_KEYS)]}
+
+    router_paginator = router.get_paginator(operation_name="list_objects_v2")
+    client_paginator = client.get_paginator("list_objects_v2")
+    return [
+        ("head_object",
+         lambda i: router.head_object(Bucket=bucket, Key=keys[i]),
+         lambda i: client.head_object(Bucket=mapped_bucket, Key="main/" + keys[i])),
+        ("list_objects_v2",
+         lambda i: router.list_objects_v2(Bucket=bucket, Prefix=keys[i]),
+         lambda i: client.list_objects_v2(Bucket=mapped_bucket, Prefix="main/" + keys[i])),
+        ("copy_object",
+         lambda i: router.copy_object(Bucket=bucket, Key=keys[i], CopySource={"Bucket": bucket, "Key": keys[i - 1]}),
+         lambda i: client.copy_object(Bucket=mapped_bucket, Key="main/" + keys[i],
+                                      CopySource={"Bucket": mapped_bucket, "Key": "main/" + keys[i - 1]})),
+        ("delete_objects",
+         lambda i: router.delete_objects(Bucket=bucket, Delete=delete(i)),
+         lambda i: client.delete_objects(Bucket=mapped_bucket, Delete=mapped_delete(i))),
+        ("paginator",
+         lambda i: list(router_paginator.paginate(Bucket=bucket, Prefix=keys[i])),
+         lambda i: list(client_paginator.paginate(Bucket=mapped_bucket, Prefix="main/" + keys[i]))),
+    ]
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def _allocated(call):
+    """Return the mean peak memory allocated by a call, in KiB."""
+    allocated = 0
+    tracemalloc.start()
+    for _ in range(ALLOCATION_SAMPLES):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        call(next(_next_key) % KEY_POOL)
+        allocated += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return allocated / ALLOCATION_SAMPLES / 1024.0
+
+
+def measure(calls, number):
+    """Return the throughput (calls/s), p50 and p99 latencies (µs) and allocation per call (KiB) of each of calls,
+    and the overhead (µs) of each call over the first: the p50 of its latency minus the first call's latency of the
+    same iteration.
+
+    The calls are interleaved, so that the drift of the machine's speed affects all of them alike, and their order
+    is reversed every other iteration, as a call runs faster after another one warmed the same code and data.
+    """
+    for _ in range(WARMUP):
+        index = next(_next_key) % KEY_POOL
+        for call in calls:
+            call(index)
+    latencies = [[] for _ in calls]
+    for iteration in range(number):
+        index = next(_next_key) % KEY_POOL
+        order = list(zip(calls, latencies))
+        for call, call_latencies in (order if iteration % 2 else reversed(order)):
+            start = time.perf_counter()
+            call(index)
+            call_latencies.append(time.perf_counter() - start)
+    results = []
+    for call, call_latencies in zip(calls, latencies):
+        overhead = sorted(latency - first for latency, first in zip(call_latencies, latencies[0]))
+        call_latencies = sorted(call_latencies)
+        results.append({"throughput": number / sum(call_latencies), "p50": percentile(call_latencies, 50) * 1e6,
+                        "p99": percentile(call_latencies, 99) * 1e6, "overhead": percentile(overhead, 50) * 1e6,
+                        "allocated": _allocated(call)})
+    return results
+
+
+def run(profile_counts, key_lengths, number):
+    client = create_fake_s3_client()
+    results = {}
+    print("%-16s %8s %6s %12s %12s %10s %10s %10s %13s %10s" % (
+        "operation", "profiles", "key", "client (/s)", "router (/s)", "client p50", "router p50", "router p99",
+        "overhead (us)", "alloc KiB"))
+    for count in profile_counts:
+        profiles = make_profiles(count)
+        mapping = dict.fromkeys(profiles, client)
+        mapping["default"] = client
+        router = boto_s3_router.client(mapping, profiles, route_cache_size=0)
+        bucket, mapped_bucket = "bucket-%d-b" % (count - 1), "mapped-%d" % (count - 1)
+        for key_length in key_lengths:
+            keys = [("data/%08d/" % i).ljust(key_length, "k") for i in range(KEY_POOL)]
+            for name, router_call, client_call in make_scenarios(router, client, bucket, mapped_bucket, keys):
+                client_result, router_result = measure((client_call, router_call), number)
+                del client_result["overhead"]
+                results["%s/profiles=%d/key=%d" % (name, count, key_length)] = {
+                    "client": client_result, "router": router_result}
+                print("%-16s %8d %6d %12.0f %12.0f %10.1f %10.1f %10.1f %13.1f %10.2f" % (
+                    name, count, key_length, client_result["throughput"], router_result["throughput"],
+                    client_result["p50"], router_result["p50"], router_result["p99"], router_result["overhead"],
+                    router_result["allocated"]))
+    return results
+
+
+def compare(results, baselines, tolerance, slack):
+    """Return the descriptions of the scenarios that regressed against their baselines."""
+    regressions = []
+    for scenario, result in sorted(results.items()):
+        baseline = baselines.get(scenario)
+        if baseline is None or "overhead" not in baseline["router"]:
+            continue
+        overhead, baseline_overhead = result["router"]["overhead"], baseline["router"]["overhead"]
+        if overhead > max(baseline_overhead, 0) * (1 + tolerance) + slack:
+            regressions.append("%s: overhead %.1f us per call, baseline %.1f us" % (scenario, overhead,
+                                                                                     baseline_overhead))
+        allocated, baseline_allocated = result["router"]["allocated"], baseline["router"]["allocated"]
+        if allocated > baseline_allocated * (1 + tolerance) + 1:
+            regressions.append("%s: allocated %.2f KiB per call, baseline %.2f KiB" % (scenario, allocated,
+                                                                                        baseline_allocated))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baselines")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="the baselines file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="the relative regression of the overhead or allocations that is flagged")
+    parser.add_argument("--slack", type=float, default=DEFAULT_SLACK,
+                        help="the overhead, in us, a scenario may gain on top of the tolerance")
+    parser.add_argument("--quick", action="store_true", help="fewer calls and scenarios")
+    args = parser.parse_args()
+
+    if args.quick:
+        results = run(PROFILE_COUNTS[::2], KEY_LENGTHS[:1], NUMBER // 4)
+    else:
+        results = run(PROFILE_COUNTS, KEY_LENGTHS, NUMBER)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("\nbaselines saved to %s" % args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        print("\nno baselines at %s; run with --save-baseline to store them" % args.baseline)
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance, args.slack)
+    if not regressions:
+        print("\nno regressions against %s" % args.baseline)
+        return 0
+    print("\nREGRESSIONS against %s:" % args.baseline)
+    for regression in regressions:
+        print("  " + regression)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
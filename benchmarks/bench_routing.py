@@ -0,0 +1,63 @@
+"""Routing microbenchmark.
+
+Compares the compiled routing index, without and with the routing cache, against a linear fnmatch scan over the
+profiles, for a growing number of profiles (mostly literal buckets plus a few wildcards). Each lookup is for a new key,
+so the cache only helps when keys sharing a prefix share its decisions.
+
+    python benchmarks/bench_routing.py
+
+The benchmark imports the boto_s3_router of the checkout it's in, so it runs without installing the package.
+"""
+import fnmatch
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from boto_s3_router.botos3router import DEFAULT_ROUTE_CACHE_SIZE  # noqa: E402
+from boto_s3_router.routing import RoutingIndex  # noqa: E402
+
+PROFILE_COUNTS = (10, 100, 1000)
+WILDCARDS = 5
+NUMBER = 20000
+
+
+def linear_lookup(config, bucket, key):
+    for profile in config:
+        mapping = config[profile]
+        if fnmatch.fnmatch(bucket, mapping["source_bucket_pattern"]):
+            if "source_key_pattern" in mapping and not fnmatch.fnmatch(key, mapping["source_key_pattern"]):
+                continue
+            return profile
+    return None
+
+
+def make_config(count):
+    config = {}
+    for i in range(count - WILDCARDS):
+        config["profile%d" % i] = {"source_bucket_pattern": "bucket-%d" % i, "source_key_pattern": "data/%d/*" % i}
+    for i in range(WILDCARDS):
+        config["wildcard%d" % i] = {"source_bucket_pattern": "logs-%d-*" % i}
+    return config
+
+
+def main():
+    print("%8s %14s %14s %14s %8s" % ("profiles", "linear (us)", "index (us)", "cached (us)", "speedup"))
+    for count in PROFILE_COUNTS:
+        config = make_config(count)
+        index = RoutingIndex(config)
+        cached_index = RoutingIndex(config, cache_size=DEFAULT_ROUTE_CACHE_SIZE)
+        # A bucket near the end of the configuration, and one that only matches the default client, with unique keys.
+        bucket = "bucket-%d" % (count - WILDCARDS - 1)
+        cases = [(bucket, "data/%d/obj-%d" % (count - WILDCARDS - 1, i)) for i in range(NUMBER)]
+        cases += [("unrouted", "data/obj-%d" % i) for i in range(NUMBER)]
+        linear = timeit.timeit(lambda: [linear_lookup(config, b, k) for b, k in cases], number=1)
+        indexed = timeit.timeit(lambda: [index.lookup(b, k, True) for b, k in cases], number=1)
+        cached = timeit.timeit(lambda: [cached_index.lookup(b, k, True) for b, k in cases], number=1)
+        per_call = 1e6 / len(cases)
+        print("%8d %14.2f %14.2f %14.2f %7.1fx" % (count, linear * per_call, indexed * per_call, cached * per_call,
+                                                   linear / cached))
+
+
+if __name__ == "__main__":
+    main()
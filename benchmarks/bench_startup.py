@@ -0,0 +1,59 @@
+"""Startup benchmark.
+
+Compares the time and memory of building a router against creating the boto3 s3 client it wraps. The first build
+in a process creates the router class; later builds reuse it.
+
+    python benchmarks/bench_startup.py
+
+The benchmark imports the boto_s3_router of the checkout it's in, so it runs without installing the package.
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+
+import boto3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import boto_s3_router  # noqa: E402
+
+NUMBER = 50
+PROFILES = {"minio": {"source_bucket_pattern": "bucket-a", "source_key_pattern": "a/*"}}
+
+
+def create_s3_client():
+    return boto3.client("s3", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test")
+
+
+def measure(func):
+    """Return the duration, in ms, and the allocated memory, in KiB, of a single call."""
+    tracemalloc.start()
+    start = timeit.default_timer()
+    result = func()
+    duration = timeit.default_timer() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return duration * 1e3, memory / 1024.0
+
+
+def main():
+    s3 = create_s3_client()
+    minio = create_s3_client()
+    mapping = {"minio": minio, "default": s3}
+
+    def build():
+        return boto_s3_router.client(mapping, PROFILES)
+
+    print("%-24s %12s %12s" % ("", "time (ms)", "memory (KiB)"))
+    print("%-24s %12.3f %12.1f" % (("boto3.client",) + measure(create_s3_client)))
+    print("%-24s %12.3f %12.1f" % (("router, first build",) + measure(build)))
+    print("%-24s %12.3f %12.1f" % (("router, cached build",) + measure(build)))
+
+    boto3_time = timeit.timeit(create_s3_client, number=NUMBER) / NUMBER
+    router_time = timeit.timeit(build, number=NUMBER) / NUMBER
+    print("\nmean of %d: boto3.client %.3f ms, router build %.3f ms" % (NUMBER, boto3_time * 1e3, router_time * 1e3))
+
+
+if __name__ == "__main__":
+    main()
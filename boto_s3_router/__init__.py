@@ -1,7 +1,14 @@
-from boto_s3_router.botos3router import BotoS3RouterBuilder
+from boto_s3_router.botos3router import BotoS3RouterBuilder, DEFAULT_ROUTE_CACHE_SIZE, \
+    DEFAULT_DELETE_OBJECTS_CONCURRENCY, DEFAULT_BATCH_CONCURRENCY, DEFAULT_METADATA_CACHE_TTL, \
+    DEFAULT_MIRROR_CONCURRENCY, DEFAULT_MIRROR_QUEUE_SIZE, DEFAULT_HEDGE_CONCURRENCY
 
 
-def client(client_mapping, profiles):
+def client(client_mapping, profiles, route_cache_size=DEFAULT_ROUTE_CACHE_SIZE, cross_client_copy=False,
+           copy_config=None, delete_objects_concurrency=DEFAULT_DELETE_OBJECTS_CONCURRENCY, merged_listing=False,
+           metrics=None, batch_concurrency=DEFAULT_BATCH_CONCURRENCY, default_transfer_config=None,
+           metadata_cache_size=0, metadata_cache_ttl=DEFAULT_METADATA_CACHE_TTL,
+           mirror_concurrency=DEFAULT_MIRROR_CONCURRENCY, mirror_queue_size=DEFAULT_MIRROR_QUEUE_SIZE,
+           hedge_concurrency=DEFAULT_HEDGE_CONCURRENCY, concurrency_limit=None):
     """Create a botos3router client that routes between boto3 s3 clients by configuration.
 
     :param dict client_mapping: The mapping between the profiles to the s3 clients. default client is required.
@@ -17,13 +24,92 @@ def client(client_mapping, profiles):
                "mapped_bucket_name": "new-bucket", (optional - the new bucket name to use;
                                                    bucket name unchanged if not specified)
                "mapped_prefix": "test/" (optional - add this to the given key/prefix when routing the request to the
-               mapped bucket. For example,(put_object(Bucket="example-bucket", "Key"="a/obj.py") --> new-bucket/test/a/obj.py))
+               mapped bucket. For example,(put_object(Bucket="example-bucket", "Key"="a/obj.py") -->
+               new-bucket/test/a/obj.py))
+               "transfer_config": {"multipart_chunksize": 64 * 1024 * 1024, "max_concurrency": 32} (optional - the
+               boto3.s3.transfer.TransferConfig, or a dict of its arguments, of the managed transfers routed to this
+               profile, unless the call passes its own Config)
+               "mirror": "profile2" (optional - a profile of client_mapping whose client receives a copy of every
+               put, copy, delete, multipart upload and managed upload call routed to this profile, in the background,
+               after the call succeeded on the profile's client; routed with the mapped_bucket_name and mapped_prefix
+               of its own profile)
+               "fallback": ["profile2", "default"] (optional - the profiles of client_mapping that get_object,
+               head_object, list calls and paginators fail over to, in order, on server and connection errors;
+               routed with the mapped_bucket_name and mapped_prefix of their own profile)
+               "hedge_after": 0.05 (optional - also send the read to the first fallback when the profile's client
+               hasn't answered after this number of seconds, or after a percentile of its recent latencies such as
+               "p95"; the first response wins. Requires fallback)
            },}
 
+    :param int route_cache_size: The maximum number of routing decisions (target profile, mapped bucket and mapped
+                                 prefix) to keep in the router's LRU cache; 0 disables the cache.
+                                 Cache counters are available through the client's route_cache attribute.
+
+    :param bool cross_client_copy: When the copy source and destination are routed to different clients, copy the
+                                   object by streaming it from the source client into the destination client
+                                   (a multipart upload for large objects) instead of raising ValueError.
+
+    :param boto3.s3.transfer.TransferConfig copy_config: The multipart threshold, part size and concurrency of cross
+                                                         client copy_object calls. copy() uses its own Config argument.
+
+    :param int delete_objects_concurrency: delete_objects splits its keys by routed client and mapped bucket, in
+                                           batches of at most 1000 keys. This is the maximum number of batches
+                                           sent concurrently. A batch that fails as a whole is reported in the
+                                           response's Errors, one entry per key; when every batch fails, whatever
+                                           the number of batches, the ClientError of the first batch is raised.
+
+    :param bool merged_listing: When a list_objects_v2 prefix may be served by several profiles (for example, listing
+                                bucket-a/ when only bucket-a/a/* is routed elsewhere), list all of their clients and
+                                merge the results in key order, instead of listing only the client the prefix routes to.
+
+    :param metrics: Record the latency, errors and bytes of every call, per profile and operation, and the time spent
+                    routing. True collects them in a boto_s3_router.metrics.InMemoryMetrics, available through the
+                    client's metrics attribute; a boto_s3_router.metrics.MetricsSink forwards them elsewhere.
+
+    :param batch_concurrency: The maximum number of concurrent calls per profile of the client's batch and map methods.
+                              An int applies to every profile; a dict maps profile names to their limit, other
+                              profiles use the default limit.
+
+    :param default_transfer_config: The boto3.s3.transfer.TransferConfig, or a dict of its arguments, of the managed
+                                    transfers (upload_file, download_file, upload_fileobj, download_fileobj) routed to
+                                    the default client. Profiles set theirs with their transfer_config property.
+
+    :param int metadata_cache_size: The maximum number of head_object responses (including 404s) to keep in memory,
+                                    by routed client, bucket and key; 0 disables the cache. Responses are populated by
+                                    head_object and get_object, expire after metadata_cache_ttl seconds, and are
+                                    dropped by the router's put, copy and delete calls. The cache counters are
+                                    available through the client's metadata_cache attribute.
+
+    :param float metadata_cache_ttl: The number of seconds a cached head_object response is used.
+
+    :param int mirror_concurrency: The number of writes sent to the mirror clients of the profiles concurrently.
+
+    :param int mirror_queue_size: The maximum number of writes waiting to be sent to the mirror clients; writes to
+                                  mirrored profiles wait for room in the queue. The queue counters, and flush, are
+                                  available through the client's mirror attribute.
+
+    :param int hedge_concurrency: The maximum number of calls of hedged reads to fallbacks in flight; the reads of
+                                  the profiles' own clients run on a separate pool. The hedge and failover
+                                  counters of each profile are available through the client's hedging attribute.
+
+    :param concurrency_limit: Limit the concurrent calls and page fetches of each client with a
+                              boto_s3_router.limiter.AdaptiveLimiter, that grows while calls are healthy and is cut
+                              when the backend throttles; callers over the limit wait in turn. True uses the default
+                              limiter; a dict sets its arguments, for example {"initial_limit": 50, "max_limit": 500}.
+                              The limits and queue depths are available through the client's concurrency_limits
+                              attribute.
+
     :returns: a botos3router client, compatible with the boto S3 client.
     """
     router = BotoS3RouterBuilder()
-    return router.build(client_mapping, profiles)
+    return router.build(client_mapping, profiles, route_cache_size=route_cache_size,
+                        cross_client_copy=cross_client_copy, copy_config=copy_config,
+                        delete_objects_concurrency=delete_objects_concurrency, merged_listing=merged_listing,
+                        metrics=metrics, batch_concurrency=batch_concurrency,
+                        default_transfer_config=default_transfer_config, metadata_cache_size=metadata_cache_size,
+                        metadata_cache_ttl=metadata_cache_ttl, mirror_concurrency=mirror_concurrency,
+                        mirror_queue_size=mirror_queue_size, hedge_concurrency=hedge_concurrency,
+                        concurrency_limit=concurrency_limit)
 
 # def resource(*args, **kwargs):
 # TODO (issue 3)
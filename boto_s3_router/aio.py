@@ -0,0 +1,239 @@
+"""asyncio support: a botos3router client wrapping aiobotocore clients.
+
+Requires aiobotocore (pip install boto-s3-router[aio]).
+"""
+import asyncio
+import time
+
+import aiobotocore.client
+import botocore.exceptions
+
+from boto_s3_router.botos3router import BotoS3RouterBuilder, PaginatorWrapper, DEFAULT_ROUTE_CACHE_SIZE, \
+    DEFAULT_DELETE_OBJECTS_CONCURRENCY, _route, _route_list, _partition_delete_objects, \
+    _merge_delete_objects_batches
+from boto_s3_router.metrics import async_timed_call
+from boto_s3_router.presign import DEFAULT_PRESIGN_EXPIRES
+from boto_s3_router.transfer import AsyncStreamingCopy
+
+# aiobotocore client methods that don't return a coroutine
+SYNC_METHODS = {"get_paginator", "can_paginate", "get_waiter"}
+
+
+class AsyncPaginatorWrapper(PaginatorWrapper):
+    """Wrapper for an aiobotocore paginator.
+
+    paginate returns the page iterator of the routed client, to be iterated with ``async for``.
+    """
+
+    def __init__(self, mapping, config, operation_name, metrics=None):
+        super(AsyncPaginatorWrapper, self).__init__(mapping, config, operation_name, merged_listing=False,
+                                                    metrics=metrics)
+
+
+class AsyncBotoS3RouterBuilder(BotoS3RouterBuilder):
+    """This class creates a botos3router client that wraps aiobotocore clients.
+
+    Routes with the same rules as BotoS3RouterBuilder, so the same configuration routes the same way in both.
+    Client methods are created as ``async def`` methods; get_paginator, can_paginate and get_waiter stay
+    synchronous, like in aiobotocore.
+    """
+
+    client_type = aiobotocore.client.AioBaseClient
+    client_type_name = "aiobotocore.client.AioBaseClient"
+
+    def build(self, mapping, config, route_cache_size=DEFAULT_ROUTE_CACHE_SIZE, cross_client_copy=False,
+              copy_config=None, delete_objects_concurrency=DEFAULT_DELETE_OBJECTS_CONCURRENCY, merged_listing=False,
+              metrics=None):
+        """build AsyncBotoS3RouterBuilder client.
+
+        accepts these arguments of BotoS3RouterBuilder.build; merged_listing is rejected, and the others (object
+        caches, metadata cache, mirrors, fallbacks, batches, concurrency limits...) are not supported.
+        """
+        if merged_listing:
+            raise ValueError("merged_listing is not supported by the asyncio client")
+        return super(AsyncBotoS3RouterBuilder, self).build(
+            mapping, config, route_cache_size=route_cache_size, cross_client_copy=cross_client_copy,
+            copy_config=copy_config, delete_objects_concurrency=delete_objects_concurrency, metrics=metrics)
+
+    def _create_methods(self):
+        op_dict = super(AsyncBotoS3RouterBuilder, self)._create_methods()
+        for name in ("list_objects_sharded", "batch", "map", "mirror", "hedging", "concurrency_limits",
+                     "generate_presigned_urls"):
+            del op_dict[name]
+        op_dict["close"] = self._create_close_method("close")
+        return op_dict
+
+    async def _async_call(self, profile, client_to_call, operation_name, kwargs, start):
+        method = getattr(client_to_call, operation_name)
+        if self.metrics is None:
+            return await method(**kwargs)
+        return await async_timed_call(self.metrics, profile, operation_name, method, kwargs,
+                                      time.perf_counter() - start)
+
+    def _create_api_method(self, operation_name):
+        if operation_name in SYNC_METHODS:
+            return super(AsyncBotoS3RouterBuilder, self)._create_api_method(operation_name)
+
+        async def _api_call(router, *args, **kwargs):
+            builder = router._builder
+            snapshot = builder.snapshot
+            if args:
+                raise TypeError("%s() only accepts keyword arguments." % operation_name)
+            start = time.perf_counter()
+            profile, client_to_call, kwargs = _route(api_params=kwargs, config=snapshot.routes, map=snapshot.mapping)
+            return await builder._async_call(profile, client_to_call, operation_name, kwargs, start)
+
+        _api_call.__name__ = str(operation_name)
+        return _api_call
+
+    def _create_snapshot(self, mapping, config):
+        snapshot = super(AsyncBotoS3RouterBuilder, self)._create_snapshot(mapping, config)
+        if snapshot.object_caches:
+            raise ValueError("object_cache is not supported by the asyncio client")
+        if snapshot.mirrors:
+            raise ValueError("mirror is not supported by the asyncio client")
+        if snapshot.fallbacks:
+            raise ValueError("fallback is not supported by the asyncio client")
+        return snapshot
+
+    def _create_presign_method(self, operation_name):
+        async def _presign_call(router, ClientMethod, Params=None, ExpiresIn=DEFAULT_PRESIGN_EXPIRES, HttpMethod=None):
+            _, client_to_call, params = router._builder._route_presign(router._builder.snapshot, ClientMethod, Params)
+            return await client_to_call.generate_presigned_url(ClientMethod, Params=params, ExpiresIn=ExpiresIn,
+                                                               HttpMethod=HttpMethod)
+
+        _presign_call.__name__ = str(operation_name)
+        return _presign_call
+
+    def _create_get_object_method(self, operation_name):
+        return self._create_api_method(operation_name)
+
+    def _create_head_object_method(self, operation_name):
+        return self._create_api_method(operation_name)
+
+    def _create_write_method(self, operation_name):
+        return self._create_api_method(operation_name)
+
+    def _create_transfer_method(self, operation_name):
+        # aiobotocore clients have no managed transfers; clients that add them are called like other methods
+        return self._create_api_method(operation_name)
+
+    def _create_list_method(self, operation_name):
+        async def _api_call(router, *args, **kwargs):
+            builder = router._builder
+            snapshot = builder.snapshot
+            if args:
+                raise TypeError("%s() only accepts keyword arguments." % operation_name)
+            start = time.perf_counter()
+            profile, client_to_call, kwargs = _route_list(kwargs, snapshot.routes, snapshot.mapping)
+            return await builder._async_call(profile, client_to_call, operation_name, kwargs, start)
+
+        _api_call.__name__ = str(operation_name)
+        return _api_call
+
+    def _create_copy_method(self, operation_name):
+        async def _api_call(router, *args, **kwargs):
+            builder = router._builder
+            if args:
+                raise TypeError("%s() only accepts keyword arguments." % operation_name)
+            start = time.perf_counter()
+            profile, client_to_call_source, dest_profile, client_to_call_dest, api_params = builder._route_copy(
+                builder.snapshot, kwargs)
+
+            if client_to_call_source != client_to_call_dest:
+                if not builder.cross_client_copy:
+                    raise ValueError("client source and client destination are different")
+                if operation_name != "copy_object":
+                    raise ValueError("%s: client source and client destination are different" % operation_name)
+                copier = AsyncStreamingCopy(client_to_call_source, client_to_call_dest, config=builder.copy_config)
+
+                def _copy(CopySource, Bucket, Key, **args):
+                    return copier.copy(CopySource, Bucket, Key, args)
+
+                if builder.metrics is None:
+                    return await _copy(**api_params)
+                return await async_timed_call(builder.metrics, dest_profile, operation_name, _copy, api_params,
+                                              time.perf_counter() - start)
+
+            return await builder._async_call(profile, client_to_call_source, operation_name, api_params, start)
+
+        _api_call.__name__ = str(operation_name)
+        return _api_call
+
+    def _create_get_paginate_method(self, operation_name):
+        def _paginator_api_call(router, *args, **kwargs):
+            builder = router._builder
+            snapshot = builder.snapshot
+            return AsyncPaginatorWrapper(snapshot.mapping, snapshot.routes, kwargs['operation_name'],
+                                         metrics=builder.metrics)
+
+        _paginator_api_call.__name__ = str(operation_name)
+        return _paginator_api_call
+
+    def _create_delete_objects_method(self, operation_name):
+        async def _delete_objects_api_call(router, *args, **kwargs):
+            builder = router._builder
+            snapshot = builder.snapshot
+            if args:
+                raise TypeError("%s() only accepts keyword arguments." % operation_name)
+            start = time.perf_counter()
+            if "Delete" not in kwargs or not kwargs["Delete"].get("Objects"):  # let the client validate the request
+                profile, client_to_call, kwargs = _route(api_params=kwargs, config=snapshot.routes,
+                                                         map=snapshot.mapping)
+                return await builder._async_call(profile, client_to_call, operation_name, kwargs, start)
+
+            batches = _partition_delete_objects(kwargs, snapshot.routes, snapshot.mapping)
+            semaphore = asyncio.Semaphore(builder.delete_objects_concurrency)
+
+            async def _delete_batch(batch):
+                profile, client_to_call, batch_kwargs, original_keys = batch
+                async with semaphore:
+                    try:
+                        res = await builder._async_call(profile, client_to_call, operation_name, batch_kwargs, start)
+                    except botocore.exceptions.ClientError as e:
+                        res = e
+                return res, batch_kwargs, original_keys
+
+            return _merge_delete_objects_batches(await asyncio.gather(*[_delete_batch(b) for b in batches]))
+
+        _delete_objects_api_call.__name__ = str(operation_name)
+        return _delete_objects_api_call
+
+    def _create_close_method(self, operation_name):
+        async def _close_api_call(router):
+            """Close all the routed clients."""
+            builder = router._builder
+            snapshot = builder.snapshot
+            clients = []
+            for c in snapshot.mapping.values():
+                if all(c is not other for other in clients):
+                    clients.append(c)
+            for c in clients:
+                await c.close()
+
+        _close_api_call.__name__ = str(operation_name)
+        return _close_api_call
+
+
+def client(client_mapping, profiles, route_cache_size=DEFAULT_ROUTE_CACHE_SIZE, cross_client_copy=False,
+           copy_config=None, delete_objects_concurrency=DEFAULT_DELETE_OBJECTS_CONCURRENCY, metrics=None):
+    """Create an asyncio botos3router client that routes between aiobotocore s3 clients by configuration.
+
+    The clients should already be created (entered, when created with ``async with``); close() closes all of them.
+
+    Supports a subset of boto_s3_router.client:
+
+    * Options: route_cache_size, cross_client_copy, copy_config, delete_objects_concurrency and metrics, documented
+      in boto_s3_router.client.
+    * Profile settings: source_bucket_pattern, source_key_pattern, mapped_bucket_name and mapped_prefix.
+      transfer_config is accepted but unused, as aiobotocore clients have no managed transfers; object_cache, mirror
+      and fallback (and so hedge_after) raise ValueError.
+    * The client has no list_objects_sharded, batch, map, generate_presigned_urls, mirror, hedging or
+      concurrency_limits.
+
+    :returns: a botos3router client, compatible with the aiobotocore S3 client.
+    """
+    router = AsyncBotoS3RouterBuilder()
+    return router.build(client_mapping, profiles, route_cache_size=route_cache_size,
+                        cross_client_copy=cross_client_copy, copy_config=copy_config,
+                        delete_objects_concurrency=delete_objects_concurrency, metrics=metrics)
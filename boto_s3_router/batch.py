@@ -0,0 +1,71 @@
+import collections
+import concurrent.futures
+import sys
+
+DEFAULT_BATCH_CONCURRENCY = 10
+# the number of results that may be held waiting for an earlier result, per worker
+PENDING_PER_WORKER = 4
+
+
+def shutdown_now(executor):
+    """Shut the executor down without waiting for its running calls, cancelling the calls that haven't started."""
+    if sys.version_info >= (3, 9):
+        executor.shutdown(wait=False, cancel_futures=True)
+    else:
+        executor.shutdown(wait=False)
+
+
+class Batch(object):
+    """Runs many independent router calls concurrently, yielding their results in submission order.
+
+    * Every call is routed when it is submitted, and run on a worker pool of the profile it routes to, so the calls
+      of a slow profile don't hold up the calls of the others.
+    * Requests are consumed lazily: at most PENDING_PER_WORKER results per worker are held waiting for an earlier,
+      slower call, so an unbounded iterable of requests can be streamed through the batch.
+    """
+
+    def __init__(self, call, route_profile, requests, concurrency, return_exceptions=False):
+        """Init Batch.
+
+        :param call: Calls the router method, given the operation name and its kwargs
+        :param route_profile: Returns the profile a call routes to, given the operation name and its kwargs
+        :param requests: An iterable of (operation name, kwargs) pairs
+        :param concurrency: Returns the maximum number of concurrent calls of a profile, given the profile name
+        :param bool return_exceptions: Yield the exception of a failed call in its place, instead of raising it
+        """
+        self.call = call
+        self.route_profile = route_profile
+        self.requests = requests
+        self.concurrency = concurrency
+        self.return_exceptions = return_exceptions
+
+    def __iter__(self):
+        executors = {}
+        pending = collections.deque()
+        workers = 0
+        try:
+            for operation_name, kwargs in self.requests:
+                profile = self.route_profile(operation_name, kwargs)
+                executor = executors.get(profile)
+                if executor is None:
+                    max_workers = self.concurrency(profile)
+                    executor = executors[profile] = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+                    workers += max_workers
+                pending.append(executor.submit(self.call, operation_name, kwargs))
+                while len(pending) > workers * PENDING_PER_WORKER:
+                    yield self._result(pending.popleft())
+            while pending:
+                yield self._result(pending.popleft())
+        finally:
+            for future in pending:
+                future.cancel()
+            for executor in executors.values():
+                shutdown_now(executor)
+
+    def _result(self, future):
+        if not self.return_exceptions:
+            return future.result()
+        try:
+            return future.result()
+        except Exception as e:
+            return e
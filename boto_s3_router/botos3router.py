@@ -1,39 +1,161 @@
-import fnmatch
-import botocore
+import concurrent.futures
+import threading
+import time
 
+import botocore
+import botocore.exceptions
+
+from boto_s3_router.cache import ObjectCache, MetadataCache, METADATA_ARGS, DEFAULT_METADATA_CACHE_TTL
+from boto_s3_router.batch import Batch, DEFAULT_BATCH_CONCURRENCY
+from boto_s3_router.limiter import ConcurrencyLimits, LimitedPageIterator
+from boto_s3_router.hedging import Hedging, Fallbacks, FailoverPageIterator, DEFAULT_HEDGE_CONCURRENCY
+from boto_s3_router.metrics import MetricsSink, InMemoryMetrics, InstrumentedPageIterator, timed_call, timed_transfer
+from boto_s3_router.mirror import Mirror, BODY_METHODS, DEFAULT_MIRROR_CONCURRENCY, DEFAULT_MIRROR_QUEUE_SIZE, \
+    read_body
+from boto_s3_router.listing import MergedListing, ShardedListing, DEFAULT_SHARD_DEPTH, DEFAULT_SHARD_CONCURRENCY
+from boto_s3_router.presign import generate_presigned_urls, DEFAULT_PRESIGN_EXPIRES
+from boto_s3_router.routing import RoutingIndex, ProfileRoute
+from boto_s3_router.transfer import StreamingCopy, transfer_config
+
+DEFAULT_ROUTE_CACHE_SIZE = 4096
+DEFAULT_DELETE_OBJECTS_CONCURRENCY = 10
+DELETE_OBJECTS_MAX_KEYS = 1000
 COPY_METHODS = {"copy", "copy_object", "copy_upload_part"}
 LIST_METHODS = {"list_objects", "list_objects_v2", "list_object_version"}
+TRANSFER_METHODS = {"upload_file", "download_file", "upload_fileobj", "download_fileobj"}
+# methods that overwrite or delete the object of their Bucket and Key
+WRITE_METHODS = {"put_object", "delete_object", "complete_multipart_upload"}
+UPLOAD_METHODS = {"upload_file", "upload_fileobj"}
+# multipart upload methods, routed like WRITE_METHODS to be sent to the mirrors
+MULTIPART_METHODS = {"create_multipart_upload", "upload_part", "upload_part_copy", "abort_multipart_upload"}
+
+# generated router classes, by builder class, service name and api version
+_ROUTER_CLASSES = {}
+_ROUTER_CLASSES_LOCK = threading.Lock()
+
+
+def _route(api_params, config, map):
+    """Route the request, returning the profile name, its client and the mapped api params."""
+    if "Bucket" in api_params:
+        has_key = "Key" in api_params
+        route = config.lookup(api_params["Bucket"], api_params.get("Key"), has_key)
+        if route is not None:
+            if has_key and route.mapped_prefix is not None:
+                api_params["Key"] = route.mapped_prefix + api_params["Key"]
+            if route.mapped_bucket_name is not None:
+                api_params["Bucket"] = route.mapped_bucket_name
+            return route.profile, map.get(route.profile), api_params
+    return "default", map.get("default"), api_params
 
 
 def _route_bucket_and_key(api_params, config, map):
-    for profile in config:
-        mapping = config[profile]
-        if "Bucket" in api_params:
-            if fnmatch.fnmatch(api_params["Bucket"], mapping["source_bucket_pattern"]):
-                if "Key" in api_params:
-                    if "source_key_pattern" in mapping:
-                        if not fnmatch.fnmatch(api_params["Key"], mapping["source_key_pattern"]):
-                            continue
-                    if "mapped_prefix" in mapping:
-                        api_params["Key"] = mapping["mapped_prefix"] + api_params["Key"]
-                if "mapped_bucket_name" in mapping:
-                    api_params["Bucket"] = mapping["mapped_bucket_name"]
-
-                return map.get(profile), api_params
-    return map.get("default"), api_params
+    _, client_to_call, api_params = _route(api_params, config, map)
+    return client_to_call, api_params
 
 
-def _route_list_params(kwargs, config, map):
+def _route_list(kwargs, config, map):
+    """Route a list request, returning the profile name, its client and the mapped kwargs."""
     if "Prefix" in kwargs:
-        client_to_call, result_args = _route_bucket_and_key(
+        profile, client_to_call, result_args = _route(
             api_params={"Bucket": kwargs.get("Bucket"), "Key": kwargs.get("Prefix")}, config=config, map=map)
         kwargs["Prefix"] = result_args["Key"]
     else:
-        client_to_call, result_args = _route_bucket_and_key(api_params=kwargs, config=config, map=map)
+        profile, client_to_call, result_args = _route(api_params=kwargs, config=config, map=map)
     kwargs["Bucket"] = result_args["Bucket"]
+    return profile, client_to_call, kwargs
+
+
+def _route_list_params(kwargs, config, map):
+    _, client_to_call, kwargs = _route_list(kwargs, config, map)
     return client_to_call, kwargs
 
 
+def _route_profile(operation_name, kwargs, config, map):
+    """Return the profile a router call routes to, without mapping its kwargs."""
+    api_params = {}
+    if "Bucket" in kwargs:
+        api_params["Bucket"] = kwargs["Bucket"]
+    key_param = "Prefix" if operation_name in LIST_METHODS else "Key"
+    if key_param in kwargs:
+        api_params["Key"] = kwargs[key_param]
+    return _route(api_params, config, map)[0]
+
+
+def _partition_delete_objects(kwargs, config, map):
+    """Split the objects of a delete_objects request by routed client and mapped bucket.
+
+    Each partition is split into batches of at most DELETE_OBJECTS_MAX_KEYS keys.
+
+    :returns: a list of (profile, client, delete_objects kwargs, {mapped key: original key}) batches
+    """
+    partitions = {}
+    for obj in kwargs["Delete"]["Objects"]:
+        profile, client_to_call, result_args = _route(
+            api_params={"Bucket": kwargs.get("Bucket"), "Key": obj["Key"]}, config=config, map=map)
+        partition = partitions.get((client_to_call, result_args["Bucket"]))
+        if partition is None:
+            partition = partitions[(client_to_call, result_args["Bucket"])] = (profile, [], {})
+        _, objects, original_keys = partition
+        objects.append(dict(obj, Key=result_args["Key"]))
+        original_keys[result_args["Key"]] = obj["Key"]
+
+    batches = []
+    for (client_to_call, bucket), (profile, objects, original_keys) in partitions.items():
+        for i in range(0, len(objects), DELETE_OBJECTS_MAX_KEYS):
+            delete = dict(kwargs["Delete"], Objects=objects[i:i + DELETE_OBJECTS_MAX_KEYS])
+            batches.append((profile, client_to_call, dict(kwargs, Bucket=bucket, Delete=delete), original_keys))
+    return batches
+
+
+def _delete_objects_error_response(kwargs, error):
+    """Report a failed delete_objects batch as an error for each of its keys."""
+    code = error.response.get("Error", {}).get("Code")
+    message = error.response.get("Error", {}).get("Message")
+    errors = []
+    for obj in kwargs["Delete"]["Objects"]:
+        entry = {"Key": obj["Key"], "Code": code, "Message": message}
+        if "VersionId" in obj:
+            entry["VersionId"] = obj["VersionId"]
+        errors.append(entry)
+    return {"Errors": errors}
+
+
+def _merge_delete_objects_batches(results):
+    """Merge the results of the batches of a delete_objects request.
+
+    A batch that fails as a whole is reported as an error for each of its keys, unless every batch failed: the
+    error of the first batch is raised then, as the client would for a single batch.
+
+    :param results: (response or ClientError, batch kwargs, {mapped key: original key}) triples
+    """
+    results = list(results)
+    errors = [res for res, _, _ in results if isinstance(res, botocore.exceptions.ClientError)]
+    if len(errors) == len(results):
+        raise errors[0]
+    return _merge_delete_objects_responses(
+        [(_delete_objects_error_response(batch_kwargs, res) if isinstance(res, botocore.exceptions.ClientError)
+          else res, original_keys) for res, batch_kwargs, original_keys in results])
+
+
+def _merge_delete_objects_responses(responses):
+    """Merge delete_objects responses, reporting the keys under the names the caller used.
+
+    :param responses: (response, {mapped key: original key}) pairs
+    """
+    merged = {}
+    for res, original_keys in responses:
+        for field in ("Deleted", "Errors"):
+            for entry in res.get(field, ()):
+                if "Key" in entry:
+                    entry["Key"] = original_keys.get(entry["Key"], entry["Key"])
+                merged.setdefault(field, []).append(entry)
+        if "RequestCharged" in res:
+            merged["RequestCharged"] = res["RequestCharged"]
+        if "ResponseMetadata" in res and "ResponseMetadata" not in merged:
+            merged["ResponseMetadata"] = res["ResponseMetadata"]
+    return merged
+
+
 class PaginatorWrapper(object):
     """Wrapper for a boto paginator.
 
@@ -41,17 +163,31 @@ class PaginatorWrapper(object):
     paginator according to botos3router's mapping configuration
     """
 
-    def __init__(self, mapping, config, operation_name):
+    def __init__(self, mapping, config, operation_name, merged_listing=False, metrics=None, fallbacks=None,
+                 hedging=None, concurrency_limits=None):
         """Init PaginatorWrapper.
 
         Initialize paginator for each client.
 
          :param dict mapping: The mapping between the profiles to the s3 clients
-         :param dict[dict] config: The configuration rules for the clients routing
+         :param RoutingIndex config: The compiled configuration rules for the clients routing
          :param str operation_name: The operation name of the paginator
+         :param bool merged_listing: Merge the listings of all clients serving the requested prefix
+                                     (list_objects_v2 only)
+         :param MetricsSink metrics: When set, every page fetch is recorded in the sink
+         :param dict fallbacks: The Fallbacks of each profile with fallbacks
+         :param Hedging hedging: Counts the failovers to the fallbacks
+         :param ConcurrencyLimits concurrency_limits: When set, every page fetch waits for a slot of its client's
+                                                      limiter
         """
         self.mapping = mapping
         self.config = config
+        self.operation_name = operation_name
+        self.merged_listing = merged_listing
+        self.metrics = metrics
+        self.fallbacks = fallbacks or {}
+        self.hedging = hedging
+        self.concurrency_limits = concurrency_limits
         self.paginators = dict()
         for client in self.mapping:
             self.paginators[client] = self.mapping[client].get_paginator(operation_name)
@@ -61,8 +197,88 @@ class PaginatorWrapper(object):
 
         accepts a PaginationConfig named argument that can be used to customize the pagination.
         """
-        paginator_to_call, kwargs = _route_list_params(kwargs, self.config, self.paginators)
-        return getattr(paginator_to_call, "paginate")(**kwargs)
+        if self.merged_listing and self.operation_name == "list_objects_v2":
+            listing = MergedListing(self.config, self.mapping, kwargs, kwargs.get("PaginationConfig"))
+            if len(listing.list_routes) > 1:
+                return listing
+        start = time.perf_counter()
+        original = dict(kwargs) if self.fallbacks else kwargs
+        profile, paginator_to_call, kwargs = _route_list(kwargs, self.config, self.paginators)
+        fallbacks = self.fallbacks.get(profile)
+        if fallbacks is None:
+            return self._paginate(profile, paginator_to_call, kwargs, start)
+        paginate_calls = [lambda: self._paginate(profile, paginator_to_call, kwargs, start)]
+        for route in fallbacks.routes:
+            paginate_calls.append(lambda route=route: self._paginate(route.profile, self.paginators[route.profile],
+                                                                     route.params(kwargs, original, "Prefix"),
+                                                                     time.perf_counter()))
+        return FailoverPageIterator(paginate_calls, lambda: self.hedging.record_failover(profile))
+
+    def _paginate(self, profile, paginator_to_call, kwargs, start):
+        page_iterator = getattr(paginator_to_call, "paginate")(**kwargs)
+        if self.concurrency_limits is not None:
+            page_iterator = LimitedPageIterator(page_iterator,
+                                                self.concurrency_limits.limiter(profile, self.mapping[profile]))
+        if self.metrics is None:
+            return page_iterator
+        return InstrumentedPageIterator(page_iterator, self.metrics, profile, self.operation_name,
+                                        time.perf_counter() - start)
+
+
+class RoutingSnapshot(object):
+    """The clients and the compiled routing rules of a router.
+
+    A snapshot is never modified: reconfiguring a router replaces its snapshot, and a call that read the snapshot
+    routes with it until it returns.
+    """
+
+    __slots__ = ("mapping", "config", "routes", "default", "transfer_configs", "object_caches", "mirrors", "fallbacks")
+
+    def __init__(self, mapping, config, routes, transfer_configs=None, object_caches=None, mirrors=None,
+                 fallbacks=None):
+        """Init RoutingSnapshot.
+
+        :param dict mapping: The mapping between the profiles to the s3 clients
+        :param dict config: The rules for the clients routing
+        :param RoutingIndex routes: The compiled rules
+        :param dict transfer_configs: The TransferConfig of the managed transfers of each profile
+        :param dict object_caches: The ObjectCache of each cached profile
+        :param dict mirrors: The ProfileRoute of the mirror of each mirrored profile
+        :param dict fallbacks: The Fallbacks of the reads of each profile with fallbacks
+        """
+        self.mapping = mapping
+        self.config = config
+        self.routes = routes
+        self.default = mapping.get("default")
+        self.transfer_configs = transfer_configs or {}
+        self.object_caches = object_caches or {}
+        self.mirrors = mirrors or {}
+        self.fallbacks = fallbacks or {}
+
+
+class _Router(object):
+    """Base class of the generated router classes.
+
+    Client methods are created the first time they are accessed, for every public method of the default client,
+    and set on the class.
+    """
+
+    def __init__(self, builder):
+        self._builder = builder
+
+    def __getattr__(self, name):
+        builder = self.__dict__.get("_builder")
+        if builder is None or name.startswith("_") or not callable(getattr(builder.snapshot.default, name, None)):
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+        method = builder._create_method(name)
+        setattr(type(self), name, method)
+        return method.__get__(self, type(self))
+
+    def __dir__(self):
+        default = self._builder.snapshot.default
+        names = set(super(_Router, self).__dir__())
+        names.update(name for name in dir(default) if not name.startswith("_") and callable(getattr(default, name)))
+        return sorted(names)
 
 
 class BotoS3RouterBuilder(object):
@@ -73,141 +289,722 @@ class BotoS3RouterBuilder(object):
     * Holds special treatment for functions that operate on multiple buckets or keys
     """
 
+    client_type = botocore.client.BaseClient
+    client_type_name = "boto.s3.client"
+
     def __init__(self):
         """Init BotoS3RouterBuilder."""
-        self.default = None
-        self.mapping = None
-        self.config = None
-
-    def build(self, mapping, config):
+        self.snapshot = None
+        self.route_cache_size = DEFAULT_ROUTE_CACHE_SIZE
+        self.default_transfer_config = None
+        self.metadata_cache = None
+        self.mirror = None
+        self.hedging = None
+        self.concurrency_limits = None
+        self._reconfigure_lock = threading.Lock()
+        self.cross_client_copy = False
+        self.copy_config = None
+        self.delete_objects_concurrency = DEFAULT_DELETE_OBJECTS_CONCURRENCY
+        self.merged_listing = False
+        self.metrics = None
+        self.batch_concurrency = DEFAULT_BATCH_CONCURRENCY
+
+    def build(self, mapping, config, route_cache_size=DEFAULT_ROUTE_CACHE_SIZE, cross_client_copy=False,
+              copy_config=None, delete_objects_concurrency=DEFAULT_DELETE_OBJECTS_CONCURRENCY, merged_listing=False,
+              metrics=None, batch_concurrency=DEFAULT_BATCH_CONCURRENCY, default_transfer_config=None,
+              metadata_cache_size=0, metadata_cache_ttl=DEFAULT_METADATA_CACHE_TTL,
+              mirror_concurrency=DEFAULT_MIRROR_CONCURRENCY, mirror_queue_size=DEFAULT_MIRROR_QUEUE_SIZE,
+              hedge_concurrency=DEFAULT_HEDGE_CONCURRENCY, concurrency_limit=None):
         """build BotoS3RouterBuilder client.
 
         initialize default client.
+        compile the routing rules.
         create boto client methods.
+
+        :param int route_cache_size: The maximum number of routing decisions to cache; 0 disables the cache
+        :param bool cross_client_copy: Copy objects between different clients by streaming them through the router,
+                                       instead of raising ValueError
+        :param boto3.s3.transfer.TransferConfig copy_config: The part size, threshold and concurrency of
+                                                             cross client copy_object calls
+        :param int delete_objects_concurrency: The maximum number of delete_objects batches sent concurrently
+        :param bool merged_listing: List prefixes that span several profiles from all of their clients
+                                    (list_objects_v2 and its paginator)
+        :param metrics: A MetricsSink recording every client call, or True for an InMemoryMetrics sink
+        :param batch_concurrency: The maximum number of concurrent batch calls per profile; an int for every profile,
+                                  or a dict of profile to int
+        :param default_transfer_config: The TransferConfig, or dict of its arguments, of the default client's managed
+                                        transfers
+        :param int metadata_cache_size: The maximum number of head_object responses to cache; 0 disables the cache
+        :param float metadata_cache_ttl: The number of seconds a head_object response is served from the cache
+        :param int mirror_concurrency: The number of writes sent to the mirror clients concurrently
+        :param int mirror_queue_size: The maximum number of writes waiting to be sent to the mirror clients
+        :param int hedge_concurrency: The maximum number of calls of hedged reads to fallbacks in flight
+        :param concurrency_limit: Limit the concurrent calls of each client with an AdaptiveLimiter; True for the
+                                  default limiter, or a dict of the AdaptiveLimiter arguments
         """
+        if not isinstance(route_cache_size, int) or route_cache_size < 0:
+            raise ValueError("route_cache_size must be a non-negative int")
+        self.route_cache_size = route_cache_size
+        if default_transfer_config is not None:
+            default_transfer_config = transfer_config(default_transfer_config)
+        self.default_transfer_config = default_transfer_config
+        if not isinstance(metadata_cache_size, int) or metadata_cache_size < 0:
+            raise ValueError("metadata_cache_size must be a non-negative int")
+        if not isinstance(metadata_cache_ttl, (int, float)) or metadata_cache_ttl <= 0:
+            raise ValueError("metadata_cache_ttl must be a positive number")
+        self.metadata_cache = MetadataCache(metadata_cache_size, metadata_cache_ttl) if metadata_cache_size else None
+        for name, value in (("mirror_concurrency", mirror_concurrency), ("mirror_queue_size", mirror_queue_size),
+                            ("hedge_concurrency", hedge_concurrency)):
+            if not isinstance(value, int) or value < 1:
+                raise ValueError(name + " must be a positive int")
+        self.mirror = Mirror(mirror_concurrency, mirror_queue_size)
+        self.hedging = Hedging(hedge_concurrency)
+        if concurrency_limit is True:
+            concurrency_limit = {}
+        if concurrency_limit is not None and not isinstance(concurrency_limit, dict):
+            raise TypeError("Invalid concurrency_limit type: " + str(type(concurrency_limit)) + " expected dict")
+        self.concurrency_limits = ConcurrencyLimits(concurrency_limit) if concurrency_limit is not None else None
+        self.snapshot = self._create_snapshot(mapping, config)
+        self.cross_client_copy = cross_client_copy
+        self.copy_config = copy_config
+        if not isinstance(delete_objects_concurrency, int) or delete_objects_concurrency < 1:
+            raise ValueError("delete_objects_concurrency must be a positive int")
+        self.delete_objects_concurrency = delete_objects_concurrency
+        self.merged_listing = merged_listing
+        if metrics is True:
+            metrics = InMemoryMetrics()
+        if metrics is not None and not isinstance(metrics, MetricsSink):
+            raise TypeError("Invalid metrics type: " + str(type(metrics)) + " expected MetricsSink")
+        self.metrics = metrics
+        limits = batch_concurrency.values() if isinstance(batch_concurrency, dict) else [batch_concurrency]
+        if any(not isinstance(limit, int) or limit < 1 for limit in limits):
+            raise ValueError("batch_concurrency must be a positive int, or a dict of profile to positive int")
+        self.batch_concurrency = batch_concurrency
+
+        return self._router_class()(self)
+
+    @property
+    def default(self):
+        return self.snapshot.default
+
+    @property
+    def mapping(self):
+        return self.snapshot.mapping
+
+    @property
+    def config(self):
+        return self.snapshot.config
+
+    @property
+    def routes(self):
+        return self.snapshot.routes
+
+    def _create_snapshot(self, mapping, config):
+        """Validate the clients and routing rules, and compile them into a RoutingSnapshot."""
         if not isinstance(mapping, dict):
             raise TypeError("Invalid client mapping type: " + str(type(mapping)) + " expected dict")
 
         if "default" not in mapping:
             raise ValueError("default client is required")
-        self.mapping = mapping
-        self.config = config
-        self.default = mapping.get("default")
 
-        for k, v in self.mapping.items():
-            if not isinstance(v, botocore.client.BaseClient):
-                raise TypeError("mapping: " + k + "Invalid client type: " + str(type(v)) + " expected boto.s3.client")
-
-        for profile in self.config:
-            if not self.mapping.get(profile):
+        for k, v in mapping.items():
+            if not isinstance(v, self.client_type):
+                raise TypeError("mapping: " + k + "Invalid client type: " + str(type(v)) + " expected " +
+                                self.client_type_name)
+
+        transfer_configs = {}
+        object_caches = {}
+        mirrors = {}
+        fallbacks = {}
+        if self.default_transfer_config is not None:
+            transfer_configs["default"] = self.default_transfer_config
+        for profile in config:
+            if not mapping.get(profile):
                 raise ValueError("profile " + profile + " in config does not appear in mapping")
-            if "source_bucket_pattern" not in self.config[profile]:
+            if "source_bucket_pattern" not in config[profile]:
                 raise ValueError("profile " + profile + " source_bucket_pattern is required")
-
-        class_attributes = self._create_methods()
-        cls = type("s3", (), class_attributes)
-        return cls()
+            if "transfer_config" in config[profile]:
+                transfer_configs[profile] = transfer_config(config[profile]["transfer_config"])
+            if "object_cache" in config[profile]:
+                object_cache = config[profile]["object_cache"]
+                if not isinstance(object_cache, ObjectCache):
+                    raise TypeError("profile " + profile + " Invalid object_cache type: " + str(type(object_cache)) +
+                                    " expected ObjectCache")
+                if any(object_cache is other for other in object_caches.values()):
+                    raise ValueError("profile " + profile + " object_cache is used by another profile")
+                object_caches[profile] = object_cache
+            if "mirror" in config[profile]:
+                mirror = config[profile]["mirror"]
+                if not mapping.get(mirror):
+                    raise ValueError("profile " + profile + " mirror " + str(mirror) + " does not appear in mapping")
+                if mapping[mirror] is mapping[profile]:
+                    raise ValueError("profile " + profile + " mirror " + mirror + " is the profile's own client")
+                mirrors[profile] = ProfileRoute.from_config(mirror, mapping, config)
+            if "fallback" in config[profile]:
+                fallbacks[profile] = self._create_fallbacks(profile, mapping, config)
+            elif "hedge_after" in config[profile]:
+                raise ValueError("profile " + profile + " hedge_after requires a fallback")
+        return RoutingSnapshot(mapping, config, RoutingIndex(config, cache_size=self.route_cache_size),
+                               transfer_configs, object_caches, mirrors, fallbacks)
+
+    @staticmethod
+    def _create_fallbacks(profile, mapping, config):
+        fallback = config[profile]["fallback"]
+        names = [fallback] if isinstance(fallback, str) else fallback
+        if not isinstance(names, list) or not names:
+            raise TypeError("profile " + profile + " Invalid fallback type: " + str(type(fallback)) +
+                            " expected str or non-empty list")
+        routes = []
+        for name in names:
+            if not mapping.get(name):
+                raise ValueError("profile " + profile + " fallback " + str(name) + " does not appear in mapping")
+            if mapping[name] is mapping[profile]:
+                raise ValueError("profile " + profile + " fallback " + name + " is the profile's own client")
+            routes.append(ProfileRoute.from_config(name, mapping, config))
+        return Fallbacks(routes, config[profile].get("hedge_after"))
+
+    def reconfigure(self, config=None, mapping=None):
+        """Replace the routing rules and clients of the built router.
+
+        The new rules are validated like in build, and replace the current ones at once: calls and paginators that
+        already started keep routing with the previous rules.
+
+        :param dict config: The new rules for the clients routing; the current rules if not set
+        :param dict mapping: Clients to add to the mapping, or to replace the clients of the same profiles
+        """
+        with self._reconfigure_lock:
+            snapshot = self.snapshot
+            if config is None:
+                config = snapshot.config
+            if mapping is None:
+                mapping = snapshot.mapping
+            elif isinstance(mapping, dict):
+                mapping = dict(snapshot.mapping, **mapping)
+            self.snapshot = self._create_snapshot(mapping, config)
+
+    def _router_class(self):
+        """Return the generated router class of the default client's service model and api version.
+
+        The class is created once per builder class, service and api version; its client methods are created on
+        first access, and read the routing state from the router's builder, so every router of the same service
+        shares them.
+        """
+        service_model = self.snapshot.default.meta.service_model
+        key = (type(self), service_model.service_name, service_model.api_version)
+        cls = _ROUTER_CLASSES.get(key)
+        if cls is None:
+            with _ROUTER_CLASSES_LOCK:
+                cls = _ROUTER_CLASSES.get(key)
+                if cls is None:
+                    cls = _ROUTER_CLASSES[key] = type("s3", (_Router,), self._create_methods())
+        return cls
 
     def _create_methods(self):
-        op_dict = {}
-        operations = [func for func in dir(self.default) if
-                      (callable(getattr(self.default, func)) and not func.startswith('_'))]
-        for operation_name in operations:
-            if operation_name == "get_paginator":
-                op_dict[operation_name] = self._create_get_paginate_method(operation_name)
-            elif operation_name == "can_paginate":
-                op_dict[operation_name] = self._create_can_paginate_method(operation_name)
-            elif operation_name == "delete_objects":
-                op_dict[operation_name] = self._create_delete_objects_method(operation_name)
-            elif operation_name in LIST_METHODS:
-                op_dict[operation_name] = self._create_list_method(operation_name)
-            elif operation_name in COPY_METHODS:
-                op_dict[operation_name] = self._create_copy_method(operation_name)
-            else:
-                op_dict[operation_name] = self._create_api_method(operation_name)
-        op_dict["meta"] = self.default.meta
+        """Return the router class attributes created up front; client methods are created by _create_method."""
+        op_dict = {"list_objects_sharded": self._create_sharded_list_method("list_objects_sharded"),
+                   "batch": self._create_batch_method("batch"),
+                   "map": self._create_map_method("map")}
+        op_dict["reconfigure"] = self._create_reconfigure_method("reconfigure")
+        op_dict["generate_presigned_urls"] = self._create_bulk_presign_method("generate_presigned_urls")
+        op_dict["meta"] = property(lambda router: router._builder.snapshot.default.meta)
+        op_dict["route_cache"] = property(lambda router: router._builder.snapshot.routes.cache)
+        op_dict["metrics"] = property(lambda router: router._builder.metrics)
+        op_dict["metadata_cache"] = property(lambda router: router._builder.metadata_cache)
+        op_dict["mirror"] = property(lambda router: router._builder.mirror)
+        op_dict["hedging"] = property(lambda router: router._builder.hedging)
+        op_dict["concurrency_limits"] = property(lambda router: router._builder.concurrency_limits)
         return op_dict
 
+    def _create_method(self, operation_name):
+        if operation_name == "get_paginator":
+            return self._create_get_paginate_method(operation_name)
+        elif operation_name == "can_paginate":
+            return self._create_can_paginate_method(operation_name)
+        elif operation_name == "delete_objects":
+            return self._create_delete_objects_method(operation_name)
+        elif operation_name == "generate_presigned_url":
+            return self._create_presign_method(operation_name)
+        elif operation_name in LIST_METHODS:
+            return self._create_list_method(operation_name)
+        elif operation_name in COPY_METHODS:
+            return self._create_copy_method(operation_name)
+        elif operation_name in TRANSFER_METHODS:
+            return self._create_transfer_method(operation_name)
+        elif operation_name == "get_object":
+            return self._create_get_object_method(operation_name)
+        elif operation_name == "head_object":
+            return self._create_head_object_method(operation_name)
+        elif operation_name in WRITE_METHODS or operation_name in MULTIPART_METHODS:
+            return self._create_write_method(operation_name)
+        return self._create_api_method(operation_name)
+
+    def _call(self, profile, client_to_call, operation_name, kwargs, start):
+        """Call the client method; start is the time routing the call started, for the metrics."""
+        method = getattr(client_to_call, operation_name)
+        if self.concurrency_limits is not None:
+            method = self.concurrency_limits.limiter(profile, client_to_call).wrap(method)
+        if self.metrics is None:
+            return method(**kwargs)
+        return timed_call(self.metrics, profile, operation_name, method, kwargs, time.perf_counter() - start)
+
+    def _read(self, snapshot, profile, client_to_call, operation_name, kwargs, original, start, key_param="Key"):
+        """Call a read method, failing over or hedging to the profile's fallbacks; original are the unrouted
+        kwargs, that the fallbacks route with their own mapping."""
+        fallbacks = snapshot.fallbacks.get(profile)
+        if fallbacks is None:
+            return self._call(profile, client_to_call, operation_name, kwargs, start)
+        calls = [lambda: self._call(profile, client_to_call, operation_name, kwargs, start)]
+        for route in fallbacks.routes:
+            calls.append(lambda route=route: self._call(route.profile, route.client, operation_name,
+                                                        route.params(kwargs, original, key_param),
+                                                        time.perf_counter()))
+        return self.hedging.call(profile, fallbacks, calls)
+
     def _create_api_method(self, operation_name):
-        def _api_call(_, *args, **kwargs):
+        def _api_call(router, *args, **kwargs):
+            builder = router._builder
+            snapshot = builder.snapshot
+            if args:
+                raise TypeError("%s() only accepts keyword arguments." % operation_name)
+            start = time.perf_counter()
+            profile, client_to_call, kwargs = _route(api_params=kwargs, config=snapshot.routes, map=snapshot.mapping)
+
+            return builder._call(profile, client_to_call, operation_name, kwargs, start)
+
+        _api_call.__name__ = str(operation_name)
+        return _api_call
+
+    def _invalidate(self, snapshot, profile, params):
+        """Drop the object of the routed params from the metadata cache and the profile's object cache."""
+        if "Key" not in params:
+            return
+        if self.metadata_cache is not None:
+            self.metadata_cache.invalidate(snapshot.mapping.get(profile), params["Bucket"], params["Key"])
+        object_cache = snapshot.object_caches.get(profile)
+        if object_cache is not None:
+            object_cache.invalidate(params["Bucket"], params["Key"])
+
+    def _create_head_object_method(self, operation_name):
+        def _api_call(router, *args, **kwargs):
+            builder = router._builder
+            snapshot = builder.snapshot
+            if args:
+                raise TypeError("%s() only accepts keyword arguments." % operation_name)
+            start = time.perf_counter()
+            original = dict(kwargs) if snapshot.fallbacks else kwargs
+            profile, client_to_call, kwargs = _route(api_params=kwargs, config=snapshot.routes, map=snapshot.mapping)
+            metadata_cache = builder.metadata_cache
+            if metadata_cache is None or not METADATA_ARGS.issuperset(kwargs):
+                return builder._read(snapshot, profile, client_to_call, operation_name, kwargs, original, start)
+
+            res = metadata_cache.get(client_to_call, kwargs["Bucket"], kwargs["Key"])
+            if res is not None:
+                return res
+            generation = metadata_cache.generation(client_to_call, kwargs["Bucket"], kwargs["Key"])
+            try:
+                res = builder._read(snapshot, profile, client_to_call, operation_name, kwargs, original, start)
+            except botocore.exceptions.ClientError as e:
+                if e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 404:
+                    metadata_cache.put_missing(client_to_call, kwargs["Bucket"], kwargs["Key"], e, generation)
+                raise
+            metadata_cache.put(client_to_call, kwargs["Bucket"], kwargs["Key"], res, generation)
+            return res
+
+        _api_call.__name__ = str(operation_name)
+        return _api_call
+
+    def _create_get_object_method(self, operation_name):
+        def _api_call(router, *args, **kwargs):
+            builder = router._builder
+            snapshot = builder.snapshot
             if args:
                 raise TypeError("%s() only accepts keyword arguments." % operation_name)
-            client_to_call = self.default
-            client_to_call, kwargs = _route_bucket_and_key(api_params=kwargs, config=self.config, map=self.mapping)
+            start = time.perf_counter()
+            original = dict(kwargs) if snapshot.fallbacks else kwargs
+            profile, client_to_call, kwargs = _route(api_params=kwargs, config=snapshot.routes, map=snapshot.mapping)
+            metadata_cache = builder.metadata_cache
+            if metadata_cache is not None and METADATA_ARGS.issuperset(kwargs):
+                generation = metadata_cache.generation(client_to_call, kwargs["Bucket"], kwargs["Key"])
+            else:
+                metadata_cache = None
+            object_cache = snapshot.object_caches.get(profile)
+            if object_cache is None:
+                res = builder._read(snapshot, profile, client_to_call, operation_name, kwargs, original, start)
+            else:
+                res = object_cache.get_object(lambda **get_args: builder._read(snapshot, profile, client_to_call,
+                                                                               operation_name, get_args, original,
+                                                                               time.perf_counter()), kwargs)
+            if metadata_cache is not None:
+                metadata_cache.put(client_to_call, kwargs["Bucket"], kwargs["Key"], res, generation)
+            return res
+
+        _api_call.__name__ = str(operation_name)
+        return _api_call
 
-            return getattr(client_to_call, operation_name)(**kwargs)
+    def _create_write_method(self, operation_name):
+        def _api_call(router, *args, **kwargs):
+            builder = router._builder
+            snapshot = builder.snapshot
+            if args:
+                raise TypeError("%s() only accepts keyword arguments." % operation_name)
+            start = time.perf_counter()
+            original = dict(kwargs) if snapshot.mirrors else kwargs
+            profile, client_to_call, kwargs = _route(api_params=kwargs, config=snapshot.routes, map=snapshot.mapping)
+            mirror = snapshot.mirrors.get(profile)
+            if mirror is None and operation_name not in WRITE_METHODS:
+                return builder._call(profile, client_to_call, operation_name, kwargs, start)
+            if mirror is not None and operation_name in BODY_METHODS:
+                read_body(kwargs)
+            try:
+                res = builder._call(profile, client_to_call, operation_name, kwargs, start)
+            finally:
+                if operation_name in WRITE_METHODS:
+                    builder._invalidate(snapshot, profile, kwargs)
+            if mirror is not None:
+                builder.mirror.submit(mirror.client, operation_name, mirror.params(kwargs, original, "Key"), res)
+            return res
 
         _api_call.__name__ = str(operation_name)
         return _api_call
 
+    def _create_transfer_method(self, operation_name):
+        def _transfer_call(router, *args, **kwargs):
+            builder = router._builder
+            snapshot = builder.snapshot
+            if args:
+                raise TypeError("%s() only accepts keyword arguments." % operation_name)
+            start = time.perf_counter()
+            original = dict(kwargs) if snapshot.mirrors else kwargs
+            profile, client_to_call, kwargs = _route(api_params=kwargs, config=snapshot.routes, map=snapshot.mapping)
+            if kwargs.get("Config") is None and profile in snapshot.transfer_configs:
+                kwargs["Config"] = snapshot.transfer_configs[profile]
+            method = getattr(client_to_call, operation_name)
+            try:
+                if builder.metrics is None:
+                    res = method(**kwargs)
+                else:
+                    res = timed_transfer(builder.metrics, profile, operation_name, method, kwargs,
+                                         time.perf_counter() - start)
+            finally:
+                if operation_name in UPLOAD_METHODS:
+                    builder._invalidate(snapshot, profile, kwargs)
+            if operation_name in UPLOAD_METHODS and profile in snapshot.mirrors:
+                builder._mirror_upload(snapshot, operation_name, profile, client_to_call, kwargs, original)
+            return res
+
+        _transfer_call.__name__ = str(operation_name)
+        return _transfer_call
+
     def _create_list_method(self, operation_name):
-        def _api_call(_, *args, **kwargs):
+        def _api_call(router, *args, **kwargs):
+            builder = router._builder
+            snapshot = builder.snapshot
             if args:
                 raise TypeError("%s() only accepts keyword arguments." % operation_name)
-            client_to_call, kwargs = _route_list_params(kwargs, self.config, self.mapping)
-            return getattr(client_to_call, operation_name)(**kwargs)
+            if builder.merged_listing and operation_name == "list_objects_v2":
+                listing = MergedListing(snapshot.routes, snapshot.mapping, kwargs)
+                if len(listing.list_routes) > 1:
+                    return listing.first_page()
+            start = time.perf_counter()
+            original = dict(kwargs) if snapshot.fallbacks else kwargs
+            profile, client_to_call, kwargs = _route_list(kwargs, snapshot.routes, snapshot.mapping)
+            return builder._read(snapshot, profile, client_to_call, operation_name, kwargs, original, start,
+                                 key_param="Prefix")
 
         _api_call.__name__ = str(operation_name)
         return _api_call
 
+    def _create_sharded_list_method(self, operation_name):
+        def _sharded_list_call(router, *args, **kwargs):
+            """Yield all objects under the prefix, listing its shards concurrently.
+
+            Accepts the list_objects_v2 arguments, and:
+            :param int ShardDepth: The number of Delimiter levels below the prefix to split into shards
+            :param int MaxConcurrency: The maximum number of shards listed concurrently on each client
+            """
+            builder = router._builder
+            snapshot = builder.snapshot
+            if args:
+                raise TypeError("%s() only accepts keyword arguments." % operation_name)
+            shard_depth = kwargs.pop("ShardDepth", DEFAULT_SHARD_DEPTH)
+            max_concurrency = kwargs.pop("MaxConcurrency", DEFAULT_SHARD_CONCURRENCY)
+            listing = ShardedListing(lambda list_kwargs: _route_list_params(list_kwargs, snapshot.routes,
+                                                                            snapshot.mapping),
+                                     snapshot.mapping, kwargs, shard_depth=shard_depth, max_concurrency=max_concurrency,
+                                     merged_routes=snapshot.routes if builder.merged_listing else None)
+            return iter(listing)
+
+        _sharded_list_call.__name__ = str(operation_name)
+        return _sharded_list_call
+
+    @staticmethod
+    def _route_presign(snapshot, client_method, params):
+        """Route the Params of a presigned client_method call, returning the profile name, its client and the mapped
+        params."""
+        params = dict(params or {})
+        if client_method in LIST_METHODS:
+            return _route_list(params, snapshot.routes, snapshot.mapping)
+        return _route(api_params=params, config=snapshot.routes, map=snapshot.mapping)
+
+    def _create_presign_method(self, operation_name):
+        def _presign_call(router, ClientMethod, Params=None, ExpiresIn=DEFAULT_PRESIGN_EXPIRES, HttpMethod=None):
+            """Presign a client method call with the client its Params route to."""
+            _, client_to_call, params = router._builder._route_presign(router._builder.snapshot, ClientMethod, Params)
+            return client_to_call.generate_presigned_url(ClientMethod, Params=params, ExpiresIn=ExpiresIn,
+                                                         HttpMethod=HttpMethod)
+
+        _presign_call.__name__ = str(operation_name)
+        return _presign_call
+
+    def _create_bulk_presign_method(self, operation_name):
+        def _bulk_presign_call(router, ClientMethod, Params, ExpiresIn=DEFAULT_PRESIGN_EXPIRES, HttpMethod=None):
+            """Presign many calls of a client method, for example the get_object calls of a dataset's keys.
+
+            The calls are routed and grouped by client; the SigV4 urls of a bucket with only Bucket and Key params
+            are signed from the bucket's first url, with its cached signing key.
+
+            :param str ClientMethod: The client method, for example "get_object"
+            :param Params: An iterable of the params of the calls
+            :returns: the list of the presigned urls, in the order of Params
+            """
+            builder = router._builder
+            snapshot = builder.snapshot
+            groups = {}
+            count = 0
+            for params in Params:
+                _, client_to_call, params = builder._route_presign(snapshot, ClientMethod, params)
+                group = groups.get(id(client_to_call))
+                if group is None:
+                    group = groups[id(client_to_call)] = (client_to_call, [], [])
+                group[1].append(count)
+                group[2].append(params)
+                count += 1
+            urls = [None] * count
+            for client_to_call, indexes, client_params in groups.values():
+                for i, url in zip(indexes, generate_presigned_urls(client_to_call, ClientMethod, client_params,
+                                                                   expires_in=ExpiresIn, http_method=HttpMethod)):
+                    urls[i] = url
+            return urls
+
+        _bulk_presign_call.__name__ = str(operation_name)
+        return _bulk_presign_call
+
+    def _create_reconfigure_method(self, operation_name):
+        def _reconfigure_call(router, profiles=None, client_mapping=None):
+            """Replace the routing rules and clients of the router, without blocking calls in progress.
+
+            :param dict profiles: The new rules for the clients routing, validated like in boto_s3_router.client;
+                                  the current rules if not set
+            :param dict client_mapping: Clients to add to the client mapping, or to replace the clients of the same
+                                        profiles
+            """
+            router._builder.reconfigure(profiles, client_mapping)
+
+        _reconfigure_call.__name__ = str(operation_name)
+        return _reconfigure_call
+
+    def _profile_batch_concurrency(self, profile):
+        if isinstance(self.batch_concurrency, dict):
+            return self.batch_concurrency.get(profile, DEFAULT_BATCH_CONCURRENCY)
+        return self.batch_concurrency
+
+    def _create_batch_method(self, operation_name):
+        def _batch_call(router, requests, return_exceptions=False):
+            """Run many calls concurrently, on worker pools of the profiles they route to.
+
+            :param requests: An iterable of (operation name, kwargs) pairs, for example ("head_object", {...})
+            :param bool return_exceptions: Yield the exception of a failed call in its place, instead of raising it
+            :returns: an iterator of the results, in the order of the requests
+            """
+            builder = router._builder
+            snapshot = builder.snapshot
+            batch = Batch(lambda name, kwargs: getattr(router, name)(**kwargs),
+                          lambda name, kwargs: _route_profile(name, kwargs, snapshot.routes, snapshot.mapping),
+                          requests, builder._profile_batch_concurrency, return_exceptions=return_exceptions)
+            return iter(batch)
+
+        _batch_call.__name__ = str(operation_name)
+        return _batch_call
+
+    def _create_map_method(self, operation_name):
+        def _map_call(router, client_method, params, return_exceptions=False):
+            """Call client_method with each of the kwargs in params, like batch.
+
+            :param str client_method: The client method, for example "head_object"
+            :param params: An iterable of the kwargs of the calls
+            :param bool return_exceptions: Yield the exception of a failed call in its place, instead of raising it
+            :returns: an iterator of the results, in the order of params
+            """
+            return router.batch(((client_method, kwargs) for kwargs in params), return_exceptions=return_exceptions)
+
+        _map_call.__name__ = str(operation_name)
+        return _map_call
+
     def _create_copy_method(self, operation_name):
-        def _api_call(_, *args, **kwargs):
+        def _api_call(router, *args, **kwargs):
+            builder = router._builder
+            snapshot = builder.snapshot
             if args:
                 raise TypeError("%s() only accepts keyword arguments." % operation_name)
-            client_to_call_source = self.default
-            client_to_call_dest = self.default
-            if "CopySource" in kwargs:  # copy operation
-                if isinstance(kwargs["CopySource"], str):
-                    raise TypeError("accepts only type dict as CopySource")
-                client_to_call_source, kwargs["CopySource"] = _route_bucket_and_key(api_params=kwargs["CopySource"],
-                                                                                    config=self.config,
-                                                                                    map=self.mapping)
-
-            res = _route_bucket_and_key(api_params=kwargs, config=self.config, map=self.mapping)
-            client_to_call_dest, api_params = res
-
-            if client_to_call_source != client_to_call_dest:
+            start = time.perf_counter()
+            original = None
+            if snapshot.mirrors:  # routing maps the arguments in place
+                original = dict(kwargs)
+                if isinstance(kwargs.get("CopySource"), dict):
+                    original["CopySource"] = dict(kwargs["CopySource"])
+            profile, client_to_call_source, dest_profile, client_to_call_dest, api_params = builder._route_copy(
+                snapshot, kwargs)
+
+            if client_to_call_source != client_to_call_dest and not builder.cross_client_copy:
                 raise ValueError("client source and client destination are different")
-
-            return getattr(client_to_call_source, operation_name)(**api_params)
+            try:
+                if client_to_call_source != client_to_call_dest:
+                    if builder.metrics is None:
+                        res = builder._streaming_copy(operation_name, client_to_call_source, client_to_call_dest,
+                                                      api_params)
+                    else:
+                        res = timed_call(builder.metrics, dest_profile, operation_name,
+                                         lambda **params: builder._streaming_copy(operation_name, client_to_call_source,
+                                                                                  client_to_call_dest, params),
+                                         api_params, time.perf_counter() - start)
+                else:
+                    res = builder._call(profile, client_to_call_source, operation_name, api_params, start)
+            finally:
+                builder._invalidate(snapshot, dest_profile, api_params)
+            if dest_profile in snapshot.mirrors:
+                builder._mirror_copy(snapshot, operation_name, profile, client_to_call_source, dest_profile,
+                                     api_params, original, res)
+            return res
 
         _api_call.__name__ = str(operation_name)
         return _api_call
 
+    def _route_copy(self, snapshot, kwargs):
+        """Route a copy, returning the source profile and client, the destination profile and client, and the
+        mapped api params."""
+        source_profile = "default"
+        client_to_call_source = snapshot.default
+        if "CopySource" in kwargs:  # copy operation
+            if isinstance(kwargs["CopySource"], str):
+                raise TypeError("accepts only type dict as CopySource")
+            source_profile, client_to_call_source, kwargs["CopySource"] = _route(api_params=kwargs["CopySource"],
+                                                                                 config=snapshot.routes,
+                                                                                 map=snapshot.mapping)
+
+        dest_profile, client_to_call_dest, api_params = _route(api_params=kwargs, config=snapshot.routes,
+                                                               map=snapshot.mapping)
+        return source_profile, client_to_call_source, dest_profile, client_to_call_dest, api_params
+
+    def _mirror_copy(self, snapshot, operation_name, source_profile, client_source, dest_profile, api_params,
+                     original, res):
+        """Queue a copy for the destination profile's mirror, to the destination mapped by the mirror profile's
+        rules: copied on the mirror when the source was copied on the same client and is mirrored to the same
+        mirror, streamed from the source client otherwise."""
+        mirror = snapshot.mirrors[dest_profile]
+        params = mirror.params({k: v for k, v in api_params.items() if k != "Callback"}, original, "Key")
+        source_mirror = snapshot.mirrors.get(source_profile)
+        if client_source is not snapshot.mapping.get(dest_profile) or source_mirror is None or \
+                source_mirror.client is not mirror.client:
+            call = self._streaming_copy_call(operation_name, client_source, mirror.client)
+        else:
+            call = None
+            params["CopySource"] = source_mirror.params(api_params["CopySource"], original["CopySource"], "Key")
+        self.mirror.submit(mirror.client, operation_name, params, res, call=call)
+
+    def _mirror_upload(self, snapshot, operation_name, profile, client_to_call, api_params, original):
+        """Queue a managed upload for the profile's mirror, streamed from the object uploaded on the profile's
+        client, as the file or file object may be gone or consumed by the time the mirror write is sent."""
+        mirror = snapshot.mirrors[profile]
+        extra_args = dict(api_params.get("ExtraArgs") or {})
+        for arg in ("SSECustomerAlgorithm", "SSECustomerKey", "SSECustomerKeyMD5"):  # to read the uploaded object
+            if arg in extra_args:
+                extra_args["CopySource" + arg] = extra_args[arg]
+        params = mirror.params({"CopySource": {"Bucket": api_params["Bucket"], "Key": api_params["Key"]},
+                                "ExtraArgs": extra_args, "Config": api_params.get("Config")}, original, "Key")
+        self.mirror.submit(mirror.client, operation_name, params, None,
+                           call=self._streaming_copy_call("copy", client_to_call, mirror.client))
+
+    def _streaming_copy_call(self, operation_name, client_source, client_dest):
+        """Return a call sending the arguments of a copy as a streaming copy from client_source to client_dest."""
+        def call(**api_params):
+            return self._streaming_copy(operation_name, client_source, client_dest, api_params)
+        return call
+
+    def _streaming_copy(self, operation_name, client_source, client_dest, api_params):
+        if operation_name == "copy":  # managed transfer, configured by its own arguments
+            copier = StreamingCopy(client_source, client_dest, config=api_params.get("Config"),
+                                   callback=api_params.get("Callback"))
+            copier.copy(api_params["CopySource"], api_params["Bucket"], api_params["Key"], api_params.get("ExtraArgs"))
+            return None
+        if operation_name == "copy_object":
+            args = {k: v for k, v in api_params.items() if k not in ("CopySource", "Bucket", "Key")}
+            copier = StreamingCopy(client_source, client_dest, config=self.copy_config)
+            return copier.copy(api_params["CopySource"], api_params["Bucket"], api_params["Key"], args)
+        raise ValueError("%s: client source and client destination are different" % operation_name)
+
     def _create_get_paginate_method(self, operation_name):
-        def _paginator_api_call(*args, **kwargs):
-            return PaginatorWrapper(self.mapping, self.config, kwargs['operation_name'])
+        def _paginator_api_call(router, *args, **kwargs):
+            builder = router._builder
+            snapshot = builder.snapshot
+            return PaginatorWrapper(snapshot.mapping, snapshot.routes, kwargs['operation_name'],
+                                    merged_listing=builder.merged_listing, metrics=builder.metrics,
+                                    fallbacks=snapshot.fallbacks, hedging=builder.hedging,
+                                    concurrency_limits=builder.concurrency_limits)
 
         _paginator_api_call.__name__ = str(operation_name)
         return _paginator_api_call
 
     def _create_can_paginate_method(self, operation_name):
-        def _can_paginate_api_call(*args, **kwargs):
-            return getattr(self.default, operation_name)(**kwargs)
+        def _can_paginate_api_call(router, *args, **kwargs):
+            builder = router._builder
+            return getattr(builder.snapshot.default, operation_name)(**kwargs)
 
         _can_paginate_api_call.__name__ = str(operation_name)
         return _can_paginate_api_call
 
     def _create_delete_objects_method(self, operation_name):
-        def _delete_objects_api_call(_, *args, **kwargs):
+        def _delete_objects_api_call(router, *args, **kwargs):
+            builder = router._builder
+            snapshot = builder.snapshot
             if args:
                 raise TypeError("%s() only accepts keyword arguments." % operation_name)
-            if "Delete" in kwargs:  # delete objects operation
-                for i, obj in enumerate(kwargs["Delete"]["Objects"]):
-                    client_to_call, result_agrs = _route_bucket_and_key(
-                        api_params={"Bucket": kwargs.get("Bucket"), "Key": obj["Key"]},
-                        config=self.config, map=self.mapping)
-                    bucket = result_agrs["Bucket"]
-                    kwargs["Delete"]["Objects"][i]["Key"] = result_agrs["Key"]
-                    if i == 0:
-                        prev_client = client_to_call
-                    else:
-                        if prev_client != client_to_call:
-                            raise ValueError("can't delete objects that mapped to different clients")
-                        prev_client = client_to_call
-
-                kwargs["Bucket"] = bucket
-                return getattr(client_to_call, operation_name)(**kwargs)
+            start = time.perf_counter()
+            if "Delete" not in kwargs or not kwargs["Delete"].get("Objects"):  # let the client validate the request
+                profile, client_to_call, kwargs = _route(api_params=kwargs, config=snapshot.routes,
+                                                         map=snapshot.mapping)
+                return builder._call(profile, client_to_call, operation_name, kwargs, start)
+
+            batches = _partition_delete_objects(kwargs, snapshot.routes, snapshot.mapping)
+            invalidate = bool(snapshot.object_caches) or builder.metadata_cache is not None
+
+            def _delete_batch(batch):
+                profile, client_to_call, batch_kwargs, original_keys = batch
+                try:
+                    res = builder._call(profile, client_to_call, operation_name, batch_kwargs, start)
+                except botocore.exceptions.ClientError as e:
+                    return e, batch_kwargs, original_keys
+                finally:
+                    # after the call, so that a concurrent head_object can't cache the deleted object again
+                    if invalidate:
+                        for obj in batch_kwargs["Delete"]["Objects"]:
+                            builder._invalidate(snapshot, profile, dict(obj, Bucket=batch_kwargs["Bucket"]))
+                mirror = snapshot.mirrors.get(profile)
+                if mirror is not None:
+                    # the keys the profile's client failed to delete are still there, so they stay on the mirror too
+                    failed = {error.get("Key") for error in res.get("Errors", ())}
+                    objects = [dict(obj, Key=mirror.key(original_keys[obj["Key"]]))
+                               for obj in batch_kwargs["Delete"]["Objects"] if obj["Key"] not in failed]
+                    if objects:
+                        mirror_kwargs = dict(batch_kwargs, Bucket=mirror.mapped_bucket_name or kwargs["Bucket"],
+                                             Delete=dict(batch_kwargs["Delete"], Objects=objects))
+                        builder.mirror.submit(mirror.client, operation_name, mirror_kwargs, res)
+                return res, batch_kwargs, original_keys
+
+            if len(batches) == 1:
+                return _merge_delete_objects_batches([_delete_batch(batches[0])])
+            max_workers = min(builder.delete_objects_concurrency, len(batches))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                return _merge_delete_objects_batches(executor.map(_delete_batch, batches))
 
         _delete_objects_api_call.__name__ = str(operation_name)
         return _delete_objects_api_call
@@ -0,0 +1,410 @@
+import collections
+import hashlib
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+
+import botocore.exceptions
+
+CACHE_FILE_SUFFIX = ".s3cache"
+READ_CHUNK_SIZE = 1024 * 1024
+# get_object arguments a cached object can answer; calls with any other argument bypass the cache
+CACHEABLE_ARGS = {"Bucket", "Key", "Range", "VersionId"}
+# head_object and get_object arguments whose responses populate the metadata cache
+METADATA_ARGS = {"Bucket", "Key"}
+DEFAULT_METADATA_CACHE_TTL = 5.0
+# the number of invalidation counters of a MetadataCache, each counting the invalidations of the keys hashed to it
+INVALIDATION_STRIPES = 1024
+# get_object response fields kept with a cached object and returned on hits
+_RESPONSE_FIELDS = ("AcceptRanges", "CacheControl", "ContentDisposition", "ContentEncoding", "ContentLanguage",
+                    "ContentType", "ETag", "Expires", "LastModified", "Metadata", "StorageClass", "VersionId")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _byte_range(range_header, size):
+    """Return the [start, end) offsets of a single byte range, or None when the cache can't answer it."""
+    m = _RANGE.match(range_header)
+    if m is None or m.group(1) == m.group(2) == "":
+        return None
+    if m.group(1) == "":  # the last bytes
+        return max(size - int(m.group(2)), 0), size
+    start = int(m.group(1))
+    end = size if m.group(2) == "" else min(int(m.group(2)) + 1, size)
+    if start >= size or end <= start:
+        return None
+    return start, end
+
+
+def _not_modified(error):
+    return error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 304
+
+
+class CachedBody(object):
+    """A get_object Body streaming a cached object from a memory map.
+
+    Behaves like botocore's StreamingBody; getbuffer returns a zero-copy memoryview of the remaining bytes.
+    Views returned by getbuffer stay valid after the body is closed: the memory map is then closed when the last of
+    them is released or garbage collected.
+    """
+
+    def __init__(self, path, start, end):
+        """Init CachedBody.
+
+        :param str path: The cached object file
+        :param int start: The offset of the first byte of the body
+        :param int end: The offset after the last byte of the body
+        """
+        self._mmap = None
+        if end > start:
+            with open(path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)[start:end]
+        else:
+            self._view = memoryview(b"")
+        self._position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return self.iter_lines()
+
+    def readable(self):
+        return True
+
+    def getbuffer(self):
+        """Return a memoryview of the unread bytes, without copying them."""
+        view = self._view[self._position:]
+        self._position = len(self._view)
+        return view
+
+    def read(self, amt=None):
+        end = len(self._view) if amt is None else min(self._position + amt, len(self._view))
+        data = self._view[self._position:end].tobytes()
+        self._position = end
+        return data
+
+    def readinto(self, b):
+        n = min(len(b), len(self._view) - self._position)
+        b[:n] = self._view[self._position:self._position + n]
+        self._position += n
+        return n
+
+    def iter_chunks(self, chunk_size=1024):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def iter_lines(self, chunk_size=1024, keepends=False):
+        pending = b""
+        for chunk in self.iter_chunks(chunk_size):
+            lines = (pending + chunk).splitlines(True)
+            for line in lines[:-1]:
+                yield line if keepends else line.splitlines()[0]
+            pending = lines[-1]
+        if pending:
+            yield pending if keepends else pending.splitlines()[0]
+
+    def close(self):
+        self._view.release()
+        self._view = memoryview(b"")
+        self._position = 0
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:  # views from getbuffer are still held; the map is closed when they are collected
+                pass
+            self._mmap = None
+
+
+class _CachedObject(object):
+    __slots__ = ("path", "size", "etag", "response")
+
+    def __init__(self, path, size, etag, response):
+        self.path = path
+        self.size = size
+        self.etag = etag
+        self.response = response
+
+
+class ObjectCache(object):
+    """A read-through, size-bounded LRU cache of whole objects on local disk.
+
+    Set it as the object_cache of a profile to serve its get_object calls from disk:
+
+    * On a miss, the whole object is fetched and written to the cache directory, then served from there.
+    * Hits are served from a memory map of the cached file, including single byte range (Range) requests.
+    * Unless validate is False, a hit for the latest version of an object is revalidated with a conditional
+      get_object (IfNoneMatch its ETag); calls with a VersionId are served without revalidation.
+    * put_object, delete_object, delete_objects, copy_object and uploads routed to the profile drop the objects
+      they overwrite or delete.
+
+    Use one ObjectCache per profile; the cache index is kept in memory, so files left by earlier processes are
+    removed when the cache is created.
+    """
+
+    def __init__(self, directory, max_size, validate=True):
+        """Init ObjectCache.
+
+        :param str directory: The directory of the cached objects; created if it doesn't exist
+        :param int max_size: The maximum total size of the cached objects, in bytes
+        :param bool validate: Revalidate hits with the backend; set to False for immutable objects
+        """
+        if not isinstance(max_size, int) or max_size < 1:
+            raise ValueError("max_size must be a positive int")
+        self.directory = directory
+        self.max_size = max_size
+        self.validate = validate
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._objects = collections.OrderedDict()
+        self._versions = {}
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith(CACHE_FILE_SUFFIX):
+                os.remove(os.path.join(directory, name))
+
+    @property
+    def hit_rate(self):
+        with self._lock:
+            return self._hit_rate()
+
+    def _hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """Return a snapshot of the cache counters."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "invalidations": self.invalidations, "objects": len(self._objects), "size": self.size,
+                    "max_size": self.max_size, "hit_rate": self._hit_rate()}
+
+    def clear(self):
+        with self._lock:
+            for cache_key in list(self._objects):
+                self._remove(cache_key)
+
+    def invalidate(self, bucket, key):
+        """Drop every cached version of the object."""
+        with self._lock:
+            versions = self._versions.get((bucket, key))
+            if versions:
+                for version_id in list(versions):
+                    self._remove((bucket, key, version_id))
+                self.invalidations += 1
+
+    def get_object(self, call, kwargs):
+        """Answer a get_object call from the cache, fetching the object with call on a miss.
+
+        :param call: Calls the backend get_object with the given kwargs
+        :param dict kwargs: The routed get_object arguments
+        """
+        if not CACHEABLE_ARGS.issuperset(kwargs):
+            return call(**kwargs)
+        bucket, key, version_id = kwargs["Bucket"], kwargs["Key"], kwargs.get("VersionId")
+        get_args = {k: v for k, v in kwargs.items() if k != "Range"}
+        with self._lock:
+            cached = self._objects.get((bucket, key, version_id))
+            if cached is not None:
+                self._objects.move_to_end((bucket, key, version_id))
+
+        if cached is not None and self.validate and version_id is None:
+            try:
+                res = call(IfNoneMatch=cached.etag, **get_args)
+            except botocore.exceptions.ClientError as e:
+                if not _not_modified(e):
+                    raise
+            else:  # the object changed: cache the new one
+                with self._lock:
+                    self._remove((bucket, key, version_id))
+                return self._fill(call, kwargs, res)
+        if cached is not None:
+            res = self._response(cached, kwargs.get("Range"))
+            if res is not None:
+                with self._lock:
+                    self.hits += 1
+                return res
+        return self._fill(call, kwargs, call(**get_args))
+
+    def _fill(self, call, kwargs, res):
+        """Cache the full object response res, then answer the call from the cache."""
+        with self._lock:
+            self.misses += 1
+        size = res.get("ContentLength", 0)
+        if size > self.max_size:
+            if "Range" not in kwargs:
+                return res
+            res["Body"].close()
+            return call(**kwargs)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in res["Body"].iter_chunks(READ_CHUNK_SIZE):
+                    f.write(chunk)
+            bucket, key, version_id = kwargs["Bucket"], kwargs["Key"], kwargs.get("VersionId")
+            path = os.path.join(self.directory, hashlib.sha256(
+                repr((bucket, key, version_id)).encode("utf-8")).hexdigest() + CACHE_FILE_SUFFIX)
+            response = {field: res[field] for field in _RESPONSE_FIELDS if field in res}
+            cached = _CachedObject(path, size, res.get("ETag"), response)
+            with self._lock:
+                self._remove((bucket, key, version_id))
+                os.replace(tmp_path, path)
+                self._objects[(bucket, key, version_id)] = cached
+                self._versions.setdefault((bucket, key), set()).add(version_id)
+                self.size += size
+                while self.size > self.max_size:
+                    self._remove(next(iter(self._objects)))
+                    self.evictions += 1
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        answer = self._response(cached, kwargs.get("Range"))
+        return answer if answer is not None else call(**kwargs)
+
+    def _response(self, cached, range_header):
+        """Return a get_object response reading the cached object, or None when the cache can't answer it."""
+        start, end = 0, cached.size
+        if range_header is not None:
+            byte_range = _byte_range(range_header, cached.size)
+            if byte_range is None:
+                return None
+            start, end = byte_range
+        try:
+            body = CachedBody(cached.path, start, end)
+        except (OSError, ValueError):  # evicted meanwhile
+            return None
+        res = dict(cached.response, Body=body, ContentLength=end - start,
+                   ResponseMetadata={"HTTPStatusCode": 200 if range_header is None else 206, "HTTPHeaders": {},
+                                     "RetryAttempts": 0})
+        if range_header is not None:
+            res["ContentRange"] = "bytes %d-%d/%d" % (start, end - 1, cached.size)
+        return res
+
+    def _remove(self, cache_key):
+        cached = self._objects.pop(cache_key, None)
+        if cached is None:
+            return
+        versions = self._versions.get(cache_key[:2])
+        if versions is not None:
+            versions.discard(cache_key[2])
+            if not versions:
+                del self._versions[cache_key[:2]]
+        self.size -= cached.size
+        try:
+            os.remove(cached.path)
+        except OSError:
+            pass
+
+
+class MetadataCache(object):
+    """A bounded, in-memory LRU cache of head_object responses, expiring after a TTL.
+
+    Entries are keyed by the routed client, bucket and key, and populated from head_object and get_object
+    responses. A head_object 404 is cached too, and raised again as the same ClientError.
+    Like RouteCache, the cache takes no locks; a response is only cached if its object, or another object sharing
+    its invalidation counter, was not invalidated since its call started, so a write racing with a head_object can't
+    leave a stale entry behind, and writes to other objects rarely keep a response from being cached.
+    """
+
+    def __init__(self, maxsize, ttl=DEFAULT_METADATA_CACHE_TTL):
+        """Init MetadataCache.
+
+        :param int maxsize: The maximum number of cached responses
+        :param float ttl: The number of seconds a response is served from the cache
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = collections.OrderedDict()
+        self._stripes = [0] * INVALIDATION_STRIPES
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """Return a snapshot of the cache counters."""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "invalidations": self.invalidations, "size": len(self._entries), "maxsize": self.maxsize,
+                "hit_rate": self.hit_rate}
+
+    def clear(self):
+        self._entries.clear()
+
+    def generation(self, client, bucket, key):
+        """Return a token to pass to put, taken before the call whose response is cached."""
+        return self._stripes[hash((client, bucket, key)) % INVALIDATION_STRIPES]
+
+    def get(self, client, bucket, key):
+        """Return a copy of the cached head_object response, or None; raise the ClientError of a cached 404."""
+        cache_key = (client, bucket, key)
+        entry = self._entries.get(cache_key)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        try:
+            self._entries.move_to_end(cache_key)
+        except KeyError:
+            pass
+        self.hits += 1
+        expires, response, error_response = entry
+        if error_response is not None:
+            raise botocore.exceptions.ClientError(dict(error_response, Error=dict(error_response["Error"])),
+                                                  "HeadObject")
+        res = dict(response)
+        if "Metadata" in res:
+            res["Metadata"] = dict(res["Metadata"])
+        return res
+
+    def put(self, client, bucket, key, response, generation):
+        """Cache a head_object or get_object response, without its Body."""
+        self._put((client, bucket, key), {k: v for k, v in response.items() if k != "Body"}, None, generation)
+
+    def put_missing(self, client, bucket, key, error, generation):
+        """Cache the 404 ClientError of a head_object."""
+        self._put((client, bucket, key), None, error.response, generation)
+
+    def _put(self, cache_key, response, error_response, generation):
+        if generation != self._stripes[hash(cache_key) % INVALIDATION_STRIPES]:
+            return
+        entries = self._entries
+        entries[cache_key] = (time.monotonic() + self.ttl, response, error_response)
+        try:
+            entries.move_to_end(cache_key)
+        except KeyError:  # invalidated or evicted by another thread
+            pass
+        while len(entries) > self.maxsize:
+            try:
+                entries.popitem(last=False)
+            except KeyError:
+                break
+            self.evictions += 1
+
+    def invalidate(self, client, bucket, key):
+        cache_key = (client, bucket, key)
+        self.invalidations += 1
+        self._stripes[hash(cache_key) % INVALIDATION_STRIPES] += 1
+        self._entries.pop(cache_key, None)
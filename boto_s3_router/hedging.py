@@ -0,0 +1,268 @@
+import collections
+import concurrent.futures
+import re
+import threading
+import time
+
+import botocore.exceptions
+
+from boto_s3_router.listing import PageIteratorWrapper
+
+DEFAULT_HEDGE_CONCURRENCY = 64
+# the number of threads running the hedged reads of the profiles' own clients
+DEFAULT_PRIMARY_CONCURRENCY = 256
+# the number of recent primary latencies a percentile deadline is computed from
+HEDGE_WINDOW = 512
+HEDGE_MIN_SAMPLES = 20
+HEDGE_RECOMPUTE_INTERVAL = 32
+_PERCENTILE = re.compile(r"^p(\d{1,2}(\.\d+)?)$")
+
+
+def is_failover_error(error):
+    """Return whether a failed read should be retried on a fallback: server errors and connection errors."""
+    if isinstance(error, (botocore.exceptions.ConnectionError, botocore.exceptions.HTTPClientError)):
+        return True
+    if isinstance(error, botocore.exceptions.ClientError):
+        return error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) >= 500
+    return False
+
+
+def hedge_deadline(hedge_after):
+    """Validate a profile's hedge_after: a number of seconds, or a percentile of the primary latency such as "p95".
+
+    :returns: (seconds, None) for a fixed deadline, (None, percentile) for an adaptive one, or None
+    """
+    if hedge_after is None:
+        return None
+    if isinstance(hedge_after, (int, float)) and not isinstance(hedge_after, bool) and hedge_after > 0:
+        return hedge_after, None
+    match = _PERCENTILE.match(hedge_after) if isinstance(hedge_after, str) else None
+    if match is None:
+        raise ValueError("hedge_after must be a positive number of seconds or a percentile such as 'p95', got " +
+                         repr(hedge_after))
+    return None, float(match.group(1))
+
+
+def _close_body(future):
+    """Release the connection of a losing get_object response."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    res = future.result()
+    if isinstance(res, dict) and "Body" in res:
+        res["Body"].close()
+
+
+class Fallbacks(object):
+    """The ordered fallbacks of a profile's reads, and when to hedge them."""
+
+    __slots__ = ("routes", "hedge_after", "percentile")
+
+    def __init__(self, routes, hedge_after=None):
+        """Init Fallbacks.
+
+        :param list routes: The ProfileRoutes of the fallbacks, in the order they are tried
+        :param hedge_after: The profile's hedge_after, validated by hedge_deadline
+        """
+        self.routes = routes
+        self.hedge_after, self.percentile = hedge_deadline(hedge_after) or (None, None)
+
+
+class _ProfileHedging(object):
+    __slots__ = ("calls", "hedged", "hedge_wins", "failovers", "latencies", "samples", "deadline")
+
+    def __init__(self):
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.latencies = collections.deque(maxlen=HEDGE_WINDOW)
+        self.samples = 0
+        self.deadline = None
+
+
+class Hedging(object):
+    """Runs the reads of profiles with fallbacks.
+
+    * A read that fails with a server or connection error is retried on the profile's fallbacks, in order.
+    * With a hedge deadline, the read is also sent to the first fallback when the profile's client hasn't answered
+      in time; the first response wins, and the other call is cancelled if it didn't start, or its body is closed.
+      The deadline is either fixed, or a percentile of the recent latencies of the profile's client.
+    * The hedged read on the profile's client runs on a pool of its own, so it never waits for the calls sent to
+      the fallbacks, which share another bounded pool. When every thread of the profiles' pool is busy, the read
+      runs on the caller's thread and fails over without hedging, rather than waiting for a thread.
+    """
+
+    def __init__(self, concurrency=DEFAULT_HEDGE_CONCURRENCY, primary_concurrency=DEFAULT_PRIMARY_CONCURRENCY):
+        """Init Hedging.
+
+        :param int concurrency: The maximum number of calls to fallbacks in flight, for hedges and failovers of
+                                hedged reads
+        :param int primary_concurrency: The maximum number of hedged reads of the profiles' own clients in flight
+        """
+        self.concurrency = concurrency
+        self.primary_concurrency = primary_concurrency
+        self._executor = None
+        self._primary_executor = None
+        self._primary_slots = threading.BoundedSemaphore(primary_concurrency)
+        self._lock = threading.Lock()
+        self._profiles = {}
+
+    def stats(self):
+        """Return the counters of each profile: reads, hedges sent, hedges that won, failovers, and the current
+        deadline in seconds."""
+        with self._lock:
+            return {profile: {"calls": p.calls, "hedged": p.hedged, "hedge_wins": p.hedge_wins,
+                              "failovers": p.failovers, "deadline": p.deadline}
+                    for profile, p in self._profiles.items()}
+
+    def _profile(self, profile):
+        stats = self._profiles.get(profile)
+        if stats is None:
+            with self._lock:
+                stats = self._profiles.setdefault(profile, _ProfileHedging())
+        return stats
+
+    def record_failover(self, profile):
+        stats = self._profile(profile)
+        with self._lock:
+            stats.failovers += 1
+
+    def _record_latency(self, stats, percentile, latency):
+        with self._lock:
+            stats.latencies.append(latency)
+            stats.samples += 1
+            if stats.samples == HEDGE_MIN_SAMPLES or \
+                    (stats.samples > HEDGE_MIN_SAMPLES and stats.samples % HEDGE_RECOMPUTE_INTERVAL == 0):
+                latencies = sorted(stats.latencies)
+                stats.deadline = latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+    def call(self, profile, fallbacks, calls):
+        """Run a read of the profile.
+
+        :param str profile: The profile the read routes to
+        :param Fallbacks fallbacks: The profile's fallbacks
+        :param list calls: Call the read on the profile's client, then on each fallback
+        """
+        stats = self._profile(profile)
+        with self._lock:
+            stats.calls += 1
+            if fallbacks.hedge_after is not None:
+                stats.deadline = fallbacks.hedge_after
+            deadline = stats.deadline if fallbacks.hedge_after is not None or fallbacks.percentile is not None else None
+        if deadline is None:
+            return self._failover(stats, fallbacks, calls)
+        return self._hedge(stats, fallbacks, calls, deadline)
+
+    def _failover(self, stats, fallbacks, calls):
+        for i, call in enumerate(calls):
+            start = time.perf_counter()
+            try:
+                res = call()
+            except Exception as e:
+                if i == len(calls) - 1 or not is_failover_error(e):
+                    raise
+                with self._lock:
+                    stats.failovers += 1
+                continue
+            if i == 0 and fallbacks.percentile is not None:
+                self._record_latency(stats, fallbacks.percentile, time.perf_counter() - start)
+            return res
+
+    def _hedge(self, stats, fallbacks, calls, deadline):
+        # a slot per primary thread, so the primary read never waits in the pool's queue
+        if not self._primary_slots.acquire(blocking=False):
+            return self._failover(stats, fallbacks, calls)
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._primary_executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.primary_concurrency)
+                    self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency)
+        start = time.perf_counter()
+        try:
+            primary = self._primary_executor.submit(calls[0])
+        except BaseException:
+            self._primary_slots.release()
+            raise
+        primary.add_done_callback(lambda future: self._primary_slots.release())
+        if fallbacks.percentile is not None:
+            def _record(future):
+                if future.exception() is None:
+                    self._record_latency(stats, fallbacks.percentile, time.perf_counter() - start)
+            primary.add_done_callback(_record)
+        pending = {primary}
+        hedge = None
+        next_call = 1
+        error = None
+        while True:
+            timeout = None
+            if hedge is None and next_call == 1 < len(calls):
+                timeout = max(0.0, start + deadline - time.perf_counter())
+            done, _ = concurrent.futures.wait(pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                hedge = self._executor.submit(calls[next_call])
+                next_call += 1
+                pending.add(hedge)
+                with self._lock:
+                    stats.hedged += 1
+                continue
+            for future in done:
+                pending.discard(future)
+                error = future.exception()
+                # the profile's client answers for the object: a fallback's client error waits for its answer
+                if error is not None and (is_failover_error(error) or primary in pending):
+                    continue
+                for other in pending:
+                    if not other.cancel():
+                        other.add_done_callback(_close_body)
+                if error is not None:
+                    raise error
+                if future is hedge:
+                    with self._lock:
+                        stats.hedge_wins += 1
+                return future.result()
+            if not pending:
+                if next_call == len(calls):
+                    raise error
+                pending.add(self._executor.submit(calls[next_call]))
+                next_call += 1
+                with self._lock:
+                    stats.failovers += 1
+
+
+class FailoverPageIterator(PageIteratorWrapper):
+    """Iterates the pages of a paginator, switching to the next fallback's paginator when the first page fails
+    with a server or connection error.
+
+    build_full_result and search fail over too; after a failover, attributes such as resume_token are read from the
+    fallback's page iterator.
+    """
+
+    def __init__(self, paginate_calls, on_failover):
+        """Init FailoverPageIterator.
+
+        :param list paginate_calls: Return the page iterator of the profile's client, then of each fallback
+        :param on_failover: Called when switching to a fallback
+        """
+        super(FailoverPageIterator, self).__init__(paginate_calls[0]())
+        self._paginate_calls = paginate_calls
+        self._on_failover = on_failover
+
+    def __iter__(self):
+        page_iterator = self._page_iterator
+        for i in range(len(self._paginate_calls)):
+            pages = iter(page_iterator)
+            try:
+                first_page = next(pages)
+            except StopIteration:
+                return
+            except Exception as e:
+                if i == len(self._paginate_calls) - 1 or not is_failover_error(e):
+                    raise
+                self._on_failover()
+                page_iterator = self._page_iterator = self._paginate_calls[i + 1]()
+                continue
+            yield first_page
+            for page in pages:
+                yield page
+            return
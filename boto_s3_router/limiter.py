@@ -0,0 +1,191 @@
+import collections
+import threading
+import time
+
+import botocore.exceptions
+
+from boto_s3_router.listing import PageIteratorWrapper
+
+DEFAULT_INITIAL_LIMIT = 20
+DEFAULT_MIN_LIMIT = 1
+DEFAULT_MAX_LIMIT = 256
+DEFAULT_BACKOFF_RATIO = 0.5
+# a call slower than this multiple of the average latency doesn't grow the limit
+DEFAULT_LATENCY_TOLERANCE = 2.0
+LATENCY_SMOOTHING = 0.05
+THROTTLING_ERROR_CODES = {"SlowDown", "Throttling", "ThrottlingException", "RequestLimitExceeded",
+                          "TooManyRequestsException", "ServiceUnavailable", "RequestThrottled"}
+
+
+def is_throttling_error(error):
+    """Return whether a failed call was throttled by the backend."""
+    if not isinstance(error, botocore.exceptions.ClientError):
+        return False
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return status in (429, 503) or error.response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+
+def was_retried(response):
+    """Return whether the client retried the call before it succeeded, which the backend's throttling causes."""
+    return isinstance(response, dict) and response.get("ResponseMetadata", {}).get("RetryAttempts", 0) > 0
+
+
+class AdaptiveLimiter(object):
+    """Limits the number of concurrent calls to a client, adapting the limit to the backend (AIMD).
+
+    * While the limit is in use and calls are not slower than latency_tolerance times their average latency, each
+      successful call grows the limit by 1 / limit: about one more call per round of calls.
+    * A throttled call (SlowDown, 503, 429, or a call the client had to retry) multiplies the limit by
+      backoff_ratio, once for the calls started before the previous cut.
+    * Callers over the limit wait in a FIFO queue, and are handed the slots of the calls that return.
+    """
+
+    def __init__(self, initial_limit=DEFAULT_INITIAL_LIMIT, min_limit=DEFAULT_MIN_LIMIT, max_limit=DEFAULT_MAX_LIMIT,
+                 backoff_ratio=DEFAULT_BACKOFF_RATIO, latency_tolerance=DEFAULT_LATENCY_TOLERANCE):
+        """Init AdaptiveLimiter.
+
+        :param int initial_limit: The limit before any call returned
+        :param int min_limit: The lowest limit throttling can cut to
+        :param int max_limit: The highest limit healthy calls can grow to
+        :param float backoff_ratio: The ratio the limit is multiplied by when calls are throttled
+        :param float latency_tolerance: Calls slower than this multiple of the average latency don't grow the limit
+        """
+        for name, value in (("initial_limit", initial_limit), ("min_limit", min_limit), ("max_limit", max_limit)):
+            if not isinstance(value, int) or value < 1:
+                raise ValueError(name + " must be a positive int")
+        if not min_limit <= initial_limit <= max_limit:
+            raise ValueError("initial_limit must be between min_limit and max_limit")
+        if not 0 < backoff_ratio < 1:
+            raise ValueError("backoff_ratio must be between 0 and 1")
+        if latency_tolerance < 1:
+            raise ValueError("latency_tolerance must be at least 1")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.throttled = 0
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._waiters = collections.deque()
+        self._latency = None
+        self._last_backoff = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def stats(self):
+        """Return the current limit, the calls in flight, the callers waiting and the number of throttled calls."""
+        with self._lock:
+            return {"limit": int(self._limit), "in_flight": self._in_flight, "queued": len(self._waiters),
+                    "throttled": self.throttled}
+
+    def acquire(self):
+        """Wait for a slot; returns the time the slot was acquired, to pass to release."""
+        with self._lock:
+            if self._in_flight < int(self._limit) and not self._waiters:
+                self._in_flight += 1
+                return time.perf_counter()
+            waiter = threading.Lock()
+            waiter.acquire()
+            self._waiters.append(waiter)
+        waiter.acquire()  # released by a returning call that hands its slot over
+        return time.perf_counter()
+
+    def release(self, started, throttled=False):
+        """Release the slot of a call, adapting the limit to its latency or throttling.
+
+        :param float started: The time acquire returned
+        :param bool throttled: The call was throttled by the backend
+        """
+        now = time.perf_counter()
+        with self._lock:
+            if throttled:
+                self.throttled += 1
+                if started >= self._last_backoff:
+                    self._limit = max(float(self.min_limit), self._limit * self.backoff_ratio)
+                    self._last_backoff = now
+            else:
+                latency = now - started
+                healthy = self._latency is None or latency <= self._latency * self.latency_tolerance
+                self._latency = latency if self._latency is None else \
+                    self._latency + LATENCY_SMOOTHING * (latency - self._latency)
+                if healthy and self._in_flight >= int(self._limit):
+                    self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+            self._in_flight -= 1
+            while self._waiters and self._in_flight < int(self._limit):
+                self._in_flight += 1
+                self._waiters.popleft().release()
+
+    def wrap(self, method):
+        """Return method, called within a slot of the limiter."""
+        def _limited_call(**kwargs):
+            started = self.acquire()
+            try:
+                res = method(**kwargs)
+            except Exception as e:
+                self.release(started, throttled=is_throttling_error(e))
+                raise
+            self.release(started, throttled=was_retried(res))
+            return res
+        return _limited_call
+
+
+class ConcurrencyLimits(object):
+    """The AdaptiveLimiter of each routed client, created on the client's first call."""
+
+    def __init__(self, settings=None):
+        """Init ConcurrencyLimits.
+
+        :param dict settings: The AdaptiveLimiter arguments of every client
+        """
+        self.settings = dict(settings or {})
+        try:
+            AdaptiveLimiter(**self.settings)
+        except TypeError as e:
+            raise ValueError("invalid concurrency_limit: " + str(e))
+        self._limiters = {}
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, profile, client):
+        """Return the limiter of the client, shared by every profile of the client."""
+        limiter = self._profiles.get(profile)
+        if limiter is not None and limiter[0] is client:
+            return limiter[1]
+        with self._lock:
+            limiter = self._limiters.get(id(client))
+            if limiter is None or limiter[0] is not client:
+                limiter = self._limiters[id(client)] = (client, AdaptiveLimiter(**self.settings))
+            self._profiles[profile] = limiter
+        return limiter[1]
+
+    def stats(self):
+        """Return the stats of the limiter of each profile that was called."""
+        with self._lock:
+            profiles = list(self._profiles.items())
+        return {profile: limiter.stats() for profile, (_, limiter) in profiles}
+
+
+class LimitedPageIterator(PageIteratorWrapper):
+    """Fetches the pages of a page iterator within slots of a limiter."""
+
+    def __init__(self, page_iterator, limiter):
+        super(LimitedPageIterator, self).__init__(page_iterator)
+        self._limiter = limiter
+
+    def __iter__(self):
+        pages = iter(self._page_iterator)
+        while True:
+            started = self._limiter.acquire()
+            try:
+                page = next(pages)
+            except StopIteration:
+                self._limiter.release(started)
+                return
+            except Exception as e:
+                self._limiter.release(started, throttled=is_throttling_error(e))
+                raise
+            self._limiter.release(started, throttled=was_retried(page))
+            yield page
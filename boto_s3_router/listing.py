@@ -0,0 +1,329 @@
+import base64
+import concurrent.futures
+import heapq
+import json
+import queue
+import threading
+
+import jmespath
+
+from boto_s3_router.batch import shutdown_now
+
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_SHARD_DEPTH = 1
+DEFAULT_SHARD_CONCURRENCY = 8
+
+
+def encode_token(start_after):
+    return base64.b64encode(json.dumps({"StartAfter": start_after}).encode("utf-8")).decode("utf-8")
+
+
+def decode_token(token):
+    try:
+        return json.loads(base64.b64decode(token).decode("utf-8"))["StartAfter"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("invalid continuation token: " + str(token))
+
+
+class PageIteratorWrapper(object):
+    """Base of the wrappers of a page iterator.
+
+    Attributes are read from the wrapped page iterator. build_full_result and search run the implementation of the
+    innermost page iterator, under any nested wrappers, over the pages of the wrapper, so they go through its
+    __iter__ (or __aiter__) like a loop would.
+    """
+
+    def __init__(self, page_iterator):
+        self._page_iterator = page_iterator
+
+    def _page_iterator_class(self):
+        page_iterator = self._page_iterator
+        while isinstance(page_iterator, PageIteratorWrapper):
+            page_iterator = page_iterator._page_iterator
+        return type(page_iterator)
+
+    def build_full_result(self):
+        return self._page_iterator_class().build_full_result(self)
+
+    def search(self, expression):
+        return self._page_iterator_class().search(self, expression)
+
+    def __getattr__(self, name):
+        return getattr(self._page_iterator, name)
+
+
+class MergedListing(object):
+    """A list_objects_v2 listing of a bucket prefix that is served by several clients.
+
+    Lists every client whose profile may serve keys under the prefix, un-maps the mapped bucket and prefix of each
+    listing, and merges them in key order into pages that look like the pages of a single list_objects_v2 listing.
+
+    * The first page of every client is fetched concurrently; later pages are fetched when the merge needs them,
+      so at most one page per client is held in memory.
+    * A key is only listed from the client the router would route it to.
+    * Continuation tokens hold the last listed key; resuming lists every client after it.
+    """
+
+    def __init__(self, routes, mapping, kwargs, pagination_config=None):
+        """Init MergedListing.
+
+        :param RoutingIndex routes: The compiled configuration rules for the clients routing
+        :param dict mapping: The mapping between the profiles to the s3 clients
+        :param dict kwargs: The list_objects_v2 arguments
+        :param dict pagination_config: The PaginationConfig of a paginate call: MaxItems, PageSize and StartingToken
+        """
+        pagination_config = pagination_config or {}
+        self.routes = routes
+        self.mapping = mapping
+        self.kwargs = kwargs
+        self.bucket = kwargs["Bucket"]
+        self.prefix = kwargs.get("Prefix") or ""
+        self.delimiter = kwargs.get("Delimiter")
+        self.page_size = pagination_config.get("PageSize") or kwargs.get("MaxKeys") or DEFAULT_PAGE_SIZE
+        self.max_items = pagination_config.get("MaxItems")
+        self.continuation_token = pagination_config.get("StartingToken") or kwargs.get("ContinuationToken")
+        self.start_after = kwargs.get("StartAfter") or ""
+        if self.continuation_token:
+            self.start_after = max(self.start_after, decode_token(self.continuation_token))
+        self.resume_token = None
+        self.list_routes = routes.list_routes(self.bucket, self.prefix)
+
+    def __iter__(self):
+        items = self._items()
+        token = self.continuation_token
+        emitted = 0
+        item = next(items, None)
+        while True:
+            limit = self.page_size
+            if self.max_items is not None:
+                limit = min(limit, self.max_items - emitted)
+            contents = []
+            prefixes = []
+            last = None
+            while item is not None and len(contents) + len(prefixes) < limit:
+                last, is_prefix, entry = item
+                if is_prefix:
+                    prefixes.append(entry)
+                else:
+                    contents.append(entry)
+                item = next(items, None)
+            emitted += len(contents) + len(prefixes)
+            next_token = encode_token(last) if item is not None else None
+            yield self._page(contents, prefixes, token, next_token)
+            if item is None:
+                return
+            if self.max_items is not None and emitted >= self.max_items:
+                self.resume_token = next_token
+                return
+            token = next_token
+
+    def first_page(self):
+        """Return the first page, as returned by list_objects_v2."""
+        return next(iter(self))
+
+    def build_full_result(self):
+        result = {}
+        for page in self:
+            for field in ("Contents", "CommonPrefixes"):
+                if field in page:
+                    result.setdefault(field, []).extend(page[field])
+        if self.resume_token is not None:
+            result["NextToken"] = self.resume_token
+        return result
+
+    def search(self, expression):
+        compiled = jmespath.compile(expression)
+        for page in self:
+            results = compiled.search(page)
+            if isinstance(results, list):
+                for element in results:
+                    yield element
+            else:
+                yield results
+
+    def _page(self, contents, prefixes, token, next_token):
+        page = {"IsTruncated": next_token is not None, "Name": self.bucket, "Prefix": self.prefix,
+                "MaxKeys": self.page_size, "KeyCount": len(contents) + len(prefixes)}
+        if contents:
+            page["Contents"] = contents
+        if prefixes:
+            page["CommonPrefixes"] = prefixes
+        for field in ("Delimiter", "EncodingType", "StartAfter"):
+            if field in self.kwargs:
+                page[field] = self.kwargs[field]
+        if token:
+            page["ContinuationToken"] = token
+        if next_token is not None:
+            page["NextContinuationToken"] = next_token
+        return page
+
+    def _items(self):
+        """Yield the (key, is common prefix, entry) items of all clients, merged in key order."""
+        backends = []
+        for route in self.list_routes:
+            pages = iter(self._paginate(route))
+            backends.append((route, pages))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(backends)) as executor:
+            first_pages = list(executor.map(lambda backend: next(backend[1], None), backends))
+
+        merged = heapq.merge(*[self._backend_items(route, pages, first_page)
+                               for (route, pages), first_page in zip(backends, first_pages)],
+                             key=lambda item: item[0])
+        last_prefix = None
+        for item in merged:
+            if item[1]:
+                if item[0] == last_prefix:  # a common prefix listed by several clients
+                    continue
+                last_prefix = item[0]
+            yield item
+
+    def _paginate(self, route):
+        mapped_prefix = ""
+        bucket = self.bucket
+        prefix = self.prefix
+        client = self.mapping.get("default")
+        if route is not None:
+            client = self.mapping.get(route.profile)
+            bucket = route.mapped_bucket_name or bucket
+            mapped_prefix = route.mapped_prefix or ""
+            # without a delimiter, only the keys under the route's own prefix need to be listed
+            if not self.delimiter and len(route.key_head) > len(prefix) and route.key_head.startswith(prefix):
+                prefix = route.key_head
+        kwargs = {k: v for k, v in self.kwargs.items()
+                  if k not in ("ContinuationToken", "StartAfter", "MaxKeys", "PaginationConfig")}
+        kwargs["Bucket"] = bucket
+        kwargs["Prefix"] = mapped_prefix + prefix
+        if self.start_after:
+            kwargs["StartAfter"] = mapped_prefix + self.start_after
+        return client.get_paginator("list_objects_v2").paginate(PaginationConfig={"PageSize": self.page_size},
+                                                                **kwargs)
+
+    def _backend_items(self, route, pages, page):
+        strip = len(route.mapped_prefix or "") if route is not None else 0
+        while page is not None:
+            keys = [(c["Key"][strip:], False, c) for c in page.get("Contents", ())]
+            prefixes = [(p["Prefix"][strip:], True, p) for p in page.get("CommonPrefixes", ())]
+            for key, is_prefix, entry in heapq.merge(keys, prefixes, key=lambda item: item[0]):
+                if key <= self.start_after:
+                    continue
+                if is_prefix:
+                    if route in self.routes.list_routes(self.bucket, key):
+                        yield key, True, dict(entry, Prefix=key)
+                elif self.routes.lookup(self.bucket, key, True, cached=False) is route:
+                    yield key, False, dict(entry, Key=key)
+            page = next(pages, None)
+
+
+class _ListingClosed(Exception):
+    pass
+
+
+class ShardedListing(object):
+    """A recursive listing of a bucket prefix, split into shards listed concurrently.
+
+    * Shards are discovered with Delimiter listings, down to shard_depth levels below the requested prefix.
+    * Every shard is routed like a list_objects_v2 call with the shard as its prefix, and listed on a worker
+      pool of the client it routes to, so a slow client doesn't hold up the others.
+    * Objects are yielded, under the caller's keys, as pages arrive; their order is not defined.
+    """
+
+    def __init__(self, route_list, mapping, kwargs, shard_depth=DEFAULT_SHARD_DEPTH,
+                 max_concurrency=DEFAULT_SHARD_CONCURRENCY, merged_routes=None):
+        """Init ShardedListing.
+
+        :param route_list: Routes list_objects_v2 kwargs, returning the client to call and the mapped kwargs
+        :param dict mapping: The mapping between the profiles to the s3 clients
+        :param dict kwargs: The list_objects_v2 arguments of the listing; Prefix is the root of the shards
+        :param int shard_depth: The number of Delimiter levels below the prefix to split into shards
+        :param int max_concurrency: The maximum number of shards listed concurrently on each client
+        :param RoutingIndex merged_routes: When set, shards that span several profiles are listed from all of their
+                                           clients, see MergedListing
+        """
+        self.route_list = route_list
+        self.mapping = mapping
+        self.kwargs = {k: v for k, v in kwargs.items() if k not in ("ContinuationToken", "StartAfter", "Delimiter")}
+        self.prefix = kwargs.get("Prefix") or ""
+        self.delimiter = kwargs.get("Delimiter") or "/"
+        self.shard_depth = shard_depth
+        self.max_concurrency = max_concurrency
+        self.merged_routes = merged_routes
+
+    def __iter__(self):
+        results = queue.Queue(maxsize=self.max_concurrency * 4)
+        closed = threading.Event()
+        executors = {}
+        pending = 0
+
+        def put(item):
+            while True:
+                try:
+                    results.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    if closed.is_set():
+                        raise _ListingClosed()
+
+        def list_shard(prefix, depth):
+            if closed.is_set():  # the consumer stopped before the shard was started
+                return
+            try:
+                delimiter = self.delimiter if depth < self.shard_depth else None
+                for page in self._pages(prefix, delimiter):
+                    if page.get("Contents"):
+                        put(("objects", page["Contents"]))
+                    if page.get("CommonPrefixes"):
+                        put(("shards", ([p["Prefix"] for p in page["CommonPrefixes"]], depth + 1)))
+            except _ListingClosed:
+                return
+            except Exception as e:
+                put(("error", e))
+            put(("done", None))
+
+        def submit(prefix, depth):
+            client, _ = self.route_list(dict(self.kwargs, Prefix=prefix))
+            executor = executors.get(id(client))
+            if executor is None:
+                executor = executors[id(client)] = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_concurrency)
+            executor.submit(list_shard, prefix, depth)
+
+        try:
+            submit(self.prefix, 0)
+            pending = 1
+            while pending:
+                kind, value = results.get()
+                if kind == "done":
+                    pending -= 1
+                elif kind == "error":
+                    raise value
+                elif kind == "shards":
+                    prefixes, depth = value
+                    for prefix in prefixes:
+                        submit(prefix, depth)
+                    pending += len(prefixes)
+                else:
+                    for entry in value:
+                        yield entry
+        finally:
+            closed.set()
+            for executor in executors.values():
+                shutdown_now(executor)
+
+    def _pages(self, prefix, delimiter):
+        """Yield the pages of a shard listing, under the caller's keys."""
+        kwargs = dict(self.kwargs, Prefix=prefix)
+        if delimiter is not None:
+            kwargs["Delimiter"] = delimiter
+        if self.merged_routes is not None:
+            listing = MergedListing(self.merged_routes, self.mapping, kwargs)
+            if len(listing.list_routes) > 1:
+                for page in listing:
+                    yield page
+                return
+        client, kwargs = self.route_list(kwargs)
+        strip = len(kwargs["Prefix"]) - len(prefix)
+        for page in client.get_paginator("list_objects_v2").paginate(**kwargs):
+            if strip:
+                page["Contents"] = [dict(c, Key=c["Key"][strip:]) for c in page.get("Contents", ())]
+                page["CommonPrefixes"] = [dict(p, Prefix=p["Prefix"][strip:]) for p in page.get("CommonPrefixes", ())]
+            yield page
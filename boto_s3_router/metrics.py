@@ -0,0 +1,297 @@
+import bisect
+import io
+import threading
+import time
+
+import botocore.exceptions
+
+from boto_s3_router.listing import PageIteratorWrapper
+
+# Upper bounds, in seconds, of the latency histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+# Upper bounds, in bytes per second, of the managed transfer throughput histogram buckets
+THROUGHPUT_BUCKETS = tuple(mib * 1024 * 1024 for mib in (1, 5, 10, 25, 50, 100, 250, 500, 1000)) + (float("inf"),)
+UPLOAD_METHODS = {"upload_file", "upload_fileobj"}
+
+
+def error_code(error):
+    """Return the S3 error code of a ClientError, or the exception type name of other errors."""
+    if isinstance(error, botocore.exceptions.ClientError):
+        return error.response.get("Error", {}).get("Code", "Unknown")
+    return type(error).__name__
+
+
+def request_size(kwargs):
+    """Return the number of bytes sent in the request body, when it's known without reading it: the ContentLength,
+    the length of a bytes or str Body, or the bytes left after the position of a seekable file-like Body."""
+    if "ContentLength" in kwargs:
+        return kwargs["ContentLength"]
+    body = kwargs.get("Body")
+    if isinstance(body, (bytes, bytearray, str)):
+        return len(body)
+    if body is not None and hasattr(body, "seek") and hasattr(body, "tell"):
+        try:
+            position = body.tell()
+            body.seek(0, io.SEEK_END)
+            size = body.tell() - position
+            body.seek(position)
+        except (OSError, ValueError):  # not seekable, or closed
+            return 0
+        return max(size, 0)
+    return 0
+
+
+def response_size(res):
+    """Return the number of bytes in the response body."""
+    if isinstance(res, dict) and "Body" in res:
+        return res.get("ContentLength", 0)
+    return 0
+
+
+class MetricsSink(object):
+    """Receives the router metrics.
+
+    Subclass it to forward the metrics to a monitoring system; record_call is called on the request thread,
+    after every call a client made on behalf of the router, and should return quickly.
+    """
+
+    def record_call(self, profile, operation_name, latency, routing_time, error=None, bytes_in=0, bytes_out=0):
+        """Record a client call.
+
+        :param str profile: The profile the call was routed to; "default" for the default client
+        :param str operation_name: The client method
+        :param float latency: The call duration, in seconds
+        :param float routing_time: The time spent routing the call, in seconds
+        :param str error: The error code of a failed call
+        :param int bytes_in: The number of bytes received in the response body
+        :param int bytes_out: The number of bytes sent in the request body
+        """
+        raise NotImplementedError()
+
+    def record_transfer(self, profile, operation_name, transferred, duration):
+        """Record a completed managed transfer (upload_file, download_file, upload_fileobj, download_fileobj).
+
+        Called in addition to record_call; ignored unless overridden.
+
+        :param str profile: The profile the transfer was routed to; "default" for the default client
+        :param str operation_name: The client method
+        :param int transferred: The number of bytes transferred
+        :param float duration: The transfer duration, in seconds
+        """
+
+
+class Histogram(object):
+    """A fixed-bucket histogram."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q):
+        """Return the upper bound of the bucket holding the q-th percentile (0 < q <= 100)."""
+        if not self.count:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def snapshot(self):
+        return {"count": self.count, "sum": self.sum, "buckets": dict(zip(self.buckets, self.counts)),
+                "p50": self.percentile(50), "p90": self.percentile(90), "p99": self.percentile(99)}
+
+
+class _OperationMetrics(object):
+    __slots__ = ("calls", "errors", "latency", "bytes_in", "bytes_out", "throughput")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = {}
+        self.latency = Histogram()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.throughput = None
+
+
+class InMemoryMetrics(MetricsSink):
+    """A MetricsSink aggregating the metrics in memory, per profile and operation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}
+        self._routing = Histogram()
+
+    def _operation(self, profile, operation_name):
+        metrics = self._operations.get((profile, operation_name))
+        if metrics is None:
+            metrics = self._operations[(profile, operation_name)] = _OperationMetrics()
+        return metrics
+
+    def record_call(self, profile, operation_name, latency, routing_time, error=None, bytes_in=0, bytes_out=0):
+        with self._lock:
+            metrics = self._operation(profile, operation_name)
+            metrics.calls += 1
+            if error is not None:
+                metrics.errors[error] = metrics.errors.get(error, 0) + 1
+            metrics.latency.observe(latency)
+            metrics.bytes_in += bytes_in
+            metrics.bytes_out += bytes_out
+            self._routing.observe(routing_time)
+
+    def record_transfer(self, profile, operation_name, transferred, duration):
+        with self._lock:
+            metrics = self._operation(profile, operation_name)
+            if metrics.throughput is None:
+                metrics.throughput = Histogram(THROUGHPUT_BUCKETS)
+            metrics.throughput.observe(transferred / duration if duration > 0 else float("inf"))
+
+    def snapshot(self):
+        """Return the metrics collected so far.
+
+        :returns: {"profiles": {profile: {operation: {"calls", "errors", "latency", "bytes_in", "bytes_out"}}},
+                   "routing": routing time histogram}; managed transfers also have a "throughput" histogram,
+                   in bytes per second
+        """
+        with self._lock:
+            profiles = {}
+            for (profile, operation_name), metrics in self._operations.items():
+                profiles.setdefault(profile, {})[operation_name] = {
+                    "calls": metrics.calls,
+                    "errors": dict(metrics.errors),
+                    "latency": metrics.latency.snapshot(),
+                    "bytes_in": metrics.bytes_in,
+                    "bytes_out": metrics.bytes_out,
+                }
+                if metrics.throughput is not None:
+                    profiles[profile][operation_name]["throughput"] = metrics.throughput.snapshot()
+            return {"profiles": profiles, "routing": self._routing.snapshot()}
+
+    def reset(self):
+        with self._lock:
+            self._operations = {}
+            self._routing = Histogram()
+
+
+def timed_call(sink, profile, operation_name, method, kwargs, routing_time):
+    """Call the client method, recording the call in the sink."""
+    res = None
+    error = None
+    bytes_out = request_size(kwargs)  # before the call reads a file-like body
+    start = time.perf_counter()
+    try:
+        res = method(**kwargs)
+        return res
+    except Exception as e:
+        error = error_code(e)
+        raise
+    finally:
+        sink.record_call(profile, operation_name, time.perf_counter() - start, routing_time, error=error,
+                         bytes_in=response_size(res), bytes_out=bytes_out)
+
+
+async def async_timed_call(sink, profile, operation_name, method, kwargs, routing_time):
+    """Await the client method, recording the call in the sink."""
+    res = None
+    error = None
+    bytes_out = request_size(kwargs)  # before the call reads a file-like body
+    start = time.perf_counter()
+    try:
+        res = await method(**kwargs)
+        return res
+    except Exception as e:
+        error = error_code(e)
+        raise
+    finally:
+        sink.record_call(profile, operation_name, time.perf_counter() - start, routing_time, error=error,
+                         bytes_in=response_size(res), bytes_out=bytes_out)
+
+
+class _TransferProgress(object):
+    """Counts the bytes of a managed transfer, calling the caller's Callback too."""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.transferred = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, bytes_amount):
+        with self._lock:
+            self.transferred += bytes_amount
+        if self.callback is not None:
+            self.callback(bytes_amount)
+
+
+def timed_transfer(sink, profile, operation_name, method, kwargs, routing_time):
+    """Run a managed transfer, recording the call and its throughput in the sink."""
+    progress = _TransferProgress(kwargs.get("Callback"))
+    kwargs = dict(kwargs, Callback=progress)
+    error = None
+    start = time.perf_counter()
+    try:
+        return method(**kwargs)
+    except Exception as e:
+        error = error_code(e)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        upload = operation_name in UPLOAD_METHODS
+        bytes_in, bytes_out = (0, progress.transferred) if upload else (progress.transferred, 0)
+        sink.record_call(profile, operation_name, duration, routing_time, error=error, bytes_in=bytes_in,
+                         bytes_out=bytes_out)
+        if error is None:
+            sink.record_transfer(profile, operation_name, progress.transferred, duration)
+
+
+class InstrumentedPageIterator(PageIteratorWrapper):
+    """Wraps a page iterator, recording every page fetch as a call of the paginated operation."""
+
+    def __init__(self, page_iterator, sink, profile, operation_name, routing_time):
+        super(InstrumentedPageIterator, self).__init__(page_iterator)
+        self._sink = sink
+        self._profile = profile
+        self._operation_name = operation_name
+        self._routing_time = routing_time
+
+    def __iter__(self):
+        pages = iter(self._page_iterator)
+        routing_time = self._routing_time
+        while True:
+            start = time.perf_counter()
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            except Exception as e:
+                self._sink.record_call(self._profile, self._operation_name, time.perf_counter() - start,
+                                       routing_time, error=error_code(e))
+                raise
+            self._sink.record_call(self._profile, self._operation_name, time.perf_counter() - start, routing_time)
+            routing_time = 0.0
+            yield page
+
+    async def __aiter__(self):
+        pages = self._page_iterator.__aiter__()
+        routing_time = self._routing_time
+        while True:
+            start = time.perf_counter()
+            try:
+                page = await pages.__anext__()
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                self._sink.record_call(self._profile, self._operation_name, time.perf_counter() - start,
+                                       routing_time, error=error_code(e))
+                raise
+            self._sink.record_call(self._profile, self._operation_name, time.perf_counter() - start, routing_time)
+            routing_time = 0.0
+            yield page
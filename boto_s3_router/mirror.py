@@ -0,0 +1,177 @@
+import collections
+import concurrent.futures
+import threading
+import time
+
+from boto_s3_router.metrics import error_code
+
+DEFAULT_MIRROR_CONCURRENCY = 4
+DEFAULT_MIRROR_QUEUE_SIZE = 1000
+MIRROR_RETRIES = 3
+MIRROR_RETRY_DELAY = 0.2
+MAX_RECENT_FAILURES = 100
+# methods whose Body is read into memory before the primary call, so it can be sent to the mirror too
+BODY_METHODS = {"put_object", "upload_part"}
+PART_METHODS = {"upload_part", "upload_part_copy"}
+
+
+def read_body(kwargs):
+    """Replace a file-like Body of the kwargs with its content."""
+    body = kwargs.get("Body")
+    if body is not None and hasattr(body, "read"):
+        kwargs["Body"] = body.read()
+
+
+class _MultipartUpload(object):
+    """The mirror writes of a multipart upload: the future of its creation, and of each of its parts."""
+
+    __slots__ = ("upload_id", "parts")
+
+    def __init__(self, upload_id, parts):
+        self.upload_id = upload_id
+        self.parts = parts
+
+
+class Mirror(object):
+    """Replicates the writes of mirrored profiles to their mirror clients, in the background.
+
+    * Every write that succeeded on the primary client is queued for the mirror client, with its arguments mapped
+      by the mirror profile's own mapped_bucket_name and mapped_prefix;
+      the queue is bounded, so callers wait when the mirrors fall behind by queue_size writes.
+    * Writes of the same object are sent to the mirror in the order they were made; other writes are sent
+      concurrently by concurrency workers.
+    * Multipart uploads are started on the mirror when they are started on the primary; parts, completion and abort
+      use the mirror's own upload id and part ETags.
+    * A failed mirror write is retried MIRROR_RETRIES times, then counted as failed and kept in the recent
+      failures, for reconciliation.
+    """
+
+    def __init__(self, concurrency=DEFAULT_MIRROR_CONCURRENCY, queue_size=DEFAULT_MIRROR_QUEUE_SIZE):
+        """Init Mirror.
+
+        :param int concurrency: The number of writes sent to the mirrors concurrently
+        :param int queue_size: The maximum number of writes waiting for or being sent to the mirrors
+        """
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.mirrored = 0
+        self.failed = 0
+        self.retries = 0
+        self.recent_failures = collections.deque(maxlen=MAX_RECENT_FAILURES)
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._last_writes = {}
+        self._uploads = {}
+
+    def stats(self):
+        """Return a snapshot of the mirror counters: writes pending, mirrored, failed after retries and retried."""
+        with self._lock:
+            return {"pending": self._pending, "mirrored": self.mirrored, "failed": self.failed,
+                    "retries": self.retries, "recent_failures": list(self.recent_failures)}
+
+    def flush(self, timeout=None):
+        """Wait until every queued write was sent to its mirror.
+
+        :param float timeout: The maximum number of seconds to wait
+        :returns: whether the queue was drained
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self):
+        """Drain the queue and stop the workers."""
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def submit(self, client, operation_name, kwargs, response, call=None):
+        """Queue a write that succeeded on the primary client for the mirror client.
+
+        :param client: The mirror client
+        :param str operation_name: The client method
+        :param dict kwargs: The arguments of the primary call, mapped for the mirror profile
+        :param dict response: The primary call response
+        :param call: Sends the write to the mirror, given the kwargs; the client method if not set
+        """
+        self._slots.acquire()
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency)
+            self._pending += 1
+            upload_key = (id(client), kwargs.get("UploadId"))
+            upload = self._uploads.get(upload_key)
+            if upload is not None:
+                upload = _MultipartUpload(upload.upload_id, dict(upload.parts))
+            if operation_name == "delete_objects":
+                object_keys = [(id(client), kwargs["Bucket"], obj["Key"]) for obj in kwargs["Delete"]["Objects"]]
+            elif operation_name in PART_METHODS or operation_name == "create_multipart_upload":
+                object_keys = []
+            else:
+                object_keys = [(id(client), kwargs.get("Bucket"), kwargs.get("Key"))]
+            after = [self._last_writes[k] for k in object_keys if k in self._last_writes]
+            future = self._executor.submit(self._send, client, operation_name, kwargs, after, upload, call)
+
+            for object_key in object_keys:
+                self._last_writes[object_key] = future
+            if operation_name == "create_multipart_upload":
+                self._uploads[(id(client), response["UploadId"])] = _MultipartUpload(future, {})
+            elif operation_name in PART_METHODS and upload is not None:
+                self._uploads[upload_key].parts[kwargs["PartNumber"]] = future
+            elif operation_name in ("complete_multipart_upload", "abort_multipart_upload"):
+                self._uploads.pop(upload_key, None)
+        future.add_done_callback(lambda f: self._done(f, object_keys))
+
+    def _send(self, client, operation_name, kwargs, after, upload, call):
+        # the writes waited for were submitted earlier, so they are running or done: waiting can't deadlock.
+        # An earlier write of the same object is waited for to keep the order, even when it failed
+        concurrent.futures.wait(after)
+        kwargs = dict(kwargs)
+        if operation_name in PART_METHODS or operation_name in ("complete_multipart_upload",
+                                                                 "abort_multipart_upload"):
+            if upload is None or upload.upload_id.exception() is not None:
+                raise ValueError("multipart upload " + str(kwargs.get("UploadId")) + " was not started on the mirror")
+            kwargs["UploadId"] = upload.upload_id.result()["UploadId"]
+        if operation_name == "complete_multipart_upload":
+            if any(part.exception() is not None for part in upload.parts.values()):
+                raise ValueError("multipart upload " + kwargs["UploadId"] + " has parts that were not mirrored")
+            parts = [upload.parts[part_number].result() for part_number in sorted(upload.parts)]
+            kwargs["MultipartUpload"] = {"Parts": parts}
+
+        if call is None:
+            call = getattr(client, operation_name)
+        attempt = 0
+        while True:
+            try:
+                res = call(**kwargs)
+                break
+            except Exception:
+                if attempt == MIRROR_RETRIES:
+                    raise
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                time.sleep(MIRROR_RETRY_DELAY * 2 ** (attempt - 1))
+        if operation_name in PART_METHODS:
+            etag = res["ETag"] if operation_name == "upload_part" else res["CopyPartResult"]["ETag"]
+            return {"PartNumber": kwargs["PartNumber"], "ETag": etag}
+        return res
+
+    def _done(self, future, object_keys):
+        with self._lock:
+            for object_key in object_keys:
+                if self._last_writes.get(object_key) is future:
+                    del self._last_writes[object_key]
+            error = future.exception()
+            if error is None:
+                self.mirrored += 1
+            else:
+                self.failed += 1
+                self.recent_failures.append({"Error": error_code(error), "Message": str(error)})
+            self._pending -= 1
+            if self._pending == 0:
+                self._idle.notify_all()
+        self._slots.release()
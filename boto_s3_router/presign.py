@@ -0,0 +1,116 @@
+import functools
+import hashlib
+import hmac
+from urllib.parse import urlsplit, parse_qsl
+
+from botocore.utils import percent_encode
+
+SIGV4_ALGORITHM = "AWS4-HMAC-SHA256"
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+# the presign params a url can be signed from another url of the same bucket for
+PRESIGN_TEMPLATE_ARGS = {"Bucket", "Key"}
+DEFAULT_PRESIGN_EXPIRES = 3600
+SIGNING_KEY_CACHE_SIZE = 64
+
+
+@functools.lru_cache(maxsize=SIGNING_KEY_CACHE_SIZE)
+def _signing_key(secret_key, date, region, service):
+    key = ("AWS4" + secret_key).encode("utf-8")
+    for msg in (date, region, service, "aws4_request"):
+        key = hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+    return key
+
+
+def _frozen_credentials(client):
+    credentials = getattr(getattr(client, "_request_signer", None), "_credentials", None)
+    return credentials.get_frozen_credentials() if credentials is not None else None
+
+
+class UrlSigner(object):
+    """Presigns the urls of other keys of a bucket like a SigV4 url presigned by the client.
+
+    The signer reuses the url's endpoint, signing time, expiry and credential scope, so presigning a key takes a
+    single HMAC with the cached signing key, instead of resolving the endpoint and signing the request with botocore.
+    """
+
+    def __init__(self, http_method, url_prefix, path_prefix, host, query, string_to_sign_prefix, signing_key):
+        self.http_method = http_method
+        self.url_prefix = url_prefix
+        self.path_prefix = path_prefix
+        self.host = host
+        self.query = query
+        self.string_to_sign_prefix = string_to_sign_prefix
+        self.signing_key = signing_key
+
+    @classmethod
+    def from_url(cls, client, url, key, http_method):
+        """Return a signer of the urls of the bucket of url, a SigV4 url the client presigned for key.
+
+        Returns None when the url can't be reproduced: it isn't signed with SigV4, or its signature doesn't match the
+        signer's.
+        """
+        parts = urlsplit(url)
+        query = parse_qsl(parts.query, keep_blank_values=True)
+        auth = dict(query)
+        if auth.get("X-Amz-Algorithm") != SIGV4_ALGORITHM or auth.get("X-Amz-SignedHeaders") != "host":
+            return None
+        quoted_key = percent_encode(key, safe="/~")
+        if not parts.path.endswith(quoted_key) or not parts.query.endswith("&X-Amz-Signature=" +
+                                                                           auth["X-Amz-Signature"]):
+            return None
+        credentials = _frozen_credentials(client)
+        access_key, _, scope = auth["X-Amz-Credential"].partition("/")
+        scope_parts = scope.split("/")
+        if credentials is None or credentials.access_key != access_key or len(scope_parts) != 4:
+            return None
+
+        date, region, service, _ = scope_parts
+        pairs = [pair for pair in parts.query.split("&") if not pair.startswith("X-Amz-Signature=")]
+        path_prefix = parts.path[:len(parts.path) - len(quoted_key)]
+        signer = cls(http_method.upper(), parts.scheme + "://" + parts.netloc, path_prefix, parts.netloc,
+                     "&".join(pairs), "\n".join((SIGV4_ALGORITHM, auth["X-Amz-Date"], scope)) + "\n",
+                     _signing_key(credentials.secret_key, date, region, service))
+        if signer.sign(key) != url:
+            return None
+        return signer
+
+    def sign(self, key):
+        """Return the presigned url of the key."""
+        path = self.path_prefix + percent_encode(key, safe="/~")
+        canonical_query = "&".join(sorted(self.query.split("&")))
+        canonical_request = "\n".join((self.http_method, path, canonical_query, "host:" + self.host + "\n", "host",
+                                       UNSIGNED_PAYLOAD))
+        string_to_sign = self.string_to_sign_prefix + hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()
+        signature = hmac.new(self.signing_key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+        return self.url_prefix + path + "?" + self.query + "&X-Amz-Signature=" + signature
+
+
+def generate_presigned_urls(client, client_method, params, expires_in=DEFAULT_PRESIGN_EXPIRES, http_method=None):
+    """Presign the client_method call of each of params with the client.
+
+    The first url of each bucket is presigned by the client; the other urls of the bucket with only Bucket and Key
+    params are signed like it, by a UrlSigner. Other urls are presigned by the client.
+
+    :returns: the urls, in the order of params
+    """
+    if http_method is None:
+        operation_name = client.meta.method_to_api_mapping.get(client_method)
+        if operation_name is None:
+            raise ValueError("unknown client method " + str(client_method))
+        http_method = client.meta.service_model.operation_model(operation_name).http["method"]
+    signers = {}
+    urls = []
+    for call_params in params:
+        signer = None
+        if PRESIGN_TEMPLATE_ARGS.issuperset(call_params) and "Key" in call_params:
+            signer = signers.get(call_params.get("Bucket"))
+        if signer is not None:
+            urls.append(signer.sign(call_params["Key"]))
+            continue
+        url = client.generate_presigned_url(client_method, Params=call_params, ExpiresIn=expires_in,
+                                            HttpMethod=http_method)
+        if PRESIGN_TEMPLATE_ARGS.issuperset(call_params) and "Key" in call_params and \
+                call_params.get("Bucket") not in signers:
+            signers[call_params.get("Bucket")] = UrlSigner.from_url(client, url, call_params["Key"], http_method)
+        urls.append(url)
+    return urls
@@ -0,0 +1,440 @@
+import collections
+import fnmatch
+import os
+import re
+
+_MAGIC_CHARS = re.compile(r"[*?\[]")
+_MISS = object()
+
+
+def _has_magic(pattern):
+    return _MAGIC_CHARS.search(pattern) is not None
+
+
+class Route(object):
+    """A compiled routing profile.
+
+    :param int order: The position of the profile in the configuration; lower orders win
+    :param str profile: The profile name, used to look up the client in the client mapping
+    :param dict rules: The profile configuration
+    """
+
+    __slots__ = ("order", "profile", "keyed", "key_kind", "key_head", "mapped_bucket_name", "mapped_prefix")
+
+    def __init__(self, order, profile, rules):
+        self.order = order
+        self.profile = profile
+        self.keyed = "source_key_pattern" in rules
+        self.mapped_bucket_name = rules.get("mapped_bucket_name")
+        self.mapped_prefix = rules.get("mapped_prefix")
+        # key_head is the literal part of the key pattern, before its first wildcard
+        key_pattern = rules.get("source_key_pattern")
+        if key_pattern is None or key_pattern == "*":
+            self.key_kind, self.key_head = "any", ""
+            return
+        key_pattern = os.path.normcase(key_pattern)
+        m = _MAGIC_CHARS.search(key_pattern)
+        if m is None:
+            self.key_kind, self.key_head = "exact", key_pattern
+        elif m.start() == len(key_pattern) - 1 and key_pattern.endswith("*"):
+            self.key_kind, self.key_head = "prefix", key_pattern[:-1]
+        else:
+            self.key_kind, self.key_head = "pattern", key_pattern[:m.start()]
+
+    def overlap(self, prefix):
+        """Return whether some keys starting with the prefix may match the route, and whether all of them do.
+
+        :param str prefix: A normalized key prefix
+        """
+        if self.key_kind == "any":
+            return True, True
+        if self.key_kind == "exact":
+            return self.key_head.startswith(prefix), False
+        if prefix.startswith(self.key_head):
+            return True, self.key_kind == "prefix"
+        return self.key_head.startswith(prefix), False
+
+
+class ProfileRoute(object):
+    """The client of a profile a request is also sent to, such as a fallback or a mirror, with the bucket and
+    prefix mapping of that profile."""
+
+    __slots__ = ("profile", "client", "mapped_bucket_name", "mapped_prefix")
+
+    def __init__(self, profile, client, mapped_bucket_name=None, mapped_prefix=None):
+        self.profile = profile
+        self.client = client
+        self.mapped_bucket_name = mapped_bucket_name
+        self.mapped_prefix = mapped_prefix
+
+    @classmethod
+    def from_config(cls, profile, mapping, config):
+        """Return the route of a profile of the mapping, mapped by its rules in config, if it has any."""
+        rules = config.get(profile, {})
+        return cls(profile, mapping[profile], rules.get("mapped_bucket_name"), rules.get("mapped_prefix"))
+
+    def key(self, key):
+        """Return an original key, mapped for the profile."""
+        return key if self.mapped_prefix is None else self.mapped_prefix + key
+
+    def params(self, params, original, key_param):
+        """Return the routed params with the bucket and key of the original params mapped for the profile."""
+        params = dict(params)
+        if "Bucket" in original:
+            params["Bucket"] = self.mapped_bucket_name or original["Bucket"]
+        if key_param in original:
+            params[key_param] = self.key(original[key_param])
+        return params
+
+
+class _TrieNode(object):
+    __slots__ = ("children", "route")
+
+    def __init__(self):
+        self.children = {}
+        self.route = None
+
+
+class _KeyRoutes(object):
+    """The routes sharing a single bucket pattern, indexed by their key pattern.
+
+    * Routes without a key pattern match any key.
+    * Literal keys are kept in a hash lookup.
+    * Literal prefixes (``prefix/*``) are kept in a character trie.
+    * Any other key pattern is matched with its own compiled regex.
+    """
+
+    def __init__(self):
+        self.routes = []
+        self.first = None
+        self.any_key = None
+        self.exact = {}
+        self.trie = None
+        self.trie_depth = 0
+        self.regexes = []
+
+    @property
+    def prefix_length(self):
+        """The length of the key prefix that decides the route, or None when a route matches whole keys."""
+        if self.exact or self.regexes:
+            return None
+        return self.trie_depth
+
+    def add(self, route, key_pattern):
+        self.routes.append(route)
+        if self.first is None:
+            self.first = route
+        if key_pattern is None:
+            if self.any_key is None:
+                self.any_key = route
+            return
+        key_pattern = os.path.normcase(key_pattern)
+        if not _has_magic(key_pattern):
+            self.exact.setdefault(key_pattern, route)
+            return
+        prefix = key_pattern[:-1]
+        if key_pattern.endswith("*") and not _has_magic(prefix):
+            if prefix == "":
+                if self.any_key is None:
+                    self.any_key = route
+                return
+            if self.trie is None:
+                self.trie = _TrieNode()
+            self.trie_depth = max(self.trie_depth, len(prefix))
+            node = self.trie
+            for char in prefix:
+                node = node.children.setdefault(char, _TrieNode())
+            if node.route is None:
+                node.route = route
+            return
+        self.regexes.append((route, re.compile(fnmatch.translate(key_pattern))))
+
+    def match(self, key, has_key):
+        """Return the first route matching the key, or None."""
+        if not has_key:
+            return self.first
+        best = self.any_key
+        if self.exact:
+            route = self.exact.get(key)
+            if route is not None and (best is None or route.order < best.order):
+                best = route
+        if self.trie is not None:
+            node = self.trie
+            for char in key:
+                node = node.children.get(char)
+                if node is None:
+                    break
+                route = node.route
+                if route is not None and (best is None or route.order < best.order):
+                    best = route
+        for route, regex in self.regexes:
+            if best is not None and route.order >= best.order:
+                break
+            if regex.match(key):
+                best = route
+                break
+        return best
+
+
+class _WildcardBucket(object):
+    __slots__ = ("pattern", "regex", "routes")
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.regex = re.compile(fnmatch.translate(pattern))
+        self.routes = _KeyRoutes()
+
+
+class _KeyPrefix(object):
+    """The cache entry of a bucket whose routing decisions depend on the key.
+
+    Decisions are cached per bucket and key prefix of this length; None means they can't be cached by prefix.
+    """
+
+    __slots__ = ("length",)
+
+    def __init__(self, length):
+        self.length = length
+
+
+class RouteCache(object):
+    """A bounded LRU cache of routing decisions.
+
+    Decisions that don't depend on the key (the first profile matching the bucket has no key pattern) are cached
+    once per bucket. When the key patterns of the bucket are all prefixes (``prefix/*``), decisions are cached per
+    bucket and key prefix, as long as the longest of these prefixes; keys sharing it are routed alike. Decisions of
+    buckets with literal keys or other key patterns are not cached, as each key would take its own entry.
+    The cache takes no locks: under concurrent use an entry may be evicted twice or computed twice, and the
+    counters are approximate.
+    """
+
+    def __init__(self, maxsize):
+        """Init RouteCache.
+
+        :param int maxsize: The maximum number of cached decisions
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """Return a snapshot of the cache counters."""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self._entries),
+                "maxsize": self.maxsize, "hit_rate": self.hit_rate}
+
+    def clear(self):
+        self._entries.clear()
+
+    def _get(self, cache_key):
+        entries = self._entries
+        route = entries.get(cache_key, _MISS)
+        if route is not _MISS:
+            try:
+                entries.move_to_end(cache_key)
+            except KeyError:
+                pass
+        return route
+
+    def get(self, bucket, key):
+        """Return the cached route, None for the default client, or _MISS."""
+        route = self._get(bucket)
+        if route.__class__ is _KeyPrefix:
+            if key is None:
+                route = self._get((bucket, None))
+            elif route.length is None:
+                route = _MISS
+            else:
+                route = self._get((bucket, key[:route.length]))
+        if route is _MISS:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return route
+
+    def key_prefix_length(self, bucket):
+        """Return the cached key prefix length of a bucket whose decisions depend on the key, or _MISS."""
+        entry = self._entries.get(bucket)
+        return entry.length if entry.__class__ is _KeyPrefix else _MISS
+
+    def put(self, bucket, key, route, key_prefix_length=0):
+        """Cache the route of the bucket and key.
+
+        :param int key_prefix_length: The length of the key prefix the route depends on; 0 when it doesn't depend on
+                                      the key, None when it can't be cached by prefix
+        """
+        entries = self._entries
+        if key_prefix_length == 0:
+            entries[bucket] = route
+        else:
+            if entries.get(bucket).__class__ is not _KeyPrefix:
+                entries[bucket] = _KeyPrefix(key_prefix_length)
+            if key is None:
+                entries[(bucket, None)] = route
+            elif key_prefix_length is not None:
+                entries[(bucket, key[:key_prefix_length])] = route
+        while len(entries) > self.maxsize:
+            try:
+                entries.popitem(last=False)
+            except KeyError:
+                break
+            self.evictions += 1
+
+
+class RoutingIndex(object):
+    """Routing rules compiled from the botos3router profiles.
+
+    Resolves a bucket and key to the first matching profile in configuration order, the same
+    profile a linear ``fnmatch`` scan over the profiles would return:
+
+    * Literal bucket names are resolved with a hash lookup.
+    * Wildcard bucket patterns are resolved with a single precompiled regex holding all of them.
+    * Within a bucket pattern, keys are resolved as described in :class:`_KeyRoutes`.
+    * Resolved decisions are kept in a :class:`RouteCache`, unless the cache size is 0.
+    """
+
+    def __init__(self, config, cache_size=0):
+        """Init RoutingIndex.
+
+        :param dict[dict] config: The configuration rules for the clients routing
+        :param int cache_size: The maximum number of routing decisions to cache; 0 disables the cache
+        """
+        self.cache = RouteCache(cache_size) if cache_size else None
+        self.routes = []
+        self._exact = {}
+        self._wildcards = []
+        wildcards_by_pattern = {}
+        for order, profile in enumerate(config):
+            rules = config[profile]
+            route = Route(order, profile, rules)
+            self.routes.append(route)
+            bucket_pattern = os.path.normcase(rules["source_bucket_pattern"])
+            if not _has_magic(bucket_pattern):
+                key_routes = self._exact.get(bucket_pattern)
+                if key_routes is None:
+                    key_routes = self._exact[bucket_pattern] = _KeyRoutes()
+            else:
+                wildcard = wildcards_by_pattern.get(bucket_pattern)
+                if wildcard is None:
+                    wildcard = wildcards_by_pattern[bucket_pattern] = _WildcardBucket(bucket_pattern)
+                    self._wildcards.append(wildcard)
+                key_routes = wildcard.routes
+            key_routes.add(route, rules.get("source_key_pattern"))
+
+        self._wildcards_regex = None
+        if self._wildcards:
+            self._wildcards_regex = re.compile("|".join(
+                "(?P<w%d>%s)" % (i, fnmatch.translate(wildcard.pattern)) for i, wildcard in enumerate(self._wildcards)))
+
+    def __len__(self):
+        return len(self.routes)
+
+    def lookup(self, bucket, key=None, has_key=False, cached=True):
+        """Return the first route matching the bucket and key, or None if the default client should be used.
+
+        :param str bucket: The requested bucket name
+        :param str key: The requested key or prefix
+        :param bool has_key: Whether the request holds a key; when it doesn't, key patterns are ignored
+        :param bool cached: Whether to use the routing cache; one-off lookups shouldn't evict hot decisions
+        """
+        cache = self.cache
+        if cache is None or not cached:
+            return self._lookup(bucket, key, has_key)[0]
+        if not has_key:
+            key = None
+        route = cache.get(bucket, key)
+        if route is _MISS:
+            route, key_dependent = self._lookup(bucket, key, has_key)
+            key_prefix_length = 0
+            if key_dependent:
+                key_prefix_length = cache.key_prefix_length(bucket)
+                if key_prefix_length is _MISS:
+                    key_prefix_length = self._key_prefix_length(bucket)
+            cache.put(bucket, key, route, key_prefix_length)
+        return route
+
+    def list_routes(self, bucket, prefix):
+        """Return the routes that may serve keys starting with the prefix, in configuration order.
+
+        None stands for the default client. Routes shadowed by an earlier route matching every key under
+        the prefix are left out.
+
+        :param str bucket: The requested bucket name
+        :param str prefix: The requested prefix
+        """
+        bucket = os.path.normcase(bucket)
+        prefix = os.path.normcase(prefix)
+        routes = []
+        key_routes = self._exact.get(bucket)
+        if key_routes is not None:
+            routes.extend(key_routes.routes)
+        for wildcard in self._wildcards:
+            if wildcard.regex.match(bucket):
+                routes.extend(wildcard.routes.routes)
+        routes.sort(key=lambda r: r.order)
+
+        candidates = []
+        for route in routes:
+            overlap, covers = route.overlap(prefix)
+            if overlap:
+                candidates.append(route)
+            if covers:
+                return candidates
+        candidates.append(None)
+        return candidates
+
+    def _key_prefix_length(self, bucket):
+        """Return the length of the key prefix deciding the routes of the bucket, or None if there is none."""
+        bucket = os.path.normcase(bucket)
+        key_routes = [wildcard.routes for wildcard in self._wildcards if wildcard.regex.match(bucket)]
+        if bucket in self._exact:
+            key_routes.append(self._exact[bucket])
+        length = 0
+        for routes in key_routes:
+            routes_length = routes.prefix_length
+            if routes_length is None:
+                return None
+            length = max(length, routes_length)
+        return length
+
+    def _lookup(self, bucket, key, has_key):
+        """Return the first matching route, and whether a different key could have changed it."""
+        bucket = os.path.normcase(bucket)
+        if has_key:
+            key = os.path.normcase(key)
+        best = None
+        first_match = None
+        key_routes = self._exact.get(bucket)
+        if key_routes is not None:
+            best = key_routes.match(key, has_key)
+            first_match = key_routes.first
+        m = None
+        if self._wildcards_regex is not None:
+            m = self._wildcards_regex.match(bucket)
+        if m is None:
+            return best, first_match is not None and first_match.keyed
+        # The combined regex finds the first wildcard pattern matching the bucket; later patterns only need
+        # to be checked when the key patterns of earlier ones didn't match.
+        first = int(m.lastgroup[1:])
+        first_wildcard = self._wildcards[first].routes.first
+        if first_match is None or first_wildcard.order < first_match.order:
+            first_match = first_wildcard
+        for i in range(first, len(self._wildcards)):
+            wildcard = self._wildcards[i]
+            if best is not None and wildcard.routes.first.order >= best.order:
+                break
+            if i != first and not wildcard.regex.match(bucket):
+                continue
+            route = wildcard.routes.match(key, has_key)
+            if route is not None and (best is None or route.order < best.order):
+                best = route
+        return best, first_match.keyed
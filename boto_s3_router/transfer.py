@@ -0,0 +1,278 @@
+import asyncio
+import concurrent.futures
+import math
+import re
+from urllib.parse import urlencode
+
+import botocore.exceptions
+from boto3.s3.transfer import TransferConfig
+
+MAX_PARTS = 10000
+_CONTENT_RANGE = re.compile(r"bytes \d+-\d+/(\d+)")
+
+# copy arguments that apply to the source object, and their get_object counterparts
+_SOURCE_ARGS = {
+    "CopySourceIfMatch": "IfMatch",
+    "CopySourceIfModifiedSince": "IfModifiedSince",
+    "CopySourceIfNoneMatch": "IfNoneMatch",
+    "CopySourceIfUnmodifiedSince": "IfUnmodifiedSince",
+    "CopySourceSSECustomerAlgorithm": "SSECustomerAlgorithm",
+    "CopySourceSSECustomerKey": "SSECustomerKey",
+    "CopySourceSSECustomerKeyMD5": "SSECustomerKeyMD5",
+    "ExpectedSourceBucketOwner": "ExpectedBucketOwner",
+}
+
+# get_object response fields that are copied to the destination object unless MetadataDirective is REPLACE
+_METADATA_FIELDS = ("CacheControl", "ContentDisposition", "ContentEncoding", "ContentLanguage", "ContentType",
+                    "Expires", "Metadata")
+
+# put_object / complete_multipart_upload response fields returned as part of the copy_object response
+_RESULT_FIELDS = ("Expiration", "VersionId", "ServerSideEncryption", "SSECustomerAlgorithm", "SSECustomerKeyMD5",
+                  "SSEKMSKeyId", "BucketKeyEnabled", "RequestCharged", "ResponseMetadata")
+
+
+def _operation_args(client, operation_name, args):
+    """Return the arguments the client's operation accepts."""
+    members = client.meta.service_model.operation_model(operation_name).input_shape.members
+    return {k: v for k, v in args.items() if k in members}
+
+
+def _source_args(copy_source, args):
+    """Split copy arguments into the get_object arguments of the source and the remaining destination arguments."""
+    args = dict(args or {})
+    get_args = {"Bucket": copy_source["Bucket"], "Key": copy_source["Key"]}
+    if "VersionId" in copy_source:
+        get_args["VersionId"] = copy_source["VersionId"]
+    for arg, get_arg in _SOURCE_ARGS.items():
+        if arg in args:
+            get_args[get_arg] = args.pop(arg)
+    if "RequestPayer" in args:
+        get_args["RequestPayer"] = args["RequestPayer"]
+    return get_args, args
+
+
+def _dest_args(source, args, bucket, key):
+    """Return the destination arguments, and whether the source tags should be copied."""
+    dest_args = dict(args, Bucket=bucket, Key=key)
+    metadata_directive = dest_args.pop("MetadataDirective", "COPY")
+    tagging_directive = dest_args.pop("TaggingDirective", "COPY")
+    if metadata_directive != "REPLACE":
+        for field in _METADATA_FIELDS:
+            if field in source:
+                dest_args[field] = source[field]
+    return dest_args, tagging_directive != "REPLACE" and bool(source.get("TagCount"))
+
+
+def _object_size(source, data):
+    m = _CONTENT_RANGE.match(source.get("ContentRange", ""))
+    return int(m.group(1)) if m else len(data)
+
+
+def _part_ranges(start, size, chunksize):
+    """Yield the part numbers and byte ranges of the parts following a first part of start bytes."""
+    part_size = max(chunksize, int(math.ceil((size - start) / float(MAX_PARTS - 1))))
+    for part_number, offset in enumerate(range(start, size, part_size), 2):
+        yield part_number, "bytes=%d-%d" % (offset, min(offset + part_size, size) - 1)
+
+
+def _copy_response(source, result):
+    response = {"CopyObjectResult": {"ETag": result["ETag"]}}
+    if "VersionId" in source:
+        response["CopySourceVersionId"] = source["VersionId"]
+    for field in _RESULT_FIELDS:
+        if field in result:
+            response[field] = result[field]
+    return response
+
+
+def _is_invalid_range(error):
+    # S3 rejects any range on an empty object
+    return error.response.get("Error", {}).get("Code") == "InvalidRange"
+
+
+def transfer_config(settings):
+    """Return the TransferConfig of a transfer_config setting: a TransferConfig, or a dict of its arguments
+    (multipart_threshold, multipart_chunksize, max_concurrency, max_bandwidth, ...)."""
+    if isinstance(settings, TransferConfig):
+        return settings
+    if not isinstance(settings, dict):
+        raise TypeError("Invalid transfer_config type: " + str(type(settings)) + " expected dict or TransferConfig")
+    try:
+        return TransferConfig(**settings)
+    except TypeError as e:
+        raise ValueError("invalid transfer_config: " + str(e))
+
+
+class StreamingCopy(object):
+    """Copies an object between two clients.
+
+    The object is read from the source client with ranged get_object calls and written to the destination client,
+    so the copy works between different S3-compatible services without staging it on local disk.
+
+    * Objects up to the config's multipart_threshold are copied with a single put_object.
+    * Larger objects are copied with a multipart upload, each part read and uploaded by one of max_concurrency
+      workers, so at most max_concurrency parts are held in memory regardless of the object size.
+    """
+
+    def __init__(self, source_client, dest_client, config=None, callback=None):
+        """Init StreamingCopy.
+
+        :param source_client: The boto client to read the object from
+        :param dest_client: The boto client to write the object to
+        :param boto3.s3.transfer.TransferConfig config: The part size, threshold and concurrency of the copy
+        :param callback: Called with the number of bytes copied after each part
+        """
+        self.source_client = source_client
+        self.dest_client = dest_client
+        self.config = config or TransferConfig()
+        self.callback = callback
+
+    def copy(self, copy_source, bucket, key, args=None):
+        """Copy the source object, returning a copy_object-like response.
+
+        :param dict copy_source: The source object: Bucket, Key and optional VersionId
+        :param str bucket: The destination bucket
+        :param str key: The destination key
+        :param dict args: copy_object arguments, other than CopySource, Bucket and Key
+        """
+        get_args, args = _source_args(copy_source, args)
+        first_size = max(self.config.multipart_threshold, self.config.multipart_chunksize)
+        try:
+            source = self.source_client.get_object(Range="bytes=0-%d" % (first_size - 1), **get_args)
+        except botocore.exceptions.ClientError as e:
+            if not _is_invalid_range(e):
+                raise
+            source = self.source_client.get_object(**get_args)
+        data = source["Body"].read()
+        size = _object_size(source, data)
+
+        dest_args, copy_tags = _dest_args(source, args, bucket, key)
+        if copy_tags:
+            tagging = self.source_client.get_object_tagging(
+                **_operation_args(self.source_client, "GetObjectTagging", get_args))
+            dest_args["Tagging"] = urlencode([(t["Key"], t["Value"]) for t in tagging["TagSet"]])
+
+        if size == len(data):
+            result = self.dest_client.put_object(
+                Body=data, **_operation_args(self.dest_client, "PutObject", dest_args))
+            self._report(len(data))
+        else:
+            # pin the source object, so a concurrent overwrite fails the copy instead of mixing two versions
+            get_args["IfMatch"] = source["ETag"]
+            result = self._multipart_copy(get_args, dest_args, data, size)
+        return _copy_response(source, result)
+
+    def _multipart_copy(self, get_args, dest_args, first_part, size):
+        dest = self.dest_client
+        upload_id = dest.create_multipart_upload(
+            **_operation_args(dest, "CreateMultipartUpload", dest_args))["UploadId"]
+        part_args = _operation_args(dest, "UploadPart", dest_args)
+        part_args["UploadId"] = upload_id
+
+        start = len(first_part)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.config.max_concurrency)
+        futures = [executor.submit(self._upload_part, part_args, 1, first_part)]
+        del first_part
+        for part_number, byte_range in _part_ranges(start, size, self.config.multipart_chunksize):
+            futures.append(executor.submit(self._copy_part, get_args, part_args, part_number, byte_range))
+        try:
+            parts = [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+            dest.abort_multipart_upload(Bucket=dest_args["Bucket"], Key=dest_args["Key"], UploadId=upload_id)
+            raise
+        executor.shutdown(wait=True)
+
+        complete_args = _operation_args(dest, "CompleteMultipartUpload", dest_args)
+        return dest.complete_multipart_upload(UploadId=upload_id, MultipartUpload={"Parts": parts}, **complete_args)
+
+    def _copy_part(self, get_args, part_args, part_number, byte_range):
+        data = self.source_client.get_object(Range=byte_range, **get_args)["Body"].read()
+        return self._upload_part(part_args, part_number, data)
+
+    def _upload_part(self, part_args, part_number, data):
+        res = self.dest_client.upload_part(PartNumber=part_number, Body=data, **part_args)
+        self._report(len(data))
+        return {"PartNumber": part_number, "ETag": res["ETag"]}
+
+    def _report(self, transferred):
+        if self.callback is not None:
+            self.callback(transferred)
+
+
+class AsyncStreamingCopy(StreamingCopy):
+    """StreamingCopy between two asyncio (aiobotocore) clients.
+
+    Parts are copied by concurrent tasks, at most max_concurrency of them holding a part at a time.
+    """
+
+    async def copy(self, copy_source, bucket, key, args=None):
+        get_args, args = _source_args(copy_source, args)
+        first_size = max(self.config.multipart_threshold, self.config.multipart_chunksize)
+        try:
+            source = await self.source_client.get_object(Range="bytes=0-%d" % (first_size - 1), **get_args)
+        except botocore.exceptions.ClientError as e:
+            if not _is_invalid_range(e):
+                raise
+            source = await self.source_client.get_object(**get_args)
+        data = await source["Body"].read()
+        size = _object_size(source, data)
+
+        dest_args, copy_tags = _dest_args(source, args, bucket, key)
+        if copy_tags:
+            tagging = await self.source_client.get_object_tagging(
+                **_operation_args(self.source_client, "GetObjectTagging", get_args))
+            dest_args["Tagging"] = urlencode([(t["Key"], t["Value"]) for t in tagging["TagSet"]])
+
+        if size == len(data):
+            result = await self.dest_client.put_object(
+                Body=data, **_operation_args(self.dest_client, "PutObject", dest_args))
+            self._report(len(data))
+        else:
+            get_args["IfMatch"] = source["ETag"]
+            result = await self._multipart_copy(get_args, dest_args, data, size)
+        return _copy_response(source, result)
+
+    async def _multipart_copy(self, get_args, dest_args, first_part, size):
+        dest = self.dest_client
+        upload_id = (await dest.create_multipart_upload(
+            **_operation_args(dest, "CreateMultipartUpload", dest_args)))["UploadId"]
+        part_args = _operation_args(dest, "UploadPart", dest_args)
+        part_args["UploadId"] = upload_id
+
+        semaphore = asyncio.Semaphore(self.config.max_concurrency)
+        start = len(first_part)
+        tasks = [asyncio.ensure_future(self._upload_part(semaphore, part_args, 1, first_part))]
+        del first_part
+        for part_number, byte_range in _part_ranges(start, size, self.config.multipart_chunksize):
+            tasks.append(asyncio.ensure_future(
+                self._copy_part(semaphore, get_args, part_args, part_number, byte_range)))
+        try:
+            parts = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await dest.abort_multipart_upload(Bucket=dest_args["Bucket"], Key=dest_args["Key"], UploadId=upload_id)
+            raise
+
+        complete_args = _operation_args(dest, "CompleteMultipartUpload", dest_args)
+        return await dest.complete_multipart_upload(UploadId=upload_id, MultipartUpload={"Parts": list(parts)},
+                                                    **complete_args)
+
+    async def _copy_part(self, semaphore, get_args, part_args, part_number, byte_range):
+        async with semaphore:
+            res = await self.source_client.get_object(Range=byte_range, **get_args)
+            data = await res["Body"].read()
+            return await self._send_part(part_args, part_number, data)
+
+    async def _upload_part(self, semaphore, part_args, part_number, data):
+        async with semaphore:
+            return await self._send_part(part_args, part_number, data)
+
+    async def _send_part(self, part_args, part_number, data):
+        res = await self.dest_client.upload_part(PartNumber=part_number, Body=data, **part_args)
+        self._report(len(data))
+        return {"PartNumber": part_number, "ETag": res["ETag"]}
@@ -21,6 +21,10 @@ REQUIRES = [
     "fnmatch2",
 ]
 
+EXTRAS_REQUIRE = {
+    "aio": ["aiobotocore"],
+}
+
 setup(
     name=NAME,
     version=os.getenv('VERSION', '0.0.1'),
@@ -33,6 +37,7 @@ setup(
     keywords=["boto", "boto3", "lakeFS", "minio", "AWS", "s3", "router"],
     python_requires=">=3.6",
     install_requires=REQUIRES,
+    extras_require=EXTRAS_REQUIRE,
     packages=find_packages(exclude="tests"),
     include_package_data=True,
 )
@@ -0,0 +1,30 @@
+import unittest
+
+import boto3
+from botocore.stub import Stubber
+
+
+def create_s3_client(**kwargs):
+    return boto3.client("s3", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test",
+                        **kwargs)
+
+
+class StubbedClientsTestCase(unittest.TestCase):
+    """A test case with a stubbed s3 client for each name of clients: setUp sets the client as the attribute of its
+    name, and its activated Stubber as <name>_stub; tearDown asserts that every stubbed response was used."""
+
+    clients = ("s3", "minio")
+
+    def setUp(self):
+        self.stubs = []
+        for name in self.clients:
+            client = create_s3_client()
+            stub = Stubber(client)
+            stub.activate()
+            setattr(self, name, client)
+            setattr(self, name + "_stub", stub)
+            self.stubs.append(stub)
+
+    def tearDown(self):
+        for stub in self.stubs:
+            stub.assert_no_pending_responses()
@@ -0,0 +1,106 @@
+import unittest
+
+import botocore.exceptions
+import pytest
+
+aiobotocore = pytest.importorskip("aiobotocore")
+
+from aiobotocore.session import get_session  # noqa: E402
+from aiobotocore.stub import AioStubber  # noqa: E402
+
+import boto_s3_router.aio  # noqa: E402
+
+
+class TestAsyncRouter(unittest.IsolatedAsyncioTestCase):
+    profiles = {
+        "minio": {
+            "source_bucket_pattern": "bucket-a",
+            "source_key_pattern": "a/*",
+            "mapped_bucket_name": "minio-bucket",
+            "mapped_prefix": "main/"
+        },
+    }
+
+    async def asyncSetUp(self):
+        session = get_session()
+        self.s3 = await session.create_client("s3", region_name="us-east-1", aws_access_key_id="test",
+                                              aws_secret_access_key="test").__aenter__()
+        self.minio = await session.create_client("s3", region_name="us-east-1", aws_access_key_id="test",
+                                                 aws_secret_access_key="test").__aenter__()
+        self.s3_stub = AioStubber(self.s3)
+        self.minio_stub = AioStubber(self.minio)
+        self.s3_stub.activate()
+        self.minio_stub.activate()
+        self.router = boto_s3_router.aio.client({"minio": self.minio, "default": self.s3}, self.profiles)
+
+    async def asyncTearDown(self):
+        self.s3_stub.assert_no_pending_responses()
+        self.minio_stub.assert_no_pending_responses()
+        await self.router.close()
+
+    async def test_api_call(self):
+        self.minio_stub.add_response("head_object", {"ContentLength": 1}, {"Bucket": "minio-bucket", "Key": "main/a/1"})
+        self.s3_stub.add_response("head_object", {"ContentLength": 2}, {"Bucket": "bucket-a", "Key": "b/1"})
+        self.assertEqual((await self.router.head_object(Bucket="bucket-a", Key="a/1"))["ContentLength"], 1)
+        self.assertEqual((await self.router.head_object(Bucket="bucket-a", Key="b/1"))["ContentLength"], 2)
+
+    async def test_list_and_paginate(self):
+        self.minio_stub.add_response("list_objects_v2", {"Contents": [{"Key": "main/a/1"}]},
+                                     {"Bucket": "minio-bucket", "Prefix": "main/a/"})
+        self.minio_stub.add_response("list_objects_v2", {"Contents": [{"Key": "main/a/1"}]},
+                                     {"Bucket": "minio-bucket", "Prefix": "main/a/"})
+        res = await self.router.list_objects_v2(Bucket="bucket-a", Prefix="a/")
+        self.assertEqual(res["Contents"], [{"Key": "main/a/1"}])
+        paginator = self.router.get_paginator(operation_name="list_objects_v2")
+        pages = [page async for page in paginator.paginate(Bucket="bucket-a", Prefix="a/")]
+        self.assertEqual(len(pages), 1)
+
+    async def test_delete_objects(self):
+        self.minio_stub.add_response("delete_objects", {"Deleted": [{"Key": "main/a/1"}]},
+                                     {"Bucket": "minio-bucket", "Delete": {"Objects": [{"Key": "main/a/1"}]}})
+        self.s3_stub.add_response("delete_objects", {"Deleted": [{"Key": "b/1"}]},
+                                  {"Bucket": "bucket-a", "Delete": {"Objects": [{"Key": "b/1"}]}})
+        res = await self.router.delete_objects(Bucket="bucket-a", Delete={"Objects": [{"Key": "a/1"}, {"Key": "b/1"}]})
+        self.assertEqual(sorted(d["Key"] for d in res["Deleted"]), ["a/1", "b/1"])
+
+    async def test_delete_objects_errors(self):
+        self.minio_stub.add_client_error("delete_objects", service_error_code="AccessDenied", service_message="no")
+        self.s3_stub.add_response("delete_objects", {"Deleted": [{"Key": "b/1"}]})
+        res = await self.router.delete_objects(Bucket="bucket-a", Delete={"Objects": [{"Key": "a/1"}, {"Key": "b/1"}]})
+        self.assertEqual(res["Errors"], [{"Key": "a/1", "Code": "AccessDenied", "Message": "no"}])
+        self.minio_stub.add_client_error("delete_objects", service_error_code="AccessDenied")
+        with self.assertRaises(botocore.exceptions.ClientError):
+            await self.router.delete_objects(Bucket="bucket-a", Delete={"Objects": [{"Key": "a/1"}]})
+        self.minio_stub.add_client_error("delete_objects", service_error_code="AccessDenied")
+        self.s3_stub.add_client_error("delete_objects", service_error_code="AccessDenied")
+        with self.assertRaises(botocore.exceptions.ClientError):
+            await self.router.delete_objects(Bucket="bucket-a", Delete={"Objects": [{"Key": "a/1"}, {"Key": "b/1"}]})
+
+    async def test_metrics(self):
+        router = boto_s3_router.aio.client({"minio": self.minio, "default": self.s3}, self.profiles, metrics=True)
+        self.minio_stub.add_response("list_objects_v2", {"Contents": [{"Key": "main/a/1"}]},
+                                     {"Bucket": "minio-bucket", "Prefix": "main/a/"})
+        self.s3_stub.add_client_error("head_object", service_error_code="404", http_status_code=404)
+        paginator = router.get_paginator(operation_name="list_objects_v2")
+        pages = [page async for page in paginator.paginate(Bucket="bucket-a", Prefix="a/")]
+        self.assertEqual(len(pages), 1)
+        with self.assertRaises(botocore.exceptions.ClientError):
+            await router.head_object(Bucket="bucket-a", Key="b/1")
+        profiles = router.metrics.snapshot()["profiles"]
+        self.assertEqual(profiles["minio"]["list_objects_v2"]["calls"], 1)
+        self.assertEqual(profiles["default"]["head_object"]["errors"], {"404": 1})
+
+        self.minio_stub.add_response("list_objects_v2", {"Contents": [{"Key": "main/a/2"}]},
+                                     {"Bucket": "minio-bucket", "Prefix": "main/a/"})
+        result = await paginator.paginate(Bucket="bucket-a", Prefix="a/").build_full_result()
+        self.assertEqual(result["Contents"], [{"Key": "main/a/2"}])
+        self.assertEqual(router.metrics.snapshot()["profiles"]["minio"]["list_objects_v2"]["calls"], 2)
+
+    async def test_copy_between_clients(self):
+        with self.assertRaises(ValueError):
+            await self.router.copy_object(CopySource={"Bucket": "bucket-a", "Key": "a/1"}, Bucket="bucket-a", Key="b/1")
+
+    def test_rejects_sync_clients(self):
+        import boto3
+        with self.assertRaises(TypeError):
+            boto_s3_router.aio.client({"default": boto3.client("s3", region_name="us-east-1")}, {})
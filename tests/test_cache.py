@@ -0,0 +1,196 @@
+import collections
+import io
+import shutil
+import tempfile
+import threading
+import time
+
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+import boto_s3_router
+from boto_s3_router.cache import ObjectCache, CachedBody, MetadataCache
+from tests.helpers import StubbedClientsTestCase
+
+
+def object_response(data, etag='"e1"'):
+    return {"Body": StreamingBody(io.BytesIO(data), len(data)), "ContentLength": len(data), "ETag": etag,
+            "ContentType": "text/plain"}
+
+
+class TestObjectCache(StubbedClientsTestCase):
+    clients = ("s3", "lakefs")
+
+    def setUp(self):
+        super(TestObjectCache, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(TestObjectCache, self).tearDown()
+        shutil.rmtree(self.directory)
+
+    def create_router(self, object_cache):
+        profiles = {"lakefs": {"source_bucket_pattern": "repo", "object_cache": object_cache}}
+        return boto_s3_router.client({"lakefs": self.lakefs, "default": self.s3}, profiles)
+
+    def test_read_through(self):
+        cache = ObjectCache(self.directory, max_size=1024)
+        router = self.create_router(cache)
+        self.lakefs_stub.add_response("get_object", object_response(b"hello world"), {"Bucket": "repo", "Key": "k"})
+        self.lakefs_stub.add_client_error("get_object", service_error_code="304", http_status_code=304,
+                                          expected_params={"Bucket": "repo", "Key": "k", "IfNoneMatch": '"e1"'})
+
+        res = router.get_object(Bucket="repo", Key="k", Range="bytes=6-")
+        self.assertEqual(res["Body"].read(), b"world")
+        self.assertEqual(res["ContentRange"], "bytes 6-10/11")
+        res = router.get_object(Bucket="repo", Key="k")
+        with res["Body"] as body:
+            self.assertEqual(bytes(body.getbuffer()), b"hello world")
+        self.assertEqual((res["ContentLength"], res["ContentType"]), (11, "text/plain"))
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (1, 1, 11))
+
+    def test_concurrent_stats(self):
+        cache = ObjectCache(self.directory, max_size=1024, validate=False)
+
+        def read():
+            for _ in range(200):
+                res = cache.get_object(lambda **kwargs: object_response(b"data"), {"Bucket": "repo", "Key": "k"})
+                res["Body"].close()
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = cache.stats()
+        self.assertEqual(stats["hits"] + stats["misses"], 1600)
+        self.assertEqual(cache.hit_rate, stats["hit_rate"])
+
+    def test_close_with_held_view(self):
+        path = self.directory + "/object"
+        with open(path, "wb") as f:
+            f.write(b"hello world")
+        body = CachedBody(path, 0, 11)
+        header = body.getbuffer()[:5]
+        body.close()
+        self.assertEqual(bytes(header), b"hello")
+        self.assertEqual(body.read(), b"")
+        header.release()
+
+    def test_changed_object(self):
+        router = self.create_router(ObjectCache(self.directory, max_size=1024))
+        self.lakefs_stub.add_response("get_object", object_response(b"v1"))
+        self.lakefs_stub.add_response("get_object", object_response(b"v2", etag='"e2"'),
+                                      {"Bucket": "repo", "Key": "k", "IfNoneMatch": '"e1"'})
+        self.assertEqual(router.get_object(Bucket="repo", Key="k")["Body"].read(), b"v1")
+        self.assertEqual(router.get_object(Bucket="repo", Key="k")["Body"].read(), b"v2")
+
+    def test_invalidation_and_eviction(self):
+        cache = ObjectCache(self.directory, max_size=10, validate=False)
+        router = self.create_router(cache)
+        self.lakefs_stub.add_response("get_object", object_response(b"123456"))
+        self.lakefs_stub.add_response("get_object", object_response(b"abcdef"))
+        self.lakefs_stub.add_response("put_object", {"ETag": '"e2"'})
+        router.get_object(Bucket="repo", Key="a")
+        router.get_object(Bucket="repo", Key="b")
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertEqual(router.get_object(Bucket="repo", Key="b")["Body"].read(), b"abcdef")
+        router.put_object(Bucket="repo", Key="b", Body=b"new")
+        self.assertEqual(cache.stats()["invalidations"], 1)
+        self.assertEqual(cache.stats()["objects"], 0)
+
+    def test_uncached_calls(self):
+        router = self.create_router(ObjectCache(self.directory, max_size=1024))
+        self.lakefs_stub.add_response("get_object", object_response(b"data"),
+                                      {"Bucket": "repo", "Key": "k", "PartNumber": 1})
+        self.s3_stub.add_response("get_object", object_response(b"data"), {"Bucket": "other", "Key": "k"})
+        router.get_object(Bucket="repo", Key="k", PartNumber=1)
+        router.get_object(Bucket="other", Key="k")
+        with self.assertRaises(TypeError):
+            self.create_router({"directory": self.directory})
+
+
+class TestMetadataCache(StubbedClientsTestCase):
+    profiles = {"minio": {"source_bucket_pattern": "bucket-a", "mapped_bucket_name": "minio-bucket"}}
+
+    def create_router(self, **kwargs):
+        return boto_s3_router.client({"minio": self.minio, "default": self.s3}, self.profiles, **kwargs)
+
+    def test_head_object(self):
+        router = self.create_router(metadata_cache_size=10)
+        self.minio_stub.add_response("head_object", {"ContentLength": 1, "Metadata": {"a": "b"}},
+                                     {"Bucket": "minio-bucket", "Key": "k"})
+        self.assertEqual(router.head_object(Bucket="bucket-a", Key="k")["ContentLength"], 1)
+        res = router.head_object(Bucket="bucket-a", Key="k")
+        self.assertEqual(res["Metadata"], {"a": "b"})
+        res["Metadata"]["a"] = "c"
+        self.assertEqual(router.head_object(Bucket="bucket-a", Key="k")["Metadata"], {"a": "b"})
+
+        self.minio_stub.add_response("put_object", {"ETag": "e"})
+        self.minio_stub.add_response("head_object", {"ContentLength": 2})
+        router.put_object(Bucket="bucket-a", Key="k", Body=b"ab")
+        self.assertEqual(router.head_object(Bucket="bucket-a", Key="k")["ContentLength"], 2)
+        self.assertEqual(router.metadata_cache.stats()["hits"], 2)
+
+    def test_cached_missing_object(self):
+        router = self.create_router(metadata_cache_size=10)
+        self.s3_stub.add_client_error("head_object", service_error_code="404", service_message="Not Found",
+                                      http_status_code=404)
+        for _ in range(2):
+            with self.assertRaises(ClientError) as cm:
+                router.head_object(Bucket="bucket-b", Key="k")
+            self.assertEqual(cm.exception.response["Error"]["Code"], "404")
+            self.assertEqual(cm.exception.operation_name, "HeadObject")
+
+        self.s3_stub.add_response("delete_objects", {"Deleted": [{"Key": "k"}]})
+        self.s3_stub.add_client_error("head_object", service_error_code="404", http_status_code=404)
+        router.delete_objects(Bucket="bucket-b", Delete={"Objects": [{"Key": "k"}]})
+        with self.assertRaises(ClientError):
+            router.head_object(Bucket="bucket-b", Key="k")
+
+    def test_delete_racing_with_head_object(self):
+        router = self.create_router(metadata_cache_size=10)
+        self.s3_stub.add_response("delete_objects", {"Deleted": [{"Key": "k"}]})
+        self.s3_stub.add_response("head_object", {"ContentLength": 1})
+        self.s3_stub.add_client_error("head_object", service_error_code="404", http_status_code=404)
+        # a head_object answered before the delete returns sees the object that is being deleted
+        self.s3.meta.events.register("after-call.s3.DeleteObjects",
+                                     lambda **kwargs: router.head_object(Bucket="bucket-b", Key="k"))
+        router.delete_objects(Bucket="bucket-b", Delete={"Objects": [{"Key": "k"}]})
+        with self.assertRaises(ClientError):
+            router.head_object(Bucket="bucket-b", Key="k")
+
+    def test_invalidation_of_other_keys(self):
+        cache = MetadataCache(10)
+        generation = cache.generation(self.s3, "bucket", "k1")
+        cache.invalidate(self.s3, "bucket", "k2")
+        cache.put(self.s3, "bucket", "k1", {"ContentLength": 1}, generation)
+        self.assertEqual(cache.get(self.s3, "bucket", "k1"), {"ContentLength": 1})
+
+        generation = cache.generation(self.s3, "bucket", "k1")
+        cache.invalidate(self.s3, "bucket", "k1")
+        cache.put(self.s3, "bucket", "k1", {"ContentLength": 2}, generation)
+        self.assertIsNone(cache.get(self.s3, "bucket", "k1"))
+
+    def test_put_racing_with_invalidate(self):
+        class RacingEntries(collections.OrderedDict):
+            def __setitem__(self, key, value):
+                super(RacingEntries, self).__setitem__(key, value)
+                self.pop(key)  # invalidated by another thread before the entry is moved to the end
+
+        cache = MetadataCache(10)
+        cache._entries = RacingEntries()
+        cache.put(self.s3, "bucket", "k", {"ContentLength": 1}, cache.generation(self.s3, "bucket", "k"))
+        self.assertIsNone(cache.get(self.s3, "bucket", "k"))
+
+    def test_populated_by_get_object_and_expires(self):
+        router = self.create_router(metadata_cache_size=10, metadata_cache_ttl=0.05)
+        self.s3_stub.add_response("get_object", object_response(b"data"))
+        self.s3_stub.add_response("head_object", {"ContentLength": 4})
+        router.get_object(Bucket="bucket-b", Key="k")
+        self.assertEqual(router.head_object(Bucket="bucket-b", Key="k")["ETag"], '"e1"')
+        time.sleep(0.1)
+        self.assertNotIn("ETag", router.head_object(Bucket="bucket-b", Key="k"))
+        self.assertIsNone(self.create_router().metadata_cache)
@@ -138,8 +138,8 @@ class Test(unittest.TestCase):
                 },
             ]
         })
-        self.assertEqual(res["Deleted"][0]["Key"], "test/1.txt")
-        self.assertEqual(res["Deleted"][1]["Key"], "test/2.txt")
+        self.assertEqual(res["Deleted"][0]["Key"], "1.txt")
+        self.assertEqual(res["Deleted"][1]["Key"], "2.txt")
 
     def test_paginator(self):
         self.minio2.create_bucket(Bucket="test-paginator")
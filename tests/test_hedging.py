@@ -0,0 +1,127 @@
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+import boto_s3_router
+from boto_s3_router.hedging import Hedging, Fallbacks, HEDGE_MIN_SAMPLES
+from tests.helpers import StubbedClientsTestCase
+
+
+class TestHedging(StubbedClientsTestCase):
+    def create_router(self, **profile):
+        profiles = {"minio": dict({"source_bucket_pattern": "bucket-a", "mapped_bucket_name": "minio-bucket",
+                                   "fallback": "s3"}, **profile)}
+        return boto_s3_router.client({"minio": self.minio, "s3": self.s3, "default": self.s3}, profiles)
+
+    def test_failover(self):
+        router = self.create_router()
+        self.minio_stub.add_client_error("head_object", service_error_code="InternalError", http_status_code=500)
+        self.s3_stub.add_response("head_object", {"ContentLength": 1}, {"Bucket": "bucket-a", "Key": "k"})
+        self.assertEqual(router.head_object(Bucket="bucket-a", Key="k")["ContentLength"], 1)
+
+        self.minio_stub.add_client_error("head_object", service_error_code="404", http_status_code=404)
+        with self.assertRaises(ClientError):
+            router.head_object(Bucket="bucket-a", Key="k")
+
+        self.minio_stub.add_client_error("list_objects_v2", service_error_code="SlowDown", http_status_code=503)
+        self.s3_stub.add_response("list_objects_v2", {"KeyCount": 0}, {"Bucket": "bucket-a", "Prefix": "p/"})
+        self.assertEqual(router.list_objects_v2(Bucket="bucket-a", Prefix="p/")["KeyCount"], 0)
+
+        self.minio_stub.add_client_error("list_objects_v2", service_error_code="SlowDown", http_status_code=503)
+        self.s3_stub.add_response("list_objects_v2", {"Contents": [{"Key": "p/1"}]},
+                                  {"Bucket": "bucket-a", "Prefix": "p/"})
+        pages = router.get_paginator(operation_name="list_objects_v2").paginate(Bucket="bucket-a", Prefix="p/")
+        self.assertEqual([obj["Key"] for page in pages for obj in page["Contents"]], ["p/1"])
+
+        self.minio_stub.add_client_error("list_objects_v2", service_error_code="SlowDown", http_status_code=503)
+        self.s3_stub.add_response("list_objects_v2", {"Contents": [{"Key": "p/2"}]},
+                                  {"Bucket": "bucket-a", "Prefix": "p/"})
+        pages = router.get_paginator(operation_name="list_objects_v2").paginate(Bucket="bucket-a", Prefix="p/")
+        self.assertEqual(pages.build_full_result()["Contents"], [{"Key": "p/2"}])
+
+        stats = router.hedging.stats()["minio"]
+        self.assertEqual((stats["calls"], stats["failovers"], stats["hedged"]), (3, 4, 0))
+
+    def test_failover_full_result_with_metrics(self):
+        for concurrency_limit in (None, True):
+            router = boto_s3_router.client(
+                {"minio": self.minio, "s3": self.s3, "default": self.s3},
+                {"minio": {"source_bucket_pattern": "bucket-a", "mapped_bucket_name": "minio-bucket",
+                           "fallback": "s3"}}, metrics=True, concurrency_limit=concurrency_limit)
+            for _ in range(2):
+                self.minio_stub.add_client_error("list_objects_v2", service_error_code="SlowDown",
+                                                 http_status_code=503)
+                self.s3_stub.add_response("list_objects_v2", {"Contents": [{"Key": "p/1"}]},
+                                          {"Bucket": "bucket-a", "Prefix": "p/"})
+            paginator = router.get_paginator(operation_name="list_objects_v2")
+            pages = paginator.paginate(Bucket="bucket-a", Prefix="p/")
+            self.assertEqual(pages.build_full_result()["Contents"], [{"Key": "p/1"}])
+            pages = paginator.paginate(Bucket="bucket-a", Prefix="p/")
+            self.assertEqual(list(pages.search("Contents[].Key")), ["p/1"])
+            self.assertEqual(router.hedging.stats()["minio"]["failovers"], 2)
+
+    def test_hedged_read(self):
+        router = self.create_router(hedge_after=0.02)
+        self.minio.meta.events.register("provide-client-params.s3.HeadObject", lambda **kwargs: time.sleep(0.3))
+        self.minio_stub.add_response("head_object", {"ContentLength": 1}, {"Bucket": "minio-bucket", "Key": "k"})
+        self.s3_stub.add_response("head_object", {"ContentLength": 2}, {"Bucket": "bucket-a", "Key": "k"})
+
+        start = time.perf_counter()
+        self.assertEqual(router.head_object(Bucket="bucket-a", Key="k")["ContentLength"], 2)
+        self.assertLess(time.perf_counter() - start, 0.3)
+        stats = router.hedging.stats()["minio"]
+        self.assertEqual((stats["hedged"], stats["hedge_wins"], stats["deadline"]), (1, 1, 0.02))
+        time.sleep(0.4)  # let the losing call consume its stubbed response
+
+    def test_reads_not_limited_by_hedge_pool(self):
+        hedging = Hedging(concurrency=1)
+        fallbacks = Fallbacks([], hedge_after=1)
+        threads = [threading.Thread(target=hedging.call, args=("minio", fallbacks, [lambda: time.sleep(0.2)]))
+                   for _ in range(4)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLess(time.perf_counter() - start, 0.4)
+
+    def test_primary_pool_bounded(self):
+        hedging = Hedging(concurrency=1, primary_concurrency=2)
+        fallbacks = Fallbacks([], hedge_after=1)
+        ran_on = []
+
+        def read():
+            ran_on.append(threading.current_thread())
+            time.sleep(0.1)
+
+        callers = [threading.Thread(target=hedging.call, args=("minio", fallbacks, [read])) for _ in range(4)]
+        for thread in callers:
+            thread.start()
+        for thread in callers:
+            thread.join()
+        for _ in range(10):
+            hedging.call("minio", fallbacks, [read])
+        # the reads beyond the pool run on their callers' threads, and the pool threads are reused
+        self.assertLessEqual(len(set(ran_on) - set(callers) - {threading.current_thread()}), 2)
+        self.assertEqual(len(ran_on), 14)
+
+    def test_adaptive_deadline(self):
+        hedging = Hedging()
+        fallbacks = Fallbacks([], hedge_after="p50")
+        for _ in range(HEDGE_MIN_SAMPLES - 1):
+            self.assertEqual(hedging.call("minio", fallbacks, [lambda: "primary"]), "primary")
+        self.assertIsNone(hedging.stats()["minio"]["deadline"])
+        hedging.call("minio", fallbacks, [lambda: "primary"])
+        self.assertIsNotNone(hedging.stats()["minio"]["deadline"])
+
+    def test_invalid_config(self):
+        for profile in ({"fallback": "missing"}, {"fallback": "minio"}, {"hedge_after": "fast"},
+                        {"hedge_after": -1}):
+            with self.assertRaises(ValueError):
+                self.create_router(**profile)
+        with self.assertRaises(TypeError):
+            self.create_router(fallback=[])
+        with self.assertRaises(ValueError):
+            boto_s3_router.client({"minio": self.minio, "default": self.s3},
+                                  {"minio": {"source_bucket_pattern": "bucket-a", "hedge_after": 1}})
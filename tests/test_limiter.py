@@ -0,0 +1,103 @@
+import threading
+import time
+import unittest
+
+from botocore.exceptions import ClientError
+
+import boto_s3_router
+from boto_s3_router.limiter import AdaptiveLimiter
+from tests.helpers import StubbedClientsTestCase
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    def test_increase_and_backoff(self):
+        limiter = AdaptiveLimiter(initial_limit=2, max_limit=3)
+        for _ in range(10):
+            started = [limiter.acquire() for _ in range(limiter.limit)]
+            for s in started:
+                limiter.release(s)
+        self.assertEqual(limiter.limit, 3)
+
+        first, second = limiter.acquire(), limiter.acquire()
+        limiter.release(first, throttled=True)
+        # a call started before the cut doesn't cut again
+        limiter.release(second, throttled=True)
+        self.assertEqual(limiter.stats(), {"limit": 1, "in_flight": 0, "queued": 0, "throttled": 2})
+
+    def test_queued_callers(self):
+        limiter = AdaptiveLimiter(initial_limit=1, max_limit=1)
+        started = limiter.acquire()
+        order = []
+
+        def _call(i):
+            call_started = limiter.acquire()
+            order.append(i)
+            limiter.release(call_started)
+
+        threads = [threading.Thread(target=_call, args=(i,)) for i in range(3)]
+        for i, thread in enumerate(threads):
+            thread.start()
+            while limiter.stats()["queued"] < i + 1:
+                time.sleep(0.001)
+        limiter.release(started)
+        for thread in threads:
+            thread.join(timeout=5)
+        self.assertEqual(order, [0, 1, 2])
+        self.assertEqual(limiter.stats()["in_flight"], 0)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            AdaptiveLimiter(initial_limit=0)
+        with self.assertRaises(ValueError):
+            AdaptiveLimiter(initial_limit=10, max_limit=5)
+
+
+class TestConcurrencyLimit(StubbedClientsTestCase):
+    def setUp(self):
+        super(TestConcurrencyLimit, self).setUp()
+        self.router = boto_s3_router.client({"minio": self.minio, "default": self.s3},
+                                            {"minio": {"source_bucket_pattern": "bucket-a"}},
+                                            concurrency_limit={"initial_limit": 8})
+
+    def test_throttled_client(self):
+        self.minio_stub.add_client_error("get_object", service_error_code="SlowDown", http_status_code=503)
+        self.s3_stub.add_response("head_object", {"ContentLength": 1})
+        with self.assertRaises(ClientError):
+            self.router.get_object(Bucket="bucket-a", Key="k")
+        self.router.head_object(Bucket="bucket-b", Key="k")
+
+        stats = self.router.concurrency_limits.stats()
+        self.assertEqual(stats["minio"], {"limit": 4, "in_flight": 0, "queued": 0, "throttled": 1})
+        self.assertEqual(stats["default"]["limit"], 8)
+
+    def test_paginator(self):
+        self.minio_stub.add_response("list_objects_v2", {"Contents": [{"Key": "1"}], "IsTruncated": True,
+                                                         "NextContinuationToken": "t"})
+        self.minio_stub.add_response("list_objects_v2", {"Contents": [{"Key": "2"}], "IsTruncated": False})
+        pages = self.router.get_paginator(operation_name="list_objects_v2").paginate(Bucket="bucket-a")
+        for _ in pages:
+            self.assertEqual(self.router.concurrency_limits.stats()["minio"]["in_flight"], 0)
+        with self.assertRaises(ValueError):
+            boto_s3_router.client({"default": self.s3}, {}, concurrency_limit={"limit": 1})
+
+    def test_paginator_full_result(self):
+        self.minio_stub.add_response("list_objects_v2", {"Contents": [{"Key": "1"}], "IsTruncated": True,
+                                                         "NextContinuationToken": "t"})
+        self.minio_stub.add_client_error("list_objects_v2", service_error_code="SlowDown", http_status_code=503)
+        pages = self.router.get_paginator(operation_name="list_objects_v2").paginate(Bucket="bucket-a")
+        with self.assertRaises(ClientError):
+            pages.build_full_result()
+        self.assertEqual(self.router.concurrency_limits.stats()["minio"],
+                         {"limit": 4, "in_flight": 0, "queued": 0, "throttled": 1})
+
+    def test_paginator_full_result_with_metrics(self):
+        router = boto_s3_router.client({"minio": self.minio, "default": self.s3},
+                                       {"minio": {"source_bucket_pattern": "bucket-a"}}, metrics=True,
+                                       concurrency_limit=True)
+        for _ in range(2):
+            self.minio_stub.add_response("list_objects_v2", {"Contents": [{"Key": "1"}]})
+        pages = router.get_paginator(operation_name="list_objects_v2").paginate(Bucket="bucket-a")
+        self.assertEqual(pages.build_full_result()["Contents"], [{"Key": "1"}])
+        pages = router.get_paginator(operation_name="list_objects_v2").paginate(Bucket="bucket-a")
+        self.assertEqual(list(pages.search("Contents[].Key")), ["1"])
+        self.assertEqual(router.metrics.snapshot()["profiles"]["minio"]["list_objects_v2"]["calls"], 2)
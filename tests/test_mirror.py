@@ -0,0 +1,170 @@
+import io
+from unittest import mock
+
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+from botocore.stub import ANY
+
+import boto_s3_router
+from tests.helpers import StubbedClientsTestCase
+
+
+class TestMirror(StubbedClientsTestCase):
+    clients = ("s3", "minio", "other")
+    profiles = {"s3": {"source_bucket_pattern": "bucket-a", "mapped_bucket_name": "mapped", "mirror": "minio"}}
+
+    def setUp(self):
+        super(TestMirror, self).setUp()
+        self.router = boto_s3_router.client({"s3": self.s3, "minio": self.minio, "default": self.other},
+                                            self.profiles, mirror_concurrency=1)
+
+    def tearDown(self):
+        self.assertTrue(self.router.mirror.flush(timeout=10))
+        super(TestMirror, self).tearDown()
+
+    def add_write_responses(self, stub, bucket, prefix=""):
+        stub.add_response("put_object", {"ETag": "e"}, {"Bucket": bucket, "Key": prefix + "k", "Body": b"data"})
+        stub.add_response("copy_object", {}, {"Bucket": bucket, "Key": prefix + "k2",
+                                              "CopySource": {"Bucket": bucket, "Key": prefix + "k"}})
+        stub.add_response("delete_object", {}, {"Bucket": bucket, "Key": prefix + "k"})
+        stub.add_response("delete_objects", {"Deleted": [{"Key": prefix + "k2"}]},
+                          {"Bucket": bucket, "Delete": {"Objects": [{"Key": prefix + "k2"}]}})
+
+    def test_writes(self):
+        # the mirror profile has no mapping of its own: the mirror writes use the original bucket and key
+        self.add_write_responses(self.s3_stub, "mapped")
+        self.add_write_responses(self.minio_stub, "bucket-a")
+        self.s3_stub.add_client_error("put_object", service_error_code="AccessDenied", http_status_code=403)
+        self.other_stub.add_response("put_object", {"ETag": "e"})
+
+        self.router.put_object(Bucket="bucket-a", Key="k", Body=io.BytesIO(b"data"))
+        self.router.copy_object(Bucket="bucket-a", Key="k2", CopySource={"Bucket": "bucket-a", "Key": "k"})
+        self.router.delete_object(Bucket="bucket-a", Key="k")
+        self.router.delete_objects(Bucket="bucket-a", Delete={"Objects": [{"Key": "k2"}]})
+        with self.assertRaises(ClientError):
+            self.router.put_object(Bucket="bucket-a", Key="k", Body=b"data")
+        self.router.put_object(Bucket="bucket-b", Key="k", Body=b"data")
+
+        self.assertTrue(self.router.mirror.flush(timeout=10))
+        stats = self.router.mirror.stats()
+        self.assertEqual((stats["pending"], stats["mirrored"], stats["failed"]), (0, 4, 0))
+
+    def test_multipart_upload(self):
+        self.s3_stub.add_response("create_multipart_upload", {"UploadId": "s3-upload"})
+        self.minio_stub.add_response("create_multipart_upload", {"UploadId": "minio-upload"})
+        for part_number in (1, 2):
+            self.s3_stub.add_response("upload_part", {"ETag": "s3-%d" % part_number})
+            self.minio_stub.add_response("upload_part", {"ETag": "minio-%d" % part_number},
+                                         {"Bucket": "bucket-a", "Key": "k", "UploadId": "minio-upload",
+                                          "PartNumber": part_number, "Body": b"part"})
+        self.s3_stub.add_response("complete_multipart_upload", {})
+        self.minio_stub.add_response("complete_multipart_upload", {}, {
+            "Bucket": "bucket-a", "Key": "k", "UploadId": "minio-upload",
+            "MultipartUpload": {"Parts": [{"PartNumber": 1, "ETag": "minio-1"}, {"PartNumber": 2, "ETag": "minio-2"}]}})
+
+        upload_id = self.router.create_multipart_upload(Bucket="bucket-a", Key="k")["UploadId"]
+        parts = []
+        for part_number in (1, 2):
+            res = self.router.upload_part(Bucket="bucket-a", Key="k", UploadId=upload_id, PartNumber=part_number,
+                                          Body=b"part")
+            parts.append({"PartNumber": part_number, "ETag": res["ETag"]})
+        self.router.complete_multipart_upload(Bucket="bucket-a", Key="k", UploadId=upload_id,
+                                              MultipartUpload={"Parts": parts})
+        self.assertTrue(self.router.mirror.flush(timeout=10))
+        self.assertEqual(self.router.mirror.stats()["mirrored"], 4)
+
+    @mock.patch("boto_s3_router.mirror.MIRROR_RETRY_DELAY", 0)
+    def test_failed_mirror_write(self):
+        self.s3_stub.add_response("delete_object", {})
+        for _ in range(4):
+            self.minio_stub.add_client_error("delete_object", service_error_code="SlowDown", http_status_code=503)
+        self.s3_stub.add_response("delete_object", {})
+        self.minio_stub.add_client_error("delete_object", service_error_code="SlowDown", http_status_code=503)
+        self.minio_stub.add_response("delete_object", {})
+
+        self.router.delete_object(Bucket="bucket-a", Key="k")
+        self.router.delete_object(Bucket="bucket-a", Key="k")
+        self.assertTrue(self.router.mirror.flush(timeout=10))
+        stats = self.router.mirror.stats()
+        self.assertEqual((stats["mirrored"], stats["failed"], stats["retries"]), (1, 1, 4))
+        self.assertEqual(stats["recent_failures"][0]["Error"], "SlowDown")
+
+    def test_invalid_mirror(self):
+        mapping = {"s3": self.s3, "minio": self.minio, "default": self.other}
+        for mirror in ("missing", "s3"):
+            with self.assertRaises(ValueError):
+                boto_s3_router.client(mapping, {"s3": {"source_bucket_pattern": "bucket-a", "mirror": mirror}})
+        with self.assertRaises(ValueError):
+            boto_s3_router.client(mapping, self.profiles, mirror_queue_size=0)
+
+
+class TestMappedMirror(TestMirror):
+    profiles = {"s3": {"source_bucket_pattern": "bucket-a", "mapped_bucket_name": "mapped", "mirror": "minio"},
+                "minio": {"source_bucket_pattern": "bucket-m", "mapped_bucket_name": "mirror-bucket",
+                          "mapped_prefix": "m/"}}
+
+    def test_writes(self):
+        self.add_write_responses(self.s3_stub, "mapped")
+        self.add_write_responses(self.minio_stub, "mirror-bucket", "m/")
+
+        self.router.put_object(Bucket="bucket-a", Key="k", Body=io.BytesIO(b"data"))
+        self.router.copy_object(Bucket="bucket-a", Key="k2", CopySource={"Bucket": "bucket-a", "Key": "k"})
+        self.router.delete_object(Bucket="bucket-a", Key="k")
+        res = self.router.delete_objects(Bucket="bucket-a", Delete={"Objects": [{"Key": "k2"}]})
+        self.assertEqual(res["Deleted"], [{"Key": "k2"}])
+
+        self.assertTrue(self.router.mirror.flush(timeout=10))
+        stats = self.router.mirror.stats()
+        self.assertEqual((stats["pending"], stats["mirrored"], stats["failed"]), (0, 4, 0))
+
+    def test_multipart_upload(self):
+        self.s3_stub.add_response("create_multipart_upload", {"UploadId": "s3-upload"},
+                                  {"Bucket": "mapped", "Key": "k"})
+        self.minio_stub.add_response("create_multipart_upload", {"UploadId": "minio-upload"},
+                                     {"Bucket": "mirror-bucket", "Key": "m/k"})
+        self.s3_stub.add_response("upload_part", {"ETag": "s3-1"})
+        self.minio_stub.add_response("upload_part", {"ETag": "minio-1"},
+                                     {"Bucket": "mirror-bucket", "Key": "m/k", "UploadId": "minio-upload",
+                                      "PartNumber": 1, "Body": b"part"})
+        self.s3_stub.add_response("abort_multipart_upload", {})
+        self.minio_stub.add_response("abort_multipart_upload", {},
+                                     {"Bucket": "mirror-bucket", "Key": "m/k", "UploadId": "minio-upload"})
+
+        upload_id = self.router.create_multipart_upload(Bucket="bucket-a", Key="k")["UploadId"]
+        self.router.upload_part(Bucket="bucket-a", Key="k", UploadId=upload_id, PartNumber=1, Body=b"part")
+        self.router.abort_multipart_upload(Bucket="bucket-a", Key="k", UploadId=upload_id)
+        self.assertTrue(self.router.mirror.flush(timeout=10))
+        self.assertEqual(self.router.mirror.stats()["mirrored"], 3)
+
+    def test_upload_fileobj(self):
+        self.s3_stub.add_response("put_object", {"ETag": '"e"'})
+        # streamed from the uploaded object, as the file object may be closed by then
+        self.s3_stub.add_response("get_object", {"Body": StreamingBody(io.BytesIO(b"data"), 4), "ContentLength": 4,
+                                                 "ContentType": "text/plain", "ETag": '"e"'},
+                                  {"Bucket": "mapped", "Key": "k", "Range": ANY})
+        self.minio_stub.add_response("put_object", {"ETag": '"e"'},
+                                     {"Bucket": "mirror-bucket", "Key": "m/k", "Body": b"data",
+                                      "ContentType": "text/plain"})
+
+        fileobj = io.BytesIO(b"data")
+        self.router.upload_fileobj(Fileobj=fileobj, Bucket="bucket-a", Key="k",
+                                   Config=TransferConfig(use_threads=False))
+        fileobj.close()
+        self.assertTrue(self.router.mirror.flush(timeout=10))
+        self.assertEqual(self.router.mirror.stats()["mirrored"], 1)
+
+    def test_delete_objects_errors(self):
+        self.s3_stub.add_response("delete_objects", {"Deleted": [{"Key": "k1"}],
+                                                     "Errors": [{"Key": "k2", "Code": "AccessDenied"}]},
+                                  {"Bucket": "mapped", "Delete": {"Objects": [{"Key": "k1"}, {"Key": "k2"}]}})
+        self.minio_stub.add_response("delete_objects", {"Deleted": [{"Key": "m/k1"}]},
+                                     {"Bucket": "mirror-bucket", "Delete": {"Objects": [{"Key": "m/k1"}]}})
+        self.s3_stub.add_response("delete_objects", {"Errors": [{"Key": "k3", "Code": "AccessDenied"}]},
+                                  {"Bucket": "mapped", "Delete": {"Objects": [{"Key": "k3"}]}})
+
+        res = self.router.delete_objects(Bucket="bucket-a", Delete={"Objects": [{"Key": "k1"}, {"Key": "k2"}]})
+        self.assertEqual(res["Errors"], [{"Key": "k2", "Code": "AccessDenied"}])
+        self.router.delete_objects(Bucket="bucket-a", Delete={"Objects": [{"Key": "k3"}]})
+        self.assertTrue(self.router.mirror.flush(timeout=10))
+        self.assertEqual(self.router.mirror.stats()["mirrored"], 1)
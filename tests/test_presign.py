@@ -0,0 +1,52 @@
+import re
+import unittest
+
+from botocore.config import Config
+
+import boto_s3_router
+from boto_s3_router.presign import UrlSigner
+from tests.helpers import create_s3_client
+
+_SIGNATURE = re.compile(r"X-Amz-(Date|Signature)=[^&]*")
+
+
+class TestPresign(unittest.TestCase):
+    profiles = {"minio": {"source_bucket_pattern": "bucket-a", "mapped_bucket_name": "minio-bucket",
+                          "mapped_prefix": "main/"}}
+
+    def setUp(self):
+        self.s3 = create_s3_client(config=Config(signature_version="s3v4"))
+        self.minio = create_s3_client(endpoint_url="http://minio:9000", config=Config(signature_version="s3v4"))
+        self.router = boto_s3_router.client({"minio": self.minio, "default": self.s3}, self.profiles)
+
+    def assertSameUrl(self, url, expected):
+        self.assertEqual(_SIGNATURE.sub("", url), _SIGNATURE.sub("", expected))
+        if re.search(r"X-Amz-Date=\w+", url).group() == re.search(r"X-Amz-Date=\w+", expected).group():
+            self.assertEqual(url, expected)
+
+    def test_generate_presigned_url(self):
+        url = self.router.generate_presigned_url("get_object", Params={"Bucket": "bucket-a", "Key": "k"})
+        self.assertTrue(url.startswith("http://minio:9000/minio-bucket/main/k?"))
+        url = self.router.generate_presigned_url(ClientMethod="list_objects_v2",
+                                                 Params={"Bucket": "bucket-a", "Prefix": "p/"}, ExpiresIn=60)
+        self.assertIn("prefix=main%2Fp%2F", url)
+        self.assertIn("X-Amz-Expires=60", url)
+        url = self.router.generate_presigned_url("get_object", Params={"Bucket": "bucket-b", "Key": "k"})
+        self.assertTrue(url.startswith("https://bucket-b.s3.amazonaws.com/k?"))
+
+    def test_generate_presigned_urls(self):
+        params = [{"Bucket": "bucket-a" if i % 2 else "bucket-b", "Key": "dir/key %d+~é" % i} for i in range(10)]
+        params.append({"Bucket": "bucket-a", "Key": "k", "ResponseContentType": "text/plain"})
+        urls = self.router.generate_presigned_urls("get_object", params, ExpiresIn=600)
+        self.assertEqual(len(urls), len(params))
+        for url, call_params in zip(urls, params):
+            self.assertSameUrl(url, self.router.generate_presigned_url("get_object", Params=call_params,
+                                                                       ExpiresIn=600))
+
+    def test_unsupported_signature(self):
+        s3 = create_s3_client(config=Config(signature_version="s3"))
+        url = s3.generate_presigned_url("get_object", Params={"Bucket": "b", "Key": "k"})
+        self.assertIsNone(UrlSigner.from_url(s3, url, "k", "GET"))
+        url = self.s3.generate_presigned_url("get_object", Params={"Bucket": "b", "Key": "k"})
+        self.assertIsNotNone(UrlSigner.from_url(self.s3, url, "k", "GET"))
+        self.assertIsNone(UrlSigner.from_url(self.s3, url, "k", "PUT"))
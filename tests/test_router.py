@@ -0,0 +1,247 @@
+import io
+import threading
+import time
+
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+import boto_s3_router
+from tests.helpers import StubbedClientsTestCase, create_s3_client
+
+
+class TestRouter(StubbedClientsTestCase):
+    profiles = {
+        "minio": {
+            "source_bucket_pattern": "bucket-a",
+            "source_key_pattern": "a/*",
+            "mapped_bucket_name": "minio-bucket",
+            "mapped_prefix": "main/"
+        },
+    }
+
+    def create_router(self, **kwargs):
+        return boto_s3_router.client({"minio": self.minio, "default": self.s3}, self.profiles, **kwargs)
+
+    def test_delete_objects_fan_out(self):
+        router = self.create_router(delete_objects_concurrency=1)
+        minio_keys = ["a/%d" % i for i in range(1500)]
+        self.minio_stub.add_response("delete_objects", {"Deleted": [{"Key": "main/" + k} for k in minio_keys[:1000]]},
+                                     {"Bucket": "minio-bucket",
+                                      "Delete": {"Objects": [{"Key": "main/" + k} for k in minio_keys[:1000]]}})
+        self.minio_stub.add_response("delete_objects", {"Errors": [{"Key": "main/a/1000", "Code": "AccessDenied"}]},
+                                     {"Bucket": "minio-bucket",
+                                      "Delete": {"Objects": [{"Key": "main/" + k} for k in minio_keys[1000:]]}})
+        self.s3_stub.add_response("delete_objects", {"Deleted": [{"Key": "b/1"}]},
+                                  {"Bucket": "bucket-a", "Delete": {"Objects": [{"Key": "b/1"}]}})
+
+        objects = [{"Key": k} for k in minio_keys] + [{"Key": "b/1"}]
+        res = router.delete_objects(Bucket="bucket-a", Delete={"Objects": objects})
+        self.assertEqual(len(res["Deleted"]), 1001)
+        self.assertEqual(res["Deleted"][0]["Key"], "a/0")
+        self.assertEqual(res["Deleted"][-1]["Key"], "b/1")
+        self.assertEqual(res["Errors"], [{"Key": "a/1000", "Code": "AccessDenied"}])
+        self.assertEqual(objects[0], {"Key": "a/0"})
+
+    def test_delete_objects_batch_error(self):
+        router = self.create_router()
+        self.minio_stub.add_client_error("delete_objects", service_error_code="AccessDenied", service_message="no")
+        self.s3_stub.add_response("delete_objects", {"Deleted": [{"Key": "b/1"}]})
+        res = router.delete_objects(Bucket="bucket-a", Delete={"Objects": [{"Key": "a/1"}, {"Key": "b/1"}]})
+        self.assertEqual(res["Deleted"], [{"Key": "b/1"}])
+        self.assertEqual(res["Errors"], [{"Key": "a/1", "Code": "AccessDenied", "Message": "no"}])
+
+    def test_delete_objects_all_batches_fail(self):
+        router = self.create_router()
+        self.minio_stub.add_client_error("delete_objects", service_error_code="AccessDenied")
+        with self.assertRaises(ClientError):
+            router.delete_objects(Bucket="bucket-a", Delete={"Objects": [{"Key": "a/1"}]})
+        self.minio_stub.add_client_error("delete_objects", service_error_code="AccessDenied")
+        self.s3_stub.add_client_error("delete_objects", service_error_code="AccessDenied")
+        with self.assertRaises(ClientError):
+            router.delete_objects(Bucket="bucket-a", Delete={"Objects": [{"Key": "a/1"}, {"Key": "b/1"}]})
+
+    def test_merged_listing(self):
+        router = self.create_router(merged_listing=True)
+        self.minio_stub.add_response("list_objects_v2", {"Contents": [{"Key": "main/a/1"}, {"Key": "main/a/3"}]},
+                                     {"Bucket": "minio-bucket", "Prefix": "main/a/", "MaxKeys": 2})
+        # a/2 is routed to minio, so the copy on s3 isn't listed
+        self.s3_stub.add_response("list_objects_v2", {"Contents": [{"Key": "0"}, {"Key": "a/2"}, {"Key": "b/1"}]},
+                                  {"Bucket": "bucket-a", "Prefix": "", "MaxKeys": 2})
+        pages = list(router.get_paginator(operation_name="list_objects_v2").paginate(
+            Bucket="bucket-a", PaginationConfig={"PageSize": 2}))
+        self.assertEqual([[c["Key"] for c in page["Contents"]] for page in pages], [["0", "a/1"], ["a/3", "b/1"]])
+        self.assertTrue(pages[0]["IsTruncated"])
+        self.assertFalse(pages[1]["IsTruncated"])
+        self.assertEqual(pages[1]["ContinuationToken"], pages[0]["NextContinuationToken"])
+
+        self.minio_stub.add_response("list_objects_v2", {"Contents": [{"Key": "main/a/3"}]},
+                                     {"Bucket": "minio-bucket", "Prefix": "main/a/", "StartAfter": "main/a/1",
+                                      "MaxKeys": 1000})
+        self.s3_stub.add_response("list_objects_v2", {"Contents": [{"Key": "a/2"}, {"Key": "b/1"}]},
+                                  {"Bucket": "bucket-a", "Prefix": "", "StartAfter": "a/1", "MaxKeys": 1000})
+        page = router.list_objects_v2(Bucket="bucket-a", ContinuationToken=pages[0]["NextContinuationToken"])
+        self.assertEqual([c["Key"] for c in page["Contents"]], ["a/3", "b/1"])
+        self.assertEqual(page["KeyCount"], 2)
+
+    def test_merged_listing_single_client(self):
+        router = self.create_router(merged_listing=True)
+        self.minio_stub.add_response("list_objects_v2", {"Contents": [{"Key": "main/a/1"}]},
+                                     {"Bucket": "minio-bucket", "Prefix": "main/a/b"})
+        page = router.list_objects_v2(Bucket="bucket-a", Prefix="a/b")
+        self.assertEqual(page["Contents"], [{"Key": "main/a/1"}])
+
+    def test_list_objects_sharded(self):
+        router = self.create_router()
+        self.s3_stub.add_response("list_objects_v2", {"Contents": [{"Key": "top"}],
+                                                      "CommonPrefixes": [{"Prefix": "a/"}, {"Prefix": "b/"}]},
+                                  {"Bucket": "bucket-a", "Prefix": "", "Delimiter": "/"})
+        self.minio_stub.add_response("list_objects_v2", {"Contents": [{"Key": "main/a/1"}, {"Key": "main/a/2"}]},
+                                     {"Bucket": "minio-bucket", "Prefix": "main/a/"})
+        self.s3_stub.add_response("list_objects_v2", {"Contents": [{"Key": "b/1"}]},
+                                  {"Bucket": "bucket-a", "Prefix": "b/"})
+        objects = router.list_objects_sharded(Bucket="bucket-a", Prefix="", MaxConcurrency=1)
+        self.assertEqual(sorted(o["Key"] for o in objects), ["a/1", "a/2", "b/1", "top"])
+
+    def test_list_objects_sharded_stopped_early(self):
+        router = self.create_router()
+        calls = []
+        stopped = threading.Event()
+
+        def _list(params, **kwargs):
+            calls.append(params["Prefix"])
+            if params["Prefix"] == "c1/":  # hold the worker until the consumer stops
+                stopped.wait(5)
+
+        self.s3.meta.events.register("provide-client-params.s3.ListObjectsV2", _list)
+        self.s3_stub.add_response("list_objects_v2", {"CommonPrefixes": [{"Prefix": "c%d/" % i} for i in range(10)]},
+                                  {"Bucket": "bucket-a", "Prefix": "", "Delimiter": "/"})
+        self.s3_stub.add_response("list_objects_v2", {"Contents": [{"Key": "c0/1"}]},
+                                  {"Bucket": "bucket-a", "Prefix": "c0/"})
+        objects = router.list_objects_sharded(Bucket="bucket-a", Prefix="", MaxConcurrency=1)
+        self.assertEqual(next(objects)["Key"], "c0/1")
+        objects.close()
+        stopped.set()
+        time.sleep(0.2)
+        # the shards queued behind the one that was running are cancelled
+        self.assertEqual(calls[:2], ["", "c0/"])
+        self.assertLessEqual(len(calls), 3)
+
+    def test_metrics(self):
+        router = self.create_router(metrics=True)
+        self.minio_stub.add_response("put_object", {"ETag": "e"},
+                                     {"Bucket": "minio-bucket", "Key": "main/a/1", "Body": b"data"})
+        self.minio_stub.add_response("put_object", {"ETag": "e"})
+        self.s3_stub.add_client_error("head_object", service_error_code="404", http_status_code=404)
+        self.s3_stub.add_response("list_objects_v2", {"Contents": [{"Key": "b/1"}]},
+                                  {"Bucket": "bucket-a", "Prefix": "b/"})
+        router.put_object(Bucket="bucket-a", Key="a/1", Body=b"data")
+        router.put_object(Bucket="bucket-a", Key="a/2", Body=io.BytesIO(b"data"))
+        with self.assertRaises(ClientError):
+            router.head_object(Bucket="bucket-a", Key="b/1")
+        pages = list(router.get_paginator(operation_name="list_objects_v2").paginate(
+            Bucket="bucket-a", Prefix="b/"))
+        self.assertEqual(len(pages), 1)
+
+        snapshot = router.metrics.snapshot()
+        put = snapshot["profiles"]["minio"]["put_object"]
+        self.assertEqual(put["calls"], 2)
+        self.assertEqual(put["bytes_out"], 8)
+        self.assertEqual(put["latency"]["count"], 2)
+        self.assertEqual(snapshot["profiles"]["default"]["head_object"]["errors"], {"404": 1})
+        self.assertEqual(snapshot["profiles"]["default"]["list_objects_v2"]["calls"], 1)
+        self.assertEqual(snapshot["routing"]["count"], 4)
+
+    def test_metrics_full_result(self):
+        router = self.create_router(metrics=True)
+        self.s3_stub.add_response("list_objects_v2", {"Contents": [{"Key": "b/1"}], "IsTruncated": True,
+                                                      "NextContinuationToken": "t"})
+        self.s3_stub.add_response("list_objects_v2", {"Contents": [{"Key": "b/2"}], "IsTruncated": False})
+        self.s3_stub.add_response("list_objects_v2", {"Contents": [{"Key": "b/3"}]})
+        paginator = router.get_paginator(operation_name="list_objects_v2")
+        result = paginator.paginate(Bucket="bucket-a", Prefix="b/").build_full_result()
+        self.assertEqual([c["Key"] for c in result["Contents"]], ["b/1", "b/2"])
+        self.assertEqual(list(paginator.paginate(Bucket="bucket-a", Prefix="b/").search("Contents[].Key")), ["b/3"])
+        self.assertEqual(router.metrics.snapshot()["profiles"]["default"]["list_objects_v2"]["calls"], 3)
+
+    def test_metrics_disabled(self):
+        self.assertIsNone(self.create_router().metrics)
+        with self.assertRaises(TypeError):
+            self.create_router(metrics="yes")
+
+    def test_router_class_is_cached(self):
+        router = self.create_router()
+        other = boto_s3_router.client({"default": self.minio}, {})
+        self.assertIs(type(router), type(other))
+        self.assertIs(router.meta, self.s3.meta)
+        self.assertIs(other.meta, self.minio.meta)
+        self.assertIn("put_object", dir(router))
+        self.assertEqual(router.head_bucket.__name__, "head_bucket")
+        self.assertIn("head_bucket", vars(type(router)))
+        with self.assertRaises(AttributeError):
+            router.not_a_client_method
+
+    def test_batch(self):
+        router = self.create_router(batch_concurrency=1)
+        for i in range(3):
+            self.minio_stub.add_response("head_object", {"ContentLength": i},
+                                         {"Bucket": "minio-bucket", "Key": "main/a/%d" % i})
+        self.s3_stub.add_response("head_object", {"ContentLength": 10}, {"Bucket": "bucket-a", "Key": "b/1"})
+        self.s3_stub.add_client_error("get_object", service_error_code="NoSuchKey")
+        requests = [("head_object", {"Bucket": "bucket-a", "Key": "a/0"}),
+                    ("head_object", {"Bucket": "bucket-a", "Key": "b/1"}),
+                    ("get_object", {"Bucket": "bucket-a", "Key": "b/2"})]
+        results = list(router.batch(requests, return_exceptions=True))
+        self.assertEqual(results[0]["ContentLength"], 0)
+        self.assertEqual(results[1]["ContentLength"], 10)
+        self.assertIsInstance(results[2], ClientError)
+
+        results = router.map("head_object", ({"Bucket": "bucket-a", "Key": "a/%d" % i} for i in (1, 2)))
+        self.assertEqual([r["ContentLength"] for r in results], [1, 2])
+
+    def test_batch_raises(self):
+        router = self.create_router()
+        self.s3_stub.add_client_error("head_object", service_error_code="404", http_status_code=404)
+        with self.assertRaises(ClientError):
+            list(router.map("head_object", [{"Bucket": "bucket-a", "Key": "b/1"}]))
+        with self.assertRaises(ValueError):
+            self.create_router(batch_concurrency={"minio": 0})
+
+    def test_reconfigure(self):
+        router = self.create_router()
+        paginator = router.get_paginator(operation_name="list_objects_v2")
+        other = create_s3_client()
+        other_stub = Stubber(other)
+        other_stub.activate()
+        router.reconfigure({"other": {"source_bucket_pattern": "bucket-a"}}, {"other": other})
+
+        other_stub.add_response("head_object", {"ContentLength": 1}, {"Bucket": "bucket-a", "Key": "a/1"})
+        self.assertEqual(router.head_object(Bucket="bucket-a", Key="a/1")["ContentLength"], 1)
+        # the paginator keeps the rules it was created with
+        self.minio_stub.add_response("list_objects_v2", {}, {"Bucket": "minio-bucket", "Prefix": "main/a/"})
+        list(paginator.paginate(Bucket="bucket-a", Prefix="a/"))
+
+        with self.assertRaises(ValueError):
+            router.reconfigure({"missing": {"source_bucket_pattern": "bucket-b"}})
+        other_stub.add_response("head_object", {"ContentLength": 2}, {"Bucket": "bucket-a", "Key": "a/2"})
+        self.assertEqual(router.head_object(Bucket="bucket-a", Key="a/2")["ContentLength"], 2)
+        other_stub.assert_no_pending_responses()
+
+    def test_transfer_config(self):
+        profiles = {"minio": dict(self.profiles["minio"],
+                                  transfer_config={"multipart_threshold": 1, "use_threads": False})}
+        router = boto_s3_router.client({"minio": self.minio, "default": self.s3}, profiles, metrics=True,
+                                       default_transfer_config={"use_threads": False})
+        # the minio threshold makes even a small upload a multipart upload
+        self.minio_stub.add_response("create_multipart_upload", {"UploadId": "u"})
+        self.minio_stub.add_response("upload_part", {"ETag": "e"})
+        self.minio_stub.add_response("complete_multipart_upload", {"ETag": "e"})
+        self.s3_stub.add_response("put_object", {"ETag": "e"})
+        router.upload_fileobj(Fileobj=io.BytesIO(b"data"), Bucket="bucket-a", Key="a/1")
+        router.upload_fileobj(Fileobj=io.BytesIO(b"data"), Bucket="bucket-a", Key="b/1")
+
+        profiles = router.metrics.snapshot()["profiles"]
+        self.assertEqual(profiles["minio"]["upload_fileobj"]["throughput"]["count"], 1)
+        self.assertEqual(profiles["default"]["upload_fileobj"]["calls"], 1)
+        with self.assertRaises(ValueError):
+            boto_s3_router.client({"minio": self.minio, "default": self.s3},
+                                  {"minio": dict(self.profiles["minio"], transfer_config={"part_size": 1})})
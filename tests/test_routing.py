@@ -0,0 +1,107 @@
+import fnmatch
+import unittest
+
+from boto_s3_router.routing import RoutingIndex
+
+
+def linear_lookup(config, bucket, key=None, has_key=False):
+    for profile in config:
+        mapping = config[profile]
+        if fnmatch.fnmatch(bucket, mapping["source_bucket_pattern"]):
+            if has_key and "source_key_pattern" in mapping:
+                if not fnmatch.fnmatch(key, mapping["source_key_pattern"]):
+                    continue
+            return profile
+    return None
+
+
+class TestRoutingIndex(unittest.TestCase):
+    config = {
+        "exact_prefix": {"source_bucket_pattern": "bucket-a", "source_key_pattern": "a/*"},
+        "exact_nested_prefix": {"source_bucket_pattern": "bucket-a", "source_key_pattern": "a/b/*"},
+        "exact_key": {"source_bucket_pattern": "bucket-a", "source_key_pattern": "b/obj"},
+        "exact_regex_key": {"source_bucket_pattern": "bucket-a", "source_key_pattern": "c/*/d?"},
+        "exact_any": {"source_bucket_pattern": "bucket-a"},
+        "wildcard_prefix": {"source_bucket_pattern": "bucket-*", "source_key_pattern": "w/*"},
+        "wildcard_any": {"source_bucket_pattern": "bucket-[bc]"},
+        "wildcard_star": {"source_bucket_pattern": "*", "source_key_pattern": "*/star"},
+        "late_exact": {"source_bucket_pattern": "bucket-b", "source_key_pattern": "x/*"},
+    }
+
+    def assertSameRoute(self, index, bucket, key=None, has_key=False):
+        route = index.lookup(bucket, key, has_key)
+        expected = linear_lookup(self.config, bucket, key, has_key)
+        self.assertEqual(route.profile if route is not None else None, expected, (bucket, key, has_key))
+
+    def test_first_match_wins(self):
+        index = RoutingIndex(self.config)
+        buckets = ["bucket-a", "bucket-b", "bucket-c", "bucket-d", "other", ""]
+        keys = ["a/1", "a/b/1", "b/obj", "b/obj2", "c/x/d1", "c/x/dd", "w/1", "x/1", "q/star", "", "a"]
+        for bucket in buckets:
+            self.assertSameRoute(index, bucket)
+            for key in keys:
+                self.assertSameRoute(index, bucket, key, has_key=True)
+
+    def test_cached_first_match_wins(self):
+        index = RoutingIndex(self.config, cache_size=8)
+        buckets = ["bucket-a", "bucket-b", "bucket-c", "bucket-d", "other", ""]
+        keys = ["a/1", "a/b/1", "b/obj", "c/x/d1", "w/1", "x/1", "q/star", ""]
+        for _ in range(2):
+            for bucket in buckets:
+                self.assertSameRoute(index, bucket)
+                for key in keys:
+                    self.assertSameRoute(index, bucket, key, has_key=True)
+        self.assertEqual(len(index.cache), 8)
+        self.assertGreater(index.cache.evictions, 0)
+
+    def test_cache_stats(self):
+        index = RoutingIndex({"keyed": {"source_bucket_pattern": "bucket-a", "source_key_pattern": "a/*"},
+                              "any": {"source_bucket_pattern": "bucket-*"}}, cache_size=16)
+        # bucket-b is routed regardless of the key, so a single decision covers every key
+        index.lookup("bucket-b", "1", True)
+        index.lookup("bucket-b", "2", True)
+        # bucket-a is routed by the "a/" prefix, so keys sharing it share a decision
+        index.lookup("bucket-a", "a/1", True)
+        index.lookup("bucket-a", "a/2", True)
+        index.lookup("bucket-a", "a/1", True)
+        self.assertEqual(index.cache.stats(), {"hits": 3, "misses": 2, "evictions": 0, "size": 3, "maxsize": 16,
+                                               "hit_rate": 0.6})
+
+    def test_cache_unique_keys(self):
+        self.config = {"keyed%d" % i: {"source_bucket_pattern": "bucket-a", "source_key_pattern": "data/%d/*" % i}
+                       for i in range(100)}
+        self.config["literal"] = {"source_bucket_pattern": "bucket-b", "source_key_pattern": "b/obj"}
+        index = RoutingIndex(self.config, cache_size=256)
+        for i in range(1000):
+            self.assertSameRoute(index, "bucket-a", "data/%d/obj-%d" % (i % 120, i), has_key=True)
+        self.assertEqual(index.cache.stats()["misses"], 120)
+        self.assertEqual(index.cache.evictions, 0)
+        # decisions of literal keys would take an entry per key, so they aren't cached
+        for i in range(100):
+            self.assertSameRoute(index, "bucket-b", "b/obj%d" % i, has_key=True)
+            self.assertSameRoute(index, "bucket-b", "b/obj", has_key=True)
+        self.assertEqual(len(index.cache), 2 + 120)
+
+    def test_list_routes(self):
+        index = RoutingIndex(self.config)
+        profiles = lambda bucket, prefix: [r.profile if r else None for r in index.list_routes(bucket, prefix)]
+        self.assertEqual(profiles("bucket-a", "a/b/"), ["exact_prefix"])
+        self.assertEqual(profiles("bucket-a", "a"), ["exact_prefix", "exact_nested_prefix", "exact_any"])
+        self.assertEqual(profiles("bucket-a", "c/"), ["exact_regex_key", "exact_any"])
+        self.assertEqual(profiles("bucket-d", "w"), ["wildcard_prefix", "wildcard_star", None])
+        self.assertEqual(profiles("bucket-b", ""), ["wildcard_prefix", "wildcard_any"])
+
+    def test_empty_config(self):
+        index = RoutingIndex({})
+        self.assertIsNone(index.lookup("bucket", "key", True))
+
+    def test_many_profiles(self):
+        self.config = {}
+        for i in range(300):
+            self.config["p%d" % i] = {"source_bucket_pattern": "bucket-%d" % (i % 50), "source_key_pattern": "%d/*" % i}
+        for i in range(20):
+            self.config["w%d" % i] = {"source_bucket_pattern": "bucket-%d*" % i}
+        index = RoutingIndex(self.config)
+        for b in range(60):
+            for k in range(0, 300, 7):
+                self.assertSameRoute(index, "bucket-%d" % b, "%d/obj" % k, has_key=True)
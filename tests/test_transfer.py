@@ -0,0 +1,81 @@
+import io
+
+from boto3.s3.transfer import TransferConfig
+from botocore.response import StreamingBody
+from botocore.stub import ANY
+
+import boto_s3_router
+from boto_s3_router.transfer import StreamingCopy
+from tests.helpers import StubbedClientsTestCase
+
+
+def body(data):
+    return StreamingBody(io.BytesIO(data), len(data))
+
+
+class TestStreamingCopy(StubbedClientsTestCase):
+    clients = ("source", "dest")
+
+    def setUp(self):
+        super(TestStreamingCopy, self).setUp()
+        self.config = TransferConfig(multipart_threshold=4, multipart_chunksize=4, max_concurrency=1)
+
+    def test_single_part(self):
+        self.source_stub.add_response("get_object", {"Body": body(b"abc"), "ContentRange": "bytes 0-2/3",
+                                                     "ContentType": "text/plain", "ETag": '"e"'},
+                                      {"Bucket": "src", "Key": "a", "Range": "bytes=0-3"})
+        self.dest_stub.add_response("put_object", {"ETag": '"e"'},
+                                    {"Bucket": "dst", "Key": "b", "Body": b"abc", "ContentType": "text/plain"})
+        res = StreamingCopy(self.source, self.dest, self.config).copy({"Bucket": "src", "Key": "a"}, "dst", "b")
+        self.assertEqual(res["CopyObjectResult"]["ETag"], '"e"')
+
+    def test_multipart(self):
+        transferred = []
+        self.source_stub.add_response("get_object", {"Body": body(b"0123"), "ContentRange": "bytes 0-3/10",
+                                                     "ETag": '"src"'},
+                                      {"Bucket": "src", "Key": "a", "Range": "bytes=0-3"})
+        self.source_stub.add_response("get_object", {"Body": body(b"4567")},
+                                      {"Bucket": "src", "Key": "a", "Range": "bytes=4-7", "IfMatch": '"src"'})
+        self.source_stub.add_response("get_object", {"Body": body(b"89")},
+                                      {"Bucket": "src", "Key": "a", "Range": "bytes=8-9", "IfMatch": '"src"'})
+        self.dest_stub.add_response("create_multipart_upload", {"UploadId": "u"},
+                                    {"Bucket": "dst", "Key": "b", "Metadata": {"m": "1"}})
+        for number, data in enumerate([b"0123", b"4567", b"89"], 1):
+            self.dest_stub.add_response("upload_part", {"ETag": '"p%d"' % number},
+                                        {"Bucket": "dst", "Key": "b", "UploadId": "u", "PartNumber": number,
+                                         "Body": data})
+        self.dest_stub.add_response("complete_multipart_upload", {"ETag": '"mpu"'},
+                                    {"Bucket": "dst", "Key": "b", "UploadId": "u", "MultipartUpload": {"Parts": [
+                                        {"PartNumber": 1, "ETag": '"p1"'}, {"PartNumber": 2, "ETag": '"p2"'},
+                                        {"PartNumber": 3, "ETag": '"p3"'}]}})
+        copier = StreamingCopy(self.source, self.dest, self.config, callback=transferred.append)
+        res = copier.copy({"Bucket": "src", "Key": "a"}, "dst", "b",
+                          {"MetadataDirective": "REPLACE", "Metadata": {"m": "1"}})
+        self.assertEqual(res["CopyObjectResult"]["ETag"], '"mpu"')
+        self.assertEqual(sum(transferred), 10)
+
+    def test_abort_on_failure(self):
+        self.source_stub.add_response("get_object", {"Body": body(b"0123"), "ContentRange": "bytes 0-3/6",
+                                                     "ETag": '"src"'},
+                                      {"Bucket": "src", "Key": "a", "Range": "bytes=0-3"})
+        self.source_stub.add_client_error("get_object", service_error_code="PreconditionFailed", http_status_code=412)
+        self.dest_stub.add_response("create_multipart_upload", {"UploadId": "u"}, {"Bucket": "dst", "Key": "b"})
+        self.dest_stub.add_response("upload_part", {"ETag": '"p1"'}, None)
+        self.dest_stub.add_response("abort_multipart_upload", {}, {"Bucket": "dst", "Key": "b", "UploadId": "u"})
+        with self.assertRaises(Exception):
+            StreamingCopy(self.source, self.dest, self.config).copy({"Bucket": "src", "Key": "a"}, "dst", "b")
+
+    def test_router_copy_object(self):
+        router = boto_s3_router.client({"src": self.source, "default": self.dest},
+                                       {"src": {"source_bucket_pattern": "src"}},
+                                       cross_client_copy=True, copy_config=self.config)
+        self.source_stub.add_response("get_object", {"Body": body(b"abc"), "ContentRange": "bytes 0-2/3"},
+                                      {"Bucket": "src", "Key": "a", "Range": "bytes=0-3"})
+        self.dest_stub.add_response("put_object", {"ETag": '"e"'}, {"Bucket": "dst", "Key": "b", "Body": ANY})
+        router.copy_object(CopySource={"Bucket": "src", "Key": "a"}, Bucket="dst", Key="b")
+
+    def test_router_copy_object_disabled(self):
+        router = boto_s3_router.client({"src": self.source, "default": self.dest},
+                                       {"src": {"source_bucket_pattern": "src"}})
+        with self.assertRaises(ValueError):
+            router.copy_object(CopySource={"Bucket": "src", "Key": "a"}, Bucket="dst", Key="b")